@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding import get_query_vector
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1024))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 6 * 60 * 60))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.97))
+# The semantic tier costs one query embedding per miss.
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+
+
+def normalize_query(query_text):
+    # Case, punctuation and spacing never change what is being asked.
+    text = re.sub(r"[^\w\s$]", " ", query_text.lower())
+    return " ".join(text.split())
+
+
+def get_query_scope(query_text, restaurant_index=None):
+    """
+    What a question is about: the `where` filter for the restaurants,
+    cuisines and neighborhoods it names, and its menu types. "Bobo lunch
+    price" and "Bobo dinner price" embed almost identically but differ here.
+    """
+    # Imported here: coalesce imports this module and must stay cheap.
+    from menu_facts import MENU_TYPE_PATTERN
+
+    where = restaurant_index.get_filter(query_text) if restaurant_index is not None else None
+    menu_types = sorted({menu_type.lower() for menu_type in MENU_TYPE_PATTERN.findall(query_text)})
+    return json.dumps(where, sort_keys=True), tuple(menu_types)
+
+
+class AnswerCache:
+    """
+    Two-tier cache of RAG answers.
+
+    Tier one matches the normalized query text exactly. Tier two, enabled when
+    `embeddings` is given, embeds the query and returns the closest cached
+    answer whose cosine similarity is at least `similarity_threshold` and
+    whose question has the same `get_query_scope`, using `restaurant_index`
+    when given.
+    Entries expire after `ttl_seconds` and the least recently used entry is
+    evicted once `max_entries` is reached.
+    """
+
+    def __init__(
+        self,
+        embeddings=None,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        similarity_threshold=ANSWER_CACHE_SIMILARITY,
+        restaurant_index=None,
+    ):
+        self.embeddings = embeddings
+        self.restaurant_index = restaurant_index
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        # Query embeddings computed on a miss, waiting for the matching `put`.
+        self._pending_vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def _is_expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry["created"] > self.ttl_seconds
+
+    def _purge_expired(self, now):
+        expired = [
+            key for key, entry in self._entries.items() if self._is_expired(entry, now)
+        ]
+        for key in expired:
+            del self._entries[key]
+        self.stats["expirations"] += len(expired)
+
+    def _embed(self, query_text):
+        vector = np.asarray(get_query_vector(self.embeddings, query_text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _find_similar(self, vector, scope):
+        keys = [
+            key
+            for key, entry in self._entries.items()
+            if entry["vector"] is not None and entry["scope"] == scope
+        ]
+        if not keys:
+            return None, 0.0
+        matrix = np.stack([self._entries[key]["vector"] for key in keys])
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
+
+    def get(self, query_text):
+        """Return the cached result for `query_text`, or None on a miss."""
+        key = normalize_query(query_text)
+        now = time.time()
+
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["result"]
+
+        if self.embeddings is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        # Embed outside the lock; this may be a network call.
+        vector = self._embed(query_text)
+        scope = get_query_scope(query_text, self.restaurant_index)
+        with self._lock:
+            similar_key, score = self._find_similar(vector, scope)
+            if similar_key is not None and score >= self.similarity_threshold:
+                self._entries.move_to_end(similar_key)
+                self.stats["semantic_hits"] += 1
+                return self._entries[similar_key]["result"]
+            self.stats["misses"] += 1
+            self._pending_vectors[key] = vector
+            while len(self._pending_vectors) > self.max_entries:
+                self._pending_vectors.popitem(last=False)
+        return None
+
+    def pending_vector(self, query_text):
+        """The embedding a missed `get` computed for `query_text`, or None."""
+        with self._lock:
+            return self._pending_vectors.get(normalize_query(query_text))
+
+    def put(self, query_text, result):
+        """Cache `result` (a dict with `answer` and `context`) for `query_text`."""
+        key = normalize_query(query_text)
+        with self._lock:
+            # Reuse the embedding computed by the miss in `get`, if there was one.
+            vector = self._pending_vectors.pop(key, None)
+        scope = None
+        if self.embeddings is not None:
+            if vector is None:
+                vector = self._embed(query_text)
+            scope = get_query_scope(query_text, self.restaurant_index)
+
+        entry = {
+            "result": {
+                "question": result.get("question", query_text),
+                "context": list(result.get("context") or []),
+                "answer": result.get("answer"),
+            },
+            "vector": vector,
+            "scope": scope,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending_vectors.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            lookups = hits + self.stats["misses"]
+            return dict(
+                self.stats,
+                entries=len(self._entries),
+                hit_rate=hits / lookups if lookups else 0.0,
+            )
@@ -1,15 +1,44 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import os
+import asyncio
+from typing import List
 from mangum import Mangum
 from models import QueryRequest, QueryResult
-from myrag import query_rag
-import boto3, json
+from myrag import aquery_rag, stream_rag, warm_up, get_metrics, expand_sources as expand_query_sources
+from executor import run_blocking
+from storage import get_client
+from notify import get_notifier
+from tracing import flatten_metrics, registry, span, start_trace, trace_iterator
+import json
 
 # Initialize FastAPI app
 app = FastAPI()
 
 # In-memory storage for queries and results
 IS_WORKER_LAMBDA_AVAILABLE = os.environ.get("IS_WORKER_LAMBDA_AVAILABLE", None)
+# IS_WORKER_LAMBDA_AVAILABLE=local hands queries to an in-process worker
+# queue instead of invoking the worker Lambda.
+LOCAL_WORKER = "local"
+# Most questions a single POST /submit_queries accepts.
+SUBMIT_QUERIES_MAX_BATCH = int(os.environ.get("SUBMIT_QUERIES_MAX_BATCH", 100))
+# Cap on GET /get_query?wait=, under API Gateway's 29 second limit.
+GET_QUERY_MAX_WAIT_SECONDS = float(os.environ.get("GET_QUERY_MAX_WAIT_SECONDS", 20))
+# A waiting request re-reads the table this often when the notify backend
+# cannot reach the worker (the memory backend with the worker Lambda).
+GET_QUERY_POLL_SECONDS = float(os.environ.get("GET_QUERY_POLL_SECONDS", 2))
+
+_submission_linker = None
+
+
+def get_submission_linker():
+    # Imported on first use: coalescing pulls in numpy, which GET / never needs.
+    global _submission_linker
+    if _submission_linker is None:
+        from coalesce import SubmissionLinker
+
+        _submission_linker = SubmissionLinker()
+    return _submission_linker
 
 
 @app.get("/")
@@ -20,56 +49,239 @@ def index():
 
 
 def invoke_worker_lambda_func(query: QueryResult):
-    # Initialize the Lambda client
-    lambda_client = boto3.client("lambda")
-
     # Get the QueryResult as a dictionary.
-    print(type(query))
     payload = query.to_dict()
 
-    # Invoke another Lambda function asynchronously
-    response = lambda_client.invoke(
-        FunctionName=IS_WORKER_LAMBDA_AVAILABLE,
-        InvocationType="Event",
-        Payload=json.dumps(payload),
-    )
+    try:
+        if IS_WORKER_LAMBDA_AVAILABLE == LOCAL_WORKER:
+            from worker import get_local_queue
+
+            get_local_queue().submit(payload)
+            return
+
+        # Pooled, process-wide client: no new session or connection per query.
+        lambda_client = get_client("lambda")
+
+        # Invoke another Lambda function asynchronously
+        response = lambda_client.invoke(
+            FunctionName=IS_WORKER_LAMBDA_AVAILABLE,
+            InvocationType="Event",
+            Payload=json.dumps(payload),
+        )
+    except Exception:
+        # No worker will complete this query_id; repeats must not link to it.
+        get_submission_linker().unlink(query)
+        raise
 
     print(f"✅ Worker Lambda invoked: {response}")
 
 
+def invoke_worker_lambda_batch(queries: List[QueryResult]):
+    # One invocation for the whole batch; the worker accepts {"queries": [...]}.
+    payloads = [query.to_dict() for query in queries]
+
+    try:
+        if IS_WORKER_LAMBDA_AVAILABLE == LOCAL_WORKER:
+            from worker import get_local_queue
+
+            for payload in payloads:
+                get_local_queue().submit(payload)
+            return
+
+        response = get_client("lambda").invoke(
+            FunctionName=IS_WORKER_LAMBDA_AVAILABLE,
+            InvocationType="Event",
+            Payload=json.dumps({"queries": payloads}),
+        )
+    except Exception:
+        for query in queries:
+            get_submission_linker().unlink(query)
+        raise
+
+    print(f"✅ Worker Lambda invoked for {len(payloads)} queries: {response}")
+
+
+
+async def expand(qr, expand_sources):
+    # Results store chunk references; the chunk text is only looked up (and
+    # sent) when the client asks for ?expand_sources=true.
+    if qr is None or not expand_sources or not qr.source_refs:
+        return qr
+    return await run_blocking(expand_query_sources, qr)
+
 
 # Endpoint to submit a query
 @app.post("/submit_query", response_model=QueryResult)
-async def submit_query(request: QueryRequest):
+async def submit_query(
+    request: QueryRequest, expand_sources: bool = False, debug: bool = False
+):
     query_text = request.query_text
 
     qr = QueryResult(query_text=query_text)
 
+    with start_trace("submit_query") as trace:
+        # boto3 and Chroma are blocking: they run on the bounded executor so one
+        # slow query never stalls the other requests on this worker.
+        if IS_WORKER_LAMBDA_AVAILABLE:
+            # A question already queued in the last few seconds shares that
+            # query_id instead of starting another worker run.
+            linked = get_submission_linker().link(qr)
+            if linked is not qr:
+                qr = linked
+            else:
+                await run_blocking(qr.put_item_into_table)
+                with span("invoke_worker"):
+                    await run_blocking(invoke_worker_lambda_func, qr)
+        
+        else:
 
+            # Process the query, wait for the result
+            answer = await aquery_rag(query_text)
 
-    if IS_WORKER_LAMBDA_AVAILABLE:
-        qr.put_item_into_table()
-        invoke_worker_lambda_func(qr)
-    
-    else:
+            qr.answer_text = answer.get("answer")
+            qr.set_sources(answer.get("context"))
+            qr.is_complete = True
 
-        # Process the query, wait for the result
-        answer = query_rag(query_text)
+            await run_blocking(qr.put_item_into_table)
 
-        qr.answer_text = answer.get("answer")
-        qr.sources = [x.page_content for x in answer.get("context") if x.page_content]
-        qr.is_complete = True
+        qr = await expand(qr, expand_sources)
+        if debug and trace is not None:
+            qr.debug = trace.to_dict()
+    return qr
+
+
+
+# Endpoint to submit many queries at once
+@app.post("/submit_queries", response_model=List[QueryResult])
+async def submit_queries(requests: List[QueryRequest], expand_sources: bool = False):
+    if len(requests) > SUBMIT_QUERIES_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {SUBMIT_QUERIES_MAX_BATCH} queries per request",
+        )
+
+    results = [QueryResult(query_text=request.query_text) for request in requests]
 
+    with start_trace("submit_queries"):
+        if IS_WORKER_LAMBDA_AVAILABLE:
+            # Questions queued in the last few seconds (or repeated within this
+            # batch) share the earlier query_id instead of another worker run.
+            linker = get_submission_linker()
+            linked = [linker.link(qr) for qr in results]
+            new = [qr for qr, link in zip(results, linked) if link is qr]
+            results = linked
+            if new:
+                await run_blocking(QueryResult.batch_put, new)
+                with span("invoke_worker"):
+                    await run_blocking(invoke_worker_lambda_batch, new)
+
+        else:
+            from worker import process_batch
+
+            # One embeddings call, then retrieval and LLM calls through
+            # `abatch` with bounded concurrency and one batched write.
+            await process_batch(results, check_stored=False)
+
+            # Failed questions are stored unanswered so their query_id resolves.
+            failed = [qr for qr in results if not qr.is_complete]
+            if failed:
+                await run_blocking(QueryResult.batch_put, failed)
+
+        results = [await expand(qr, expand_sources) for qr in results]
+    return results
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# Endpoint to stream the sources, then the answer tokens, as Server-Sent Events
+@app.post("/stream_query")
+async def stream_query(request: QueryRequest):
+    qr = QueryResult(query_text=request.query_text)
+
+    # A sync generator: Starlette iterates it in a worker thread, so the
+    # blocking retrieval and LLM calls never stall the event loop.
+    def event_stream():
+        yield format_sse("query", {"query_id": qr.query_id})
+
+        answer = ""
+        try:
+            for event, data in stream_rag(qr.query_text):
+                if event == "sources":
+                    # The live stream shows the text; the stored result keeps references.
+                    qr.set_sources(data)
+                    sources = [x.page_content for x in data if x.page_content]
+                    yield format_sse("sources", {"sources": sources})
+                else:
+                    answer += data
+                    yield format_sse("token", {"text": data})
+        except Exception as e:
+            print(f"Failed to stream query {qr.query_id}: {e}")
+            yield format_sse("error", {"detail": str(e)})
+            return
+
+        qr.answer_text = answer
+        qr.is_complete = True
         qr.put_item_into_table()
-    return qr
+        yield format_sse("done", qr.to_dict())
 
+    return StreamingResponse(
+        trace_iterator(event_stream(), "stream_query"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def metrics(format: str = "prometheus"):
+    # Stage latency histograms and event counters, plus the caches' own gauges.
+    result = get_metrics()
+    if _submission_linker is not None:
+        result["worker_linking"] = _submission_linker.metrics()
+    result["notify"] = get_notifier().metrics()
+    if format == "json":
+        return result
+    return PlainTextResponse(
+        registry.render(flatten_metrics(result)),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+async def wait_for_completion(query_id, wait):
+    notifier = get_notifier()
+    poll_seconds = wait
+    if IS_WORKER_LAMBDA_AVAILABLE != LOCAL_WORKER and not notifier.cross_process:
+        poll_seconds = GET_QUERY_POLL_SECONDS
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    async with notifier.subscribe(query_id) as subscription:
+        # Subscribed before the read, so a completion in between is not missed.
+        query = await run_blocking(QueryResult.get_item_from_table, query_id)
+        while query is not None and not query.is_complete:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            item = await subscription.get(min(remaining, poll_seconds))
+            if item is not None:
+                query = QueryResult(**item)
+            else:
+                query = await run_blocking(QueryResult.get_item_from_table, query_id)
+    return query
 
 
 # Endpoint to retrieve query results
 @app.get("/get_query/{query_id}", response_model=QueryResult)
-async def get_query(query_id: str):
-    query = QueryResult.get_item_from_table(query_id)
-    return query
+async def get_query(query_id: str, expand_sources: bool = False, wait: float = 0):
+    # ?wait=N holds the request until the query completes or N seconds pass,
+    # instead of the client polling (one table read per poll).
+    wait = min(max(wait, 0.0), GET_QUERY_MAX_WAIT_SECONDS)
+    if wait:
+        query = await wait_for_completion(query_id, wait)
+    else:
+        query = await run_blocking(QueryResult.get_item_from_table, query_id)
+    return await expand(query, expand_sources)
 
 # Placeholder function to process the query
 def process_query(query):
@@ -77,7 +289,16 @@ def process_query(query):
     return f"Processed result for query: {query}"
 
 # Use Mangum to make the FastAPI app compatible with AWS Lambda
-handler = Mangum(app)
+mangum_handler = Mangum(app)
+
+
+def handler(event, context):
+    # A scheduled ping ({"warm_up": true}) builds the RAG stack before real
+    # traffic arrives; GET / and /get_query (unless expanding sources) never need it.
+    if isinstance(event, dict) and event.get("warm_up"):
+        warm_up()
+        return {"warmed_up": True}
+    return mangum_handler(event, context)
 
 # Run the FastAPI app with Uvicorn (for local testing)
 if __name__ == "__main__":
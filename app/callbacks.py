@@ -0,0 +1,68 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from tracing import get_current_trace
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Times the top-level retriever and every LLM call of a chain run into the
+    current trace, and counts the LLM's prompt and completion tokens.
+    """
+
+    # Run in the caller's context (and so see its trace), not in an executor.
+    run_inline = True
+
+    def __init__(self):
+        self._starts = {}
+
+    def _start(self, run_id, name, parent_run_id):
+        trace = get_current_trace()
+        if trace is None:
+            return
+        # A retriever wrapping another one (reranking) is timed once.
+        if parent_run_id in self._starts and self._starts[parent_run_id][1] == name:
+            return
+        self._starts[run_id] = (trace, name, time.perf_counter())
+
+    def _end(self, run_id):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            trace, name, start = started
+            trace.add_span(name, time.perf_counter() - start)
+        return started
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "retrieval", parent_run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        started = self._end(run_id)
+        if started is not None:
+            started[0].incr("retrieved_chunks", len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", parent_run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, "llm", parent_run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._end(run_id)
+        if started is None:
+            return
+        trace = started[0]
+        trace.incr("llm_calls")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for key, name in (
+            ("prompt_tokens", "prompt_tokens"),
+            ("completion_tokens", "completion_tokens"),
+        ):
+            if usage.get(key):
+                trace.incr(name, usage[key])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id)
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import threading
+
+from answer_cache import normalize_query
+from tracing import incr
+
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+# In worker mode a repeated question is linked to the earlier query_id for
+# this long; after that it gets its own query and worker run.
+COALESCE_LINK_TTL_SECONDS = float(os.getenv("COALESCE_LINK_TTL_SECONDS", 30))
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same normalized query into one.
+
+    The first caller (the leader) runs the work; callers arriving while it is
+    in flight await the same future. Nothing is kept once the call finishes,
+    so unlike the answer cache a result is never served after the fact.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    async def do(self, query_text, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Futures belong to one event loop; the local worker runs its own.
+        key = (id(loop), normalize_query(query_text))
+
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._calls[key] = future
+                self.stats["leaders"] += 1
+                is_leader = True
+            else:
+                self.stats["coalesced"] += 1
+                is_leader = False
+
+        if not is_leader:
+            incr("coalesced")
+            # shield: a follower giving up must not cancel the leader's result.
+            return await asyncio.shield(future)
+
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Marks the exception as retrieved when no follower was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def metrics(self):
+        with self._lock:
+            calls = self.stats["leaders"] + self.stats["coalesced"]
+            return {
+                **self.stats,
+                "in_flight": len(self._calls),
+                "coalesced_rate": self.stats["coalesced"] / calls if calls else 0.0,
+            }
+
+
+class SubmissionLinker:
+    """
+    Worker-mode counterpart of `SingleFlight`.
+
+    The API only enqueues work there, so a repeated question submitted within
+    `ttl_seconds` is handed a copy of the first submission's QueryResult (and
+    so its query_id) instead of invoking the worker again. Copies keep one
+    caller's expanded sources or debug trace from reaching another.
+    """
+
+    def __init__(self, ttl_seconds=COALESCE_LINK_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._submissions = {}
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "linked": 0}
+
+    def link(self, query_result):
+        """Return the earlier in-flight QueryResult for this question, or register this one."""
+        key = normalize_query(query_result.query_text)
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                k for k, (created, _) in self._submissions.items()
+                if now - created > self.ttl_seconds
+            ]
+            for k in expired:
+                del self._submissions[k]
+
+            if key in self._submissions:
+                self.stats["linked"] += 1
+                return self._submissions[key][1].copy(deep=True, update={"debug": None})
+
+            self._submissions[key] = (now, query_result.copy(deep=True))
+            self.stats["submitted"] += 1
+            return query_result
+
+    def unlink(self, query_result):
+        """Forget `query_result`'s submission, e.g. when its worker never got it."""
+        key = normalize_query(query_result.query_text)
+        with self._lock:
+            submission = self._submissions.get(key)
+            if submission is not None and submission[1].query_id == query_result.query_id:
+                del self._submissions[key]
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._submissions)}
@@ -0,0 +1,140 @@
+import os
+import re
+import threading
+
+from embedding import count_tokens, truncate_tokens
+from tracing import incr, span
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+# Ingest splits with chunk_overlap=100 characters; look a little further.
+MAX_OVERLAP_CHARS = 300
+MIN_OVERLAP_CHARS = 20
+
+# ingest appends str(meta_dict) + "\n" to every chunk.
+METADATA_SUFFIX = re.compile(r"\{[^{}]*'restaurant_name'[^{}]*\}\s*$")
+METADATA_FIELDS = ("cuisine", "restaurant_name", "location")
+
+
+def strip_metadata(text):
+    return METADATA_SUFFIX.sub("", text).rstrip()
+
+
+def compact_whitespace(text):
+    # PDF text is padded with runs of spaces and blank lines; each costs tokens.
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def find_overlap(head, tail):
+    """Length of the longest suffix of `head` that is also a prefix of `tail`."""
+    for size in range(min(len(head), len(tail), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+def merge_chunks(texts):
+    """
+    Join chunks of one menu that overlap (consecutive splitter windows) into
+    single segments and drop chunks already contained in another.
+    """
+    segments = []
+    for text in texts:
+        if any(text in segment for segment in segments):
+            continue
+        for i, segment in enumerate(segments):
+            overlap = find_overlap(segment, text)
+            if overlap:
+                segments[i] = segment + text[overlap:]
+                break
+            overlap = find_overlap(text, segment)
+            if overlap:
+                segments[i] = text + segment[overlap:]
+                break
+        else:
+            segments.append(text)
+    return segments
+
+
+class ContextAssembler:
+    """
+    Turn retrieved chunks into the prompt's context block.
+
+    Chunks are grouped by menu in retrieval order; each menu's metadata is
+    written once instead of after every chunk, overlapping chunks are merged,
+    and menus are added until `token_budget` tokens are used (the last one is
+    truncated to fit).
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "input_chunks": 0,
+            "merged_chunks": 0,
+            "truncated": 0,
+        }
+
+    def assemble(self, docs):
+        """Return (context_text, stats) for `docs`."""
+        groups = {}
+        for doc in docs:
+            meta = {field: doc.metadata.get(field) for field in METADATA_FIELDS}
+            key = meta["restaurant_name"]
+            groups.setdefault(key, (meta, []))[1].append(strip_metadata(doc.page_content))
+
+        blocks = []
+        merged = 0
+        for meta, texts in groups.values():
+            segments = merge_chunks([text for text in texts if text])
+            merged += len(texts) - len(segments)
+            segments = [compact_whitespace(segment) for segment in segments]
+            header = str(meta) if meta["restaurant_name"] is not None else ""
+            blocks.append("\n\n".join(filter(None, [header, *segments])))
+
+        parts = []
+        used = 0
+        truncated = False
+        for block in blocks:
+            tokens = count_tokens(block)
+            remaining = self.token_budget - used
+            if tokens > remaining:
+                # Keep a partial menu only if a useful amount still fits.
+                if remaining >= 100:
+                    parts.append(truncate_tokens(block, remaining))
+                    used += remaining
+                truncated = True
+                break
+            parts.append(block)
+            used += tokens
+
+        text = "\n\n".join(parts)
+        stats = {
+            "input_chunks": len(docs),
+            "merged_chunks": merged,
+            "input_tokens": sum(count_tokens(doc.page_content) for doc in docs),
+            "output_tokens": count_tokens(text) if text else 0,
+            "truncated": truncated,
+        }
+        with self._lock:
+            self.stats["calls"] += 1
+            for key in ("input_tokens", "output_tokens", "input_chunks", "merged_chunks"):
+                self.stats[key] += stats[key]
+            self.stats["truncated"] += int(truncated)
+        return text, stats
+
+    def format(self, docs):
+        with span("context_packing"):
+            text, stats = self.assemble(docs)
+        incr("context_tokens", stats["output_tokens"])
+        return text
+
+    def metrics(self):
+        with self._lock:
+            stats = dict(self.stats)
+        if stats["input_tokens"]:
+            stats["token_reduction"] = 1 - stats["output_tokens"] / stats["input_tokens"]
+        return stats
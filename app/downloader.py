@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import time
+import contextlib
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_DOWNLOAD_WORKERS = int(os.getenv("MAX_DOWNLOAD_WORKERS", 8))
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", 3))
+DOWNLOAD_BACKOFF_SECONDS = float(os.getenv("DOWNLOAD_BACKOFF_SECONDS", 1.0))
+DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("DOWNLOAD_TIMEOUT_SECONDS", 30))
+# Longest Retry-After we honor; a server asking for more gets this instead.
+DOWNLOAD_MAX_RETRY_AFTER_SECONDS = float(os.getenv("DOWNLOAD_MAX_RETRY_AFTER_SECONDS", 60))
+
+MANIFEST_FILE_NAME = ".manifest.json"
+CHUNK_SIZE = 64 * 1024
+
+# Status codes worth retrying; everything else is reported as a failure right away.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def sanitize_string(input_string):
+    # Remove special characters
+    sanitized = re.sub(r"[^a-zA-Z0-9\s]", "", input_string.strip())
+    # Convert to lowercase
+    sanitized = sanitized.lower()
+    # Replace spaces with hyphens
+    sanitized = sanitized.replace(" ", "-")
+    return sanitized
+
+
+def build_session(pool_size=MAX_DOWNLOAD_WORKERS):
+    # One session shared by every worker thread, so connections to the menu
+    # bucket are kept alive and reused instead of reopened per file.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_manifest_path(download_folder):
+    return os.path.join(download_folder, MANIFEST_FILE_NAME)
+
+
+def load_manifest(download_folder):
+    manifest_path = get_manifest_path(download_folder)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable manifest {manifest_path}: {e}")
+        return {}
+
+
+def save_manifest(download_folder, manifest):
+    # Write to a temp file first so an interrupted run never leaves a torn manifest.
+    manifest_path = get_manifest_path(download_folder)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_unchanged_on_disk(file_path, menu_url, entry):
+    # A file is only trusted if it was fetched from the same URL and still has
+    # the size we recorded when we finished writing it.
+    if not entry or entry.get("url") != menu_url:
+        return False
+    if not os.path.exists(file_path):
+        return False
+    return os.path.getsize(file_path) == entry.get("size")
+
+
+def get_retry_after(response, max_seconds=DOWNLOAD_MAX_RETRY_AFTER_SECONDS):
+    """Seconds a 429/503 response asks us to wait, or None without a usable Retry-After."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        # An HTTP date rather than a number of seconds.
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), max_seconds)
+
+
+def download_pdf(
+    session,
+    menu_url,
+    file_path,
+    entry=None,
+    max_retries=DOWNLOAD_MAX_RETRIES,
+    backoff_seconds=DOWNLOAD_BACKOFF_SECONDS,
+    timeout=DOWNLOAD_TIMEOUT_SECONDS,
+):
+    """Fetch one menu, streaming it to disk. Returns (manifest_entry, downloaded)."""
+    headers = {}
+    if is_unchanged_on_disk(file_path, menu_url, entry):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    tmp_path = file_path + ".part"
+    for attempt in range(max_retries + 1):
+        try:
+            with session.get(
+                menu_url, headers=headers, stream=True, timeout=timeout
+            ) as response:
+                if response.status_code == 304:
+                    return entry, False
+                if response.status_code in RETRY_STATUS_CODES:
+                    raise requests.exceptions.HTTPError(
+                        f"{response.status_code} for {menu_url}", response=response
+                    )
+                response.raise_for_status()  # Check if the request was successful
+
+                size = 0
+                with open(tmp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            file.write(chunk)
+                            size += len(chunk)
+                os.replace(tmp_path, file_path)
+
+                new_entry = {
+                    "url": menu_url,
+                    "size": size,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "downloaded_at": int(time.time()),
+                }
+                return new_entry, True
+
+        except (requests.exceptions.RequestException, OSError) as e:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            # A write failure (disk full, permissions) will not go away on retry.
+            if not isinstance(e, requests.exceptions.RequestException):
+                raise
+
+            status_code = getattr(e.response, "status_code", None)
+            retryable = status_code is None or status_code in RETRY_STATUS_CODES
+            if not retryable or attempt == max_retries:
+                raise
+
+            delay = get_retry_after(e.response)
+            if delay is None:
+                delay = backoff_seconds * (2**attempt)
+            print(f"Retrying {menu_url} in {delay:.1f}s ({e})")
+            time.sleep(delay)
+
+
+def download_pdfs_from_csv(
+    csv_path,
+    download_folder,
+    output_csv="restaurant_menu_pdf.csv",
+    max_workers=MAX_DOWNLOAD_WORKERS,
+    revalidate=True,
+):
+    """
+    Download every menu listed in `csv_path` into `download_folder`.
+
+    Files recorded in the folder's manifest are revalidated with a conditional
+    request (or skipped entirely when `revalidate` is False), so re-runs only
+    transfer menus that actually changed. `output_csv` is written once at the end.
+    """
+    os.makedirs(download_folder, exist_ok=True)
+
+    # Read the CSV file
+    df = pd.read_csv(csv_path)
+
+    manifest = load_manifest(download_folder)
+    session = build_session(pool_size=max_workers)
+
+    jobs = {}
+    for row in df.to_dict(orient="records"):
+        restaurant_name = row["headline"]
+        menu_url = row["menu_url"]
+        if not isinstance(menu_url, str) or not menu_url.strip():
+            continue
+
+        # Generate a sanitized file name
+        file_name = f"{sanitize_string(restaurant_name)}.pdf"
+        jobs[restaurant_name] = (menu_url.strip(), file_name)
+
+    name_2_path = {}
+    downloaded, skipped, failed = 0, 0, 0
+
+    def fetch(restaurant_name, menu_url, file_name):
+        file_path = os.path.join(download_folder, file_name)
+        entry = manifest.get(file_name)
+        if not revalidate and is_unchanged_on_disk(file_path, menu_url, entry):
+            return restaurant_name, file_path, entry, False
+        new_entry, was_downloaded = download_pdf(session, menu_url, file_path, entry)
+        return restaurant_name, file_path, new_entry, was_downloaded
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(fetch, name, url, file_name): (name, url, file_name)
+                for name, (url, file_name) in jobs.items()
+            }
+            for future in as_completed(futures):
+                restaurant_name, menu_url, file_name = futures[future]
+                try:
+                    restaurant_name, file_path, entry, was_downloaded = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    # One menu failing (network or disk) never stops the others.
+                    print(f"Failed to download {file_name}: {e}")
+                    failed += 1
+                    # Keep serving the last good copy if we have one.
+                    file_path = os.path.join(download_folder, file_name)
+                    if is_unchanged_on_disk(file_path, menu_url, manifest.get(file_name)):
+                        name_2_path[restaurant_name] = file_path
+                    continue
+
+                name_2_path[restaurant_name] = file_path
+                if was_downloaded:
+                    print(f"Downloaded {file_name} successfully.")
+                    downloaded += 1
+                    # Persist progress as we go so an interrupted run can resume.
+                    manifest[file_name] = entry
+                    try:
+                        save_manifest(download_folder, manifest)
+                    except OSError as e:
+                        print(f"Failed to save manifest: {e}")
+                else:
+                    skipped += 1
+    finally:
+        session.close()
+
+    print(
+        f"Menus downloaded: {downloaded}, unchanged: {skipped}, failed: {failed}"
+    )
+
+    df["file_path"] = df["headline"].map(name_2_path)
+    df.to_csv(output_csv, index=False)
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download restaurant week menus.")
+    parser.add_argument("--csv-path", default="app/restaurant_menu_urls.csv")
+    parser.add_argument("--download-folder", default="menu_urls")
+    parser.add_argument("--output-csv", default="restaurant_menu_pdf.csv")
+    parser.add_argument("--max-workers", type=int, default=MAX_DOWNLOAD_WORKERS)
+    parser.add_argument(
+        "--no-revalidate",
+        action="store_true",
+        help="Trust files already in the manifest without contacting the server.",
+    )
+    args = parser.parse_args()
+
+    download_pdfs_from_csv(
+        args.csv_path,
+        args.download_folder,
+        output_csv=args.output_csv,
+        max_workers=args.max_workers,
+        revalidate=not args.no_revalidate,
+    )
@@ -0,0 +1,308 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./.cache/embeddings.sqlite")
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 20000))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 6))
+EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", 1.0))
+
+_encoding = None
+_query_vectors = ContextVar("query_vectors", default=None)
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken (or its encoding files) unavailable: ~4 characters per token.
+            _encoding = False
+    return _encoding
+
+
+@contextlib.contextmanager
+def use_query_vectors(vectors):
+    """
+    Serve `get_query_vector` from {query_text: vector} within the block.
+
+    Batch callers embed all their questions in one request up front; the
+    retrievers and the semantic answer cache then reuse those vectors.
+    """
+    token = _query_vectors.set(vectors)
+    try:
+        yield
+    finally:
+        _query_vectors.reset(token)
+
+
+def get_query_vector(embeddings, query_text):
+    vectors = _query_vectors.get()
+    if vectors is not None and query_text in vectors:
+        return vectors[query_text]
+    return embeddings.embed_query(query_text)
+
+
+def count_tokens(text):
+    encoding = get_encoding()
+    if encoding is False:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    encoding = get_encoding()
+    if encoding is False:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens]) if len(tokens) > max_tokens else text
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_rate_limit_error(error):
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (model, sha256(text))."""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get_many(self, model, text_hashes):
+        found = {}
+        text_hashes = list(text_hashes)
+        # Stay under SQLite's default bound-parameter limit.
+        for start in range(0, len(text_hashes), 500):
+            batch = text_hashes[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model, items):
+        rows = [
+            (model, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) "
+                "VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrap an `Embeddings` with an on-disk cache, token-budgeted batching and
+    bounded concurrency.
+
+    Texts already in the cache are never sent to the wrapped model, so a fully
+    cached corpus can be re-ingested offline. Rate-limited batches (HTTP 429)
+    are retried with exponential backoff, honouring `Retry-After` when given.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        cache=None,
+        model_name=None,
+        max_batch_tokens=EMBEDDING_BATCH_TOKENS,
+        max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+        max_retries=EMBEDDING_MAX_RETRIES,
+        backoff_seconds=EMBEDDING_BACKOFF_SECONDS,
+    ):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model_name = model_name or getattr(
+            embeddings, "model", type(embeddings).__name__
+        )
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "requests": 0, "retries": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def make_batches(self, texts):
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and batch_tokens + tokens > self.max_batch_tokens:
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_batch(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._count("requests")
+                return self.embeddings.embed_documents(batch)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self._count("retries")
+                delay = get_retry_after(e) or self.backoff_seconds * (2**attempt)
+                delay += random.uniform(0, self.backoff_seconds)
+                print(f"Embedding rate limited, retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_documents(self, texts):
+        hashes = [hash_text(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, set(hashes))
+
+        # Each distinct uncached text is embedded once, however often it repeats.
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in vectors:
+                missing.setdefault(text_hash, text)
+
+        self._count("cache_hits", len(texts) - len(missing))
+        self._count("cache_misses", len(missing))
+
+        if missing:
+            batches = self.make_batches(list(missing.values()))
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                # Results are cached batch by batch, so a failed run keeps its progress.
+                results = executor.map(self._embed_batch, batches)
+                for batch, embedded in zip(batches, results):
+                    items = [
+                        (hash_text(text), vector) for text, vector in zip(batch, embedded)
+                    ]
+                    self.cache.put_many(self.model_name, items)
+                    vectors.update(items)
+
+        return [vectors[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    Deterministic, network-free embeddings built by hashing word tokens into a
+    fixed number of buckets. Useful for tests and benchmarks; `latency_seconds`
+    simulates a remote round trip per call.
+    """
+
+    def __init__(self, size=256, latency_seconds=0.0):
+        self.size = size
+        self.latency_seconds = latency_seconds
+        self.model = f"local-hash-{size}"
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark the embedding cache offline.")
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-concurrency", type=int, default=EMBEDDING_MAX_CONCURRENCY)
+    parser.add_argument("--max-batch-tokens", type=int, default=EMBEDDING_BATCH_TOKENS)
+    args = parser.parse_args()
+
+    texts = [
+        f"Prix fixe dinner {i % 97}: appetizer {i}, entree {i * 7 % 113}, dessert {i % 31}"
+        for i in range(args.chunks)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cached = CachedEmbeddings(
+            LocalHashEmbeddings(latency_seconds=args.latency),
+            cache=EmbeddingCache(os.path.join(tmp_dir, "embeddings.sqlite")),
+            max_batch_tokens=args.max_batch_tokens,
+            max_concurrency=args.max_concurrency,
+        )
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            cached.embed_documents(texts)
+            print(f"{label}: {time.perf_counter() - start:.3f}s {cached.stats}")
@@ -0,0 +1,23 @@
+import os
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on blocking calls (Chroma, DynamoDB, boto3) in flight at once,
+# so a burst of requests cannot spawn an unbounded number of threads.
+BLOCKING_IO_MAX_WORKERS = int(os.getenv("BLOCKING_IO_MAX_WORKERS", 16))
+
+_executor = ThreadPoolExecutor(
+    max_workers=BLOCKING_IO_MAX_WORKERS, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the shared bounded pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry context variables (the request's trace) into the worker thread.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _executor, functools.partial(context.run, func, *args, **kwargs)
+    )
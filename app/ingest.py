@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+from langchain_community.document_loaders import PyMuPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from lexical import build_lexical_index, get_lexical_index_path
+from vector_index import build_vector_index, vector_index_is_current
+from menu_facts import build_menu_facts, get_menu_facts_path
+
+MENU_CSV_PATH = "restaurant_menu_pdf.csv"
+MANIFEST_FILE_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+MAX_PARSE_WORKERS = int(os.getenv("MAX_PARSE_WORKERS", os.cpu_count() or 1))
+# Chunks per embed + upsert call. Menus are streamed into batches of this
+# size, so memory stays flat however many menus the CSV lists.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+
+# Restaurants whose menus we never index.
+SKIPPED_RESTAURANTS = {"Bar Goyana"}
+
+TEXT_SPLITTER_SEPARATORS = [
+    "\n\n",
+    "\n",
+    " ",
+    ".",
+    ",",
+    "\u200b",  # Zero-width space
+    "\uff0c",  # Fullwidth comma
+    "\u3001",  # Ideographic comma
+    "\uff0e",  # Fullwidth full stop
+    "\u3002",  # Ideographic full stop
+    "",
+]
+
+
+def build_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        separators=TEXT_SPLITTER_SEPARATORS,
+        chunk_size=800,
+        chunk_overlap=100,
+        length_function=len,
+    )
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_chunk_id(restaurant_name, page_content):
+    # Stable across rebuilds: the same text for the same restaurant always maps
+    # to the same id, so unchanged chunks are never re-embedded.
+    return hash_bytes(f"{restaurant_name}\n{page_content}".encode("utf-8"))
+
+
+def load_menu_records(csv_path=MENU_CSV_PATH):
+    """Read the menu CSV and return one metadata dict per restaurant with a PDF."""
+    df = pd.read_csv(csv_path)
+
+    records = []
+    for data in df.to_dict(orient="records"):
+        fn = data["file_path"]
+        if not fn or pd.isna(fn):
+            continue
+        if not os.path.exists(fn):
+            print(f"Menu file not found, skipping: {fn}")
+            continue
+
+        restaurant_name = data["headline"].strip()
+        if restaurant_name in SKIPPED_RESTAURANTS:
+            print(f"skipping {restaurant_name}")
+            continue
+
+        records.append(
+            {
+                "file_path": fn,
+                "cuisine": data["cuisine"].strip(),
+                "restaurant_name": restaurant_name,
+                "location": data["location"].strip(),
+            }
+        )
+    return records
+
+
+def get_metadata(record):
+    return {
+        "cuisine": record["cuisine"],
+        "restaurant_name": record["restaurant_name"],
+        "location": record["location"],
+    }
+
+
+def load_menu_documents(record, text_splitter=None):
+    """Parse and split one menu PDF, returning its chunks tagged with metadata and ids."""
+    if text_splitter is None:
+        text_splitter = build_text_splitter()
+
+    loader = PyMuPDFLoader(record["file_path"])
+    raw_documents = loader.load()
+    documents = text_splitter.split_documents(raw_documents)
+
+    #  add metadata
+    meta_dict = get_metadata(record)
+    chunks = {}
+    for doc in documents:
+        doc.metadata = dict(meta_dict)
+        doc.page_content += str(meta_dict) + "\n"
+        chunk_id = get_chunk_id(meta_dict["restaurant_name"], doc.page_content)
+        doc.metadata["chunk_id"] = chunk_id
+        # Identical chunks within one menu collapse into a single entry.
+        chunks.setdefault(chunk_id, doc)
+
+    return list(chunks.values())
+
+
+# Each parse worker process builds its splitter once and reuses it for every menu.
+_worker_text_splitter = None
+
+
+def _init_parse_worker():
+    global _worker_text_splitter
+    _worker_text_splitter = build_text_splitter()
+
+
+def _parse_menu(record):
+    start = time.perf_counter()
+    documents = load_menu_documents(record, _worker_text_splitter)
+    return record, documents, time.perf_counter() - start
+
+
+def _iter_parsed(records, max_workers):
+    """Parse results in completion order, with at most 2 * max_workers menus in flight."""
+    records = iter(records)
+    executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_parse_worker)
+    try:
+        futures = {
+            executor.submit(_parse_menu, record)
+            for record, _ in zip(records, range(2 * max_workers))
+        }
+        while futures:
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Refill one slot per result, so parsed menus never pile up
+                # ahead of a slower embed + upsert stage.
+                record = next(records, None)
+                if record is not None:
+                    futures.add(executor.submit(_parse_menu, record))
+                yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def iter_menu_documents(records, max_workers=MAX_PARSE_WORKERS):
+    """
+    Parse and split menus across a process pool.
+
+    Yields (record, documents, seconds) as each menu finishes, in completion
+    order. With `max_workers` <= 1 everything runs in the calling process.
+    """
+    start = time.perf_counter()
+    count = 0
+
+    if max_workers <= 1 or len(records) <= 1:
+        _init_parse_worker()
+        results = (_parse_menu(record) for record in records)
+    else:
+        results = _iter_parsed(records, max_workers)
+
+    try:
+        for record, documents, seconds in results:
+            count += 1
+            print(
+                f"Parsed {record['file_path']} into {len(documents)} chunks "
+                f"in {seconds:.2f}s"
+            )
+            yield record, documents, seconds
+    finally:
+        results.close()
+
+    print(
+        f"Parsed {count} menus in {time.perf_counter() - start:.2f}s "
+        f"with {max(max_workers, 1)} worker(s)"
+    )
+
+
+def get_manifest_path(persist_directory):
+    return os.path.join(persist_directory, MANIFEST_FILE_NAME)
+
+
+def load_manifest(persist_directory):
+    manifest_path = get_manifest_path(persist_directory)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as file:
+            manifest = json.load(file)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        print(f"Ignoring manifest with unknown version at {manifest_path}")
+    return {"version": MANIFEST_VERSION, "menus": {}}
+
+
+def save_manifest(persist_directory, manifest):
+    os.makedirs(persist_directory, exist_ok=True)
+    manifest_path = get_manifest_path(persist_directory)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def get_menu_fingerprint(record):
+    metadata_hash = hash_bytes(
+        json.dumps(get_metadata(record), sort_keys=True).encode("utf-8")
+    )
+    return {
+        "file_path": record["file_path"],
+        "file_hash": hash_file(record["file_path"]),
+        "metadata_hash": metadata_hash,
+    }
+
+
+def plan_ingest(records, manifest):
+    """
+    Compare the CSV against the manifest.
+
+    Returns (changed, removed): the records whose PDF or metadata changed along
+    with their new fingerprint, and the restaurant names no longer in the CSV.
+    """
+    menus = manifest["menus"]
+    changed = []
+    for record in records:
+        fingerprint = get_menu_fingerprint(record)
+        entry = menus.get(record["restaurant_name"])
+        if entry and all(entry.get(key) == value for key, value in fingerprint.items()):
+            continue
+        changed.append((record, fingerprint))
+
+    current_names = {record["restaurant_name"] for record in records}
+    removed = [name for name in menus if name not in current_names]
+    return changed, removed
+
+
+def get_existing_chunk_ids(vectorstore, restaurant_name, entry):
+    if entry is not None:
+        return set(entry.get("chunk_ids", []))
+    # No manifest entry yet (e.g. a collection built before manifests existed):
+    # fall back to whatever the collection holds for this restaurant.
+    result = vectorstore.get(where={"restaurant_name": restaurant_name}, include=[])
+    return set(result.get("ids", []))
+
+
+def sync_vectorstore(
+    vectorstore,
+    persist_directory,
+    csv_path=MENU_CSV_PATH,
+    max_workers=MAX_PARSE_WORKERS,
+    batch_size=INGEST_BATCH_SIZE,
+):
+    """
+    Bring `vectorstore` in line with the menus listed in `csv_path`.
+
+    Only restaurants whose PDF or CSV metadata changed are re-parsed, and only
+    chunks that are not already in the collection are embedded. Chunks of
+    removed restaurants, or that disappeared from an updated menu, are deleted.
+
+    Menus stream through parse -> split -> tag -> embed + upsert, and new
+    chunks are upserted `batch_size` at a time across menus. A restaurant is
+    checkpointed in the manifest once its last batch is committed; after an
+    interruption it is parsed again, but chunks already upserted are skipped.
+    """
+    manifest = load_manifest(persist_directory)
+    records = load_menu_records(csv_path)
+    changed, removed = plan_ingest(records, manifest)
+
+    print(
+        f"Ingest plan: {len(changed)} changed, {len(removed)} removed, "
+        f"{len(records) - len(changed)} unchanged"
+    )
+
+    stats = {
+        "added": 0,
+        "deleted": 0,
+        "changed": len(changed),
+        "removed": len(removed),
+        "batches": 0,
+    }
+    menus = manifest["menus"]
+
+    for restaurant_name in removed:
+        stale_ids = list(
+            get_existing_chunk_ids(vectorstore, restaurant_name, menus[restaurant_name])
+        )
+        if stale_ids:
+            vectorstore.delete(ids=stale_ids)
+        stats["deleted"] += len(stale_ids)
+        del menus[restaurant_name]
+        save_manifest(persist_directory, manifest)
+
+    fingerprints = {record["restaurant_name"]: fingerprint for record, fingerprint in changed}
+    changed_records = [record for record, _ in changed]
+
+    # restaurant_name -> its chunk ids, stale ids and chunks not yet committed.
+    pending = {}
+    batch = []
+
+    def checkpoint(restaurant_name):
+        entry = pending.pop(restaurant_name)
+        # Old chunks keep answering questions until the new ones are all in.
+        if entry["stale_ids"]:
+            vectorstore.delete(ids=entry["stale_ids"])
+        stats["deleted"] += len(entry["stale_ids"])
+        menus[restaurant_name] = dict(
+            fingerprints[restaurant_name], chunk_ids=entry["chunk_ids"]
+        )
+
+    def commit_batch():
+        vectorstore.add_documents(batch, ids=[doc.metadata["chunk_id"] for doc in batch])
+        stats["added"] += len(batch)
+        stats["batches"] += 1
+        for doc in batch:
+            pending[doc.metadata["restaurant_name"]]["remaining"] -= 1
+        batch.clear()
+
+        done = [name for name, entry in pending.items() if not entry["remaining"]]
+        for restaurant_name in done:
+            checkpoint(restaurant_name)
+        save_manifest(persist_directory, manifest)
+
+    for record, documents, _ in iter_menu_documents(changed_records, max_workers):
+        restaurant_name = record["restaurant_name"]
+        existing_ids = get_existing_chunk_ids(
+            vectorstore, restaurant_name, menus.get(restaurant_name)
+        )
+        new_ids = [doc.metadata["chunk_id"] for doc in documents]
+        # Includes chunks committed by an interrupted run that never checkpointed.
+        committed = set(vectorstore.get(ids=new_ids, include=[])["ids"]) if new_ids else set()
+        to_add = [doc for doc in documents if doc.metadata["chunk_id"] not in committed]
+
+        pending[restaurant_name] = {
+            "chunk_ids": new_ids,
+            "stale_ids": list(existing_ids - set(new_ids)),
+            "remaining": len(to_add),
+        }
+        if not to_add:
+            checkpoint(restaurant_name)
+            save_manifest(persist_directory, manifest)
+
+        for doc in to_add:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                commit_batch()
+
+    if batch:
+        commit_batch()
+
+    print(
+        f"Ingest done: {stats['added']} chunks added in {stats['batches']} batches, "
+        f"{stats['deleted']} chunks deleted"
+    )
+
+    # The BM25 and NumPy indexes and the menu facts are cheap to rebuild from
+    # the collection, so they are never patched.
+    if changed or removed or not os.path.exists(get_lexical_index_path(persist_directory)):
+        build_lexical_index(vectorstore, persist_directory)
+    if changed or removed or not vector_index_is_current(persist_directory):
+        build_vector_index(vectorstore, persist_directory)
+    if changed or removed or not os.path.exists(get_menu_facts_path(persist_directory)):
+        build_menu_facts(vectorstore, persist_directory)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+    from langchain_community.vectorstores import Chroma
+    from langchain_community.embeddings import OpenAIEmbeddings
+    from embedding import CachedEmbeddings, EmbeddingCache, EMBEDDING_CACHE_PATH
+
+    parser = argparse.ArgumentParser(description="Incrementally sync menus into Chroma.")
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--persist-directory", default="./db")
+    parser.add_argument("--parse-workers", type=int, default=MAX_PARSE_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--embedding-cache", default=EMBEDDING_CACHE_PATH)
+    args = parser.parse_args()
+
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY")),
+        cache=EmbeddingCache(args.embedding_cache),
+    )
+    vectorstore = Chroma(
+        persist_directory=args.persist_directory, embedding_function=embeddings
+    )
+    sync_vectorstore(
+        vectorstore,
+        args.persist_directory,
+        csv_path=args.csv_path,
+        max_workers=args.parse_workers,
+        batch_size=args.batch_size,
+    )
@@ -0,0 +1,333 @@
+import os
+import math
+import asyncio
+import time
+import pickle
+from array import array
+from collections import Counter
+from typing import Any, List
+
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from executor import run_blocking
+from metadata_index import (
+    embed_query,
+    iter_collection,
+    normalize_name,
+    search_by_vector,
+    RETRIEVER_K,
+)
+from tracing import span
+
+LEXICAL_INDEX_FILE_NAME = "bm25_index.pkl"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Standard reciprocal rank fusion constant; larger values flatten the ranks.
+RRF_K = int(os.getenv("RRF_K", 60))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", 20))
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+
+# Metadata fields encoded as integer columns for fast filter masks.
+FILTER_FIELDS = ("restaurant_name", "cuisine", "location")
+
+
+def tokenize(text):
+    # Keeps prices ("$45") and numbers as tokens alongside words.
+    return normalize_name(text).split()
+
+
+def get_doc_key(doc):
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def matches_filter(metadata, where):
+    """Evaluate the subset of Chroma `where` syntax produced by RestaurantIndex."""
+    if where is None:
+        return True
+    if "$and" in where:
+        return all(matches_filter(metadata, clause) for clause in where["$and"])
+    if "$or" in where:
+        return any(matches_filter(metadata, clause) for clause in where["$or"])
+    for field, condition in where.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def build_field_codes(metadatas):
+    """Encode each FILTER_FIELDS column as int32 codes plus a value -> code vocab."""
+    field_codes = {}
+    field_vocab = {}
+    for field in FILTER_FIELDS:
+        vocab = {}
+        codes = [vocab.setdefault(meta.get(field), len(vocab)) for meta in metadatas]
+        field_codes[field] = np.array(codes, dtype=np.int32)
+        field_vocab[field] = vocab
+    return field_codes, field_vocab
+
+
+def get_filter_mask(field_codes, field_vocab, metadatas, where):
+    """Boolean row mask for a Chroma `where` filter, or None for no filter."""
+    if where is None:
+        return None
+    if "$and" in where:
+        mask = np.ones(len(metadatas), dtype=bool)
+        for clause in where["$and"]:
+            mask &= get_filter_mask(field_codes, field_vocab, metadatas, clause)
+        return mask
+
+    if len(where) == 1:
+        field, condition = next(iter(where.items()))
+        if not isinstance(condition, dict):
+            values = [condition]
+        elif set(condition) == {"$in"}:
+            values = condition["$in"]
+        else:
+            values = None
+        if field in field_codes and values is not None:
+            vocab = field_vocab[field]
+            codes = [vocab[value] for value in values if value in vocab]
+            return np.isin(field_codes[field], codes)
+
+    # Anything else is evaluated row by row.
+    return np.fromiter(
+        (matches_filter(meta, where) for meta in metadatas),
+        dtype=bool,
+        count=len(metadatas),
+    )
+
+
+class BM25Index:
+    """
+    Inverted index with BM25 scoring over menu chunks.
+
+    Each posting stores its precomputed BM25 term weight, so a query is a
+    handful of numpy scatter-adds followed by an argpartition.
+    """
+
+    def __init__(self, texts, metadatas, ids=None, k1=BM25_K1, b=BM25_B):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [None] * len(texts)
+        self._build([(texts, metadatas, ids)], k1, b)
+
+    @classmethod
+    def from_pages(cls, pages, k1=BM25_K1, b=BM25_B):
+        """
+        Build from (texts, metadatas, ids) pages. Only one page is tokenized
+        at a time; postings accumulate in compact arrays.
+        """
+        index = cls.__new__(cls)
+        index._build(pages, k1, b)
+        return index
+
+    def _build(self, pages, k1, b):
+        self.texts, self.metadatas, self.ids = [], [], []
+        doc_lengths = array("f")
+        postings = {}
+        for texts, metadatas, ids in pages:
+            for text, meta, chunk_id in zip(texts, metadatas, ids):
+                doc_index = len(self.texts)
+                self.texts.append(text)
+                self.metadatas.append(dict(meta or {}))
+                self.ids.append(chunk_id)
+                tokens = tokenize(text)
+                doc_lengths.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    entries = postings.get(term)
+                    if entries is None:
+                        entries = postings[term] = (array("i"), array("f"))
+                    entries[0].append(doc_index)
+                    entries[1].append(tf)
+
+        doc_lengths = np.frombuffer(doc_lengths, dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+        n_docs = len(self.texts)
+        self.postings = {}
+        while postings:
+            # Popped as converted, so the array and numpy copies never all coexist.
+            term, (doc_ids, tf) = postings.popitem()
+            doc_ids = np.frombuffer(doc_ids, dtype=np.int32).copy()
+            tf = np.frombuffer(tf, dtype=np.float32)
+            df = len(doc_ids)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * doc_lengths[doc_ids] / (avg_length or 1.0))
+            weights = idf * tf * (k1 + 1) / (tf + norm)
+            self.postings[term] = (doc_ids, weights.astype(np.float32))
+
+        self.field_codes, self.field_vocab = build_field_codes(self.metadatas)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _get_mask(self, where):
+        return get_filter_mask(self.field_codes, self.field_vocab, self.metadatas, where)
+
+    def search(self, query, k=RETRIEVER_K, where=None):
+        """Return [(doc_index, score)] for the top `k` chunks, best first."""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                doc_ids, weights = posting
+                scores[doc_ids] += weights
+
+        mask = self._get_mask(where)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > k:
+            top = np.argpartition(-scores[candidates], k - 1)[:k]
+            candidates = candidates[top]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [(int(index), float(scores[index])) for index in ranked]
+
+    def get_documents(self, query, k=RETRIEVER_K, where=None):
+        documents = []
+        for index, score in self.search(query, k=k, where=where):
+            metadata = dict(self.metadatas[index])
+            if self.ids[index] is not None:
+                metadata.setdefault("chunk_id", self.ids[index])
+            documents.append(Document(page_content=self.texts[index], metadata=metadata))
+        return documents
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        return cls.from_pages(
+            (page["documents"], page["metadatas"], page["ids"])
+            for page in iter_collection(vectorstore, ["documents", "metadatas"])
+        )
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return pickle.load(file)
+
+
+def get_lexical_index_path(persist_directory):
+    return os.path.join(persist_directory, LEXICAL_INDEX_FILE_NAME)
+
+
+def build_lexical_index(vectorstore, persist_directory):
+    """Rebuild the BM25 index from every chunk in the collection and persist it."""
+    start = time.perf_counter()
+    index = BM25Index.from_vectorstore(vectorstore)
+    index.save(get_lexical_index_path(persist_directory))
+    print(
+        f"Built BM25 index over {len(index)} chunks "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return index
+
+
+def load_lexical_index(persist_directory):
+    path = get_lexical_index_path(persist_directory)
+    if not os.path.exists(path):
+        return None
+    return BM25Index.load(path)
+
+
+def reciprocal_rank_fusion(result_lists, k=RETRIEVER_K, rrf_k=RRF_K):
+    """Merge ranked document lists: score(d) = sum(1 / (rrf_k + rank))."""
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = get_doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    for key in ranked:
+        documents[key].metadata["score"] = round(scores[key], 6)
+    return [documents[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense vector search fused with BM25 using reciprocal rank fusion.
+
+    Both sides fetch `fetch_k` candidates. When a `RestaurantIndex` is given,
+    the lexical side honours the same metadata filter as the dense side.
+    """
+
+    vectorstore: Any
+    lexical_index: Any
+    index: Any = None
+    k: int = RETRIEVER_K
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_filter(self, query):
+        if self.index is None:
+            return None
+        with span("query_analysis"):
+            return self.index.get_filter(query)
+
+    def _embed(self, query):
+        return embed_query(self.vectorstore, query)
+
+    def _dense_search(self, vector, where):
+        return search_by_vector(self.vectorstore, vector, self.fetch_k, where)
+
+    def _lexical_search(self, query, where):
+        with span("lexical_search"):
+            return self.lexical_index.get_documents(query, k=self.fetch_k, where=where)
+
+    def _fuse(self, dense, lexical):
+        with span("fusion"):
+            return reciprocal_rank_fusion([dense, lexical], k=self.k, rrf_k=self.rrf_k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        where = self._get_filter(query)
+        vector = self._embed(query)
+        dense = self._dense_search(vector, where)
+        lexical = self._lexical_search(query, where)
+        if where is not None and not dense and not lexical:
+            dense = self._dense_search(vector, None)
+            lexical = self._lexical_search(query, None)
+
+        return self._fuse(dense, lexical)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        where = self._get_filter(query)
+        # The query embedding (an OpenAI round trip) and BM25 run side by side.
+        vector, lexical = await asyncio.gather(
+            run_blocking(self._embed, query),
+            run_blocking(self._lexical_search, query, where),
+        )
+        dense = await run_blocking(self._dense_search, vector, where)
+        if where is not None and not dense and not lexical:
+            dense, lexical = await asyncio.gather(
+                run_blocking(self._dense_search, vector, None),
+                run_blocking(self._lexical_search, query, None),
+            )
+
+        return self._fuse(dense, lexical)
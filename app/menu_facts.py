@@ -0,0 +1,473 @@
+import os
+import re
+import json
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+
+from context import strip_metadata
+from metadata_index import iter_collection, normalize_name
+
+MENU_FACTS_ENABLED = os.getenv("MENU_FACTS_ENABLED", "true").lower() == "true"
+MENU_FACTS_FILE_NAME = "menu_facts.json"
+MENU_FACTS_VERSION = 1
+# Restaurant Week menus come at a few fixed prices; any other number on a
+# menu is a supplement, a wine or an a la carte dish.
+RESTAURANT_WEEK_PRICES = tuple(
+    int(price) for price in os.getenv("RESTAURANT_WEEK_PRICES", "30,45,60").split(",")
+)
+MENU_FACTS_MAX_RESULTS = int(os.getenv("MENU_FACTS_MAX_RESULTS", 20))
+
+MENU_TYPES = ("lunch", "brunch", "dinner")
+COURSE_SECTIONS = {
+    "appetizer": r"appetizers?|starters?|first course|antipast[io]|to start|small plates",
+    "entree": r"entr[eé]es?|mains?|main courses?|second course|secondi|plats? principa(?:l|ux)",
+    "dessert": r"desserts?|dolc[ei]|sweets|third course",
+}
+COURSE_COUNTS = {"two": 2, "three": 3, "four": 4, "2": 2, "3": 3, "4": 4}
+
+MENU_TYPE_PATTERN = re.compile(r"\b(lunch|brunch|dinner)\b", re.I)
+DOLLAR_PRICE_PATTERN = re.compile(r"\$\s?(\d{2,3})(?:\.\d{2})?(?!\d)")
+BARE_PRICE_PATTERN = re.compile(r"(?<![\d.$+])(\d{2,3})(?:\.00)?(?![\d%])")
+PRICE_CONTEXT_PATTERN = re.compile(r"lunch|brunch|dinner|prix|fixe|course|per person", re.I)
+NOT_A_MENU_PRICE = re.compile(
+    r"supplement|\badd\b|wine|bottle|glass|pairing|gratuity|corkage|cocktail|"
+    r"beverage|drink|\+",
+    re.I,
+)
+COURSES_PATTERN = re.compile(r"\b(two|three|four|[234])[\s-]*courses?\b", re.I)
+SECTION_PATTERNS = {
+    section: re.compile(rf"^\W*(?:{pattern})\W*$", re.I)
+    for section, pattern in COURSE_SECTIONS.items()
+}
+
+# Question parsing for the fast path.
+PRICE_BOUNDS = [
+    (re.compile(r"\b(?:under|below|less than|cheaper than)\s*\$?\s*(\d+)", re.I), "lt"),
+    (re.compile(r"\b(?:at most|up to|no more than|within)\s*\$?\s*(\d+)", re.I), "le"),
+    (re.compile(r"\b(?:over|above|more than|pricier than)\s*\$?\s*(\d+)", re.I), "gt"),
+    (re.compile(r"\bat least\s*\$?\s*(\d+)", re.I), "ge"),
+    (re.compile(r"\$\s?(\d+)(?:\.\d{2})?(?!\d)"), "eq"),
+]
+CHEAPEST_PATTERN = re.compile(r"\b(cheapest|least expensive|lowest price|most affordable)\b", re.I)
+PRICIEST_PATTERN = re.compile(r"\b(most expensive|priciest|highest price)\b", re.I)
+# The yes/no questions the table can settle, "does Bobo have/offer/serve
+# lunch" and "is there a lunch menu at Bobo", with nothing but a restaurant
+# name in <restaurant>: it knows which menus a restaurant lists, not when it
+# is open or what is on them.
+MENU_NOUN = r"(?:an?\s+|any\s+)?(?P<menu_type>lunch|brunch|dinner)(?:\s+(?:menus?|options?))?"
+RESTAURANT_WEEK = r"(?:\s+(?:for|during)\s+restaurant\s+week)?\s*\??\s*$"
+YES_NO_PATTERNS = (
+    re.compile(
+        rf"^\s*(?:does|do)\s+(?P<restaurant>.+?)\s+(?:have|offer|serve|do)\s+{MENU_NOUN}{RESTAURANT_WEEK}",
+        re.I,
+    ),
+    re.compile(
+        rf"^\s*(?:is|are)\s+there\s+{MENU_NOUN}\s+(?:at|from)\s+(?P<restaurant>.+?){RESTAURANT_WEEK}",
+        re.I,
+    ),
+)
+LIST_PATTERN = re.compile(r"^\s*(which|what|list|show|find|any)\b", re.I)
+# The one kind of list question that may name restaurants: "which of Bobo
+# and Atoboy have lunch".
+WHICH_RESTAURANTS_PATTERN = re.compile(
+    r"^\s*(?:which|what)\s+(?:of\b|restaurants?\b|places\b|spots\b|ones\b)", re.I
+)
+# Everything else a filter question may say around the restaurants,
+# cuisines, neighborhoods, menu types and prices the table understands. Any
+# other word ("kids", "Sunday", "romantic", "near") is a constraint it
+# cannot check, so the question goes to the chain.
+FILTER_WORDS = {
+    "a", "all", "an", "and", "any", "are", "at", "available", "can", "cost", "costs",
+    "do", "does", "dollars", "during", "find", "fixe", "for", "get", "give", "has",
+    "have", "i", "in", "is", "list", "me", "menu", "menus", "of", "offer", "offers",
+    "one", "ones", "option", "options", "or", "per", "person", "place", "places",
+    "price", "priced", "prices", "prix", "restaurant", "restaurants", "show", "spot",
+    "spots", "that", "the", "there", "week", "what", "whats", "which", "with",
+}
+# Questions about what is on the menu need the menu text, not just its facts.
+NEEDS_MENU_TEXT = re.compile(
+    r"\b(dish|dishes|items?|ingredients?|best|recommend\w*|selections?|"
+    r"what(?:'?s|\s+is|\s+are)\s+on|on\s+the\s+menu|"
+    r"serves?|vegan|vegetarian|gluten|allerg\w*|wine|drinks?|dessert|appetizer|entr[eé]e|"
+    r"review|rated|describe|tell me about|good|worth|like)\b",
+    re.I,
+)
+
+
+def find_menu_prices(lines):
+    """Yield (price, menu type or None) for each menu price found in `lines`."""
+    for i, line in enumerate(lines):
+        if NOT_A_MENU_PRICE.search(line):
+            continue
+        prices = [int(p) for p in DOLLAR_PRICE_PATTERN.findall(line)]
+        # A bare "45" only counts next to words that make it a menu price:
+        # "Dinner 45 per person", "3-COURSE DINNER 45", or "Lunch Prix-Fixe" then "30".
+        if not prices:
+            context = line
+            if line.isdigit():
+                context = " ".join(lines[max(0, i - 1) : i + 1])
+            if PRICE_CONTEXT_PATTERN.search(context):
+                prices = [int(p) for p in BARE_PRICE_PATTERN.findall(line)]
+        for price in prices:
+            if price not in RESTAURANT_WEEK_PRICES:
+                continue
+            window = " ".join(lines[max(0, i - 2) : i + 3])
+            types = MENU_TYPE_PATTERN.findall(line) or MENU_TYPE_PATTERN.findall(window)
+            yield price, types[0].lower() if types else None
+
+
+def scan_menu_chunk(text):
+    """The raw facts in one chunk; `merge_menu_facts` combines a restaurant's scans."""
+    lines = [line.strip() for line in strip_metadata(text).split("\n") if line.strip()]
+    return {
+        "prices": set(find_menu_prices(lines)),
+        "mentioned": {match.lower() for line in lines for match in MENU_TYPE_PATTERN.findall(line)},
+        "courses": {
+            COURSE_COUNTS[m.lower()] for line in lines for m in COURSES_PATTERN.findall(line)
+        },
+        "sections": {
+            section
+            for section, pattern in SECTION_PATTERNS.items()
+            if any(len(line) <= 40 and pattern.match(line) for line in lines)
+        },
+    }
+
+
+def merge_menu_facts(scans):
+    """
+    Combine one restaurant's chunk scans into {"menus": [[menu_type, price]],
+    "menu_types", "courses", "sections"}.
+    """
+    prices, mentioned, courses, found_sections = set(), set(), set(), set()
+    for scan in scans:
+        prices |= scan["prices"]
+        mentioned |= scan["mentioned"]
+        courses |= scan["courses"]
+        found_sections |= scan["sections"]
+
+    menus = set()
+    for price, menu_type in prices:
+        # A price with no type nearby belongs to the only menu the text names.
+        if menu_type is None and len(mentioned) == 1:
+            menu_type = next(iter(mentioned))
+        menus.add((menu_type, price))
+    # Drop an untyped duplicate of a price already tied to a menu type.
+    typed_prices = {price for menu_type, price in menus if menu_type}
+    menus = {(t, p) for t, p in menus if t or p not in typed_prices}
+
+    sections = [section for section in SECTION_PATTERNS if section in found_sections]
+    return {
+        "menus": sorted(
+            ([t, p] for t, p in menus),
+            key=lambda menu: (MENU_TYPES.index(menu[0]) if menu[0] else len(MENU_TYPES), menu[1]),
+        ),
+        "menu_types": sorted(mentioned, key=MENU_TYPES.index),
+        "courses": max(courses) if courses else None,
+        "sections": sections,
+    }
+
+
+def extract_menu_facts(texts):
+    """Pull the prices, menu types and course sections out of one restaurant's menu chunks."""
+    return merge_menu_facts(scan_menu_chunk(text) for text in texts)
+
+
+def format_price(price):
+    return f"${price:.2f}"
+
+
+def parse_price_bounds(query_text):
+    """Return (op, price) pairs for the price constraints in a question."""
+    bounds = []
+    text = query_text
+    for pattern, op in PRICE_BOUNDS:
+        for match in pattern.finditer(text):
+            bounds.append((op, int(match.group(1))))
+        # "under $45" must not also read as "$45".
+        text = pattern.sub(" ", text)
+    return bounds
+
+
+def unrecognized_words(query_text, restaurant_index):
+    """The words of a question that are not a filter the table can apply."""
+    text = query_text
+    for pattern in [pattern for pattern, _ in PRICE_BOUNDS] + [
+        CHEAPEST_PATTERN,
+        PRICIEST_PATTERN,
+        MENU_TYPE_PATTERN,
+    ]:
+        text = pattern.sub(" ", text)
+    if restaurant_index is not None:
+        words = restaurant_index.remove_mentions(text)
+    else:
+        words = normalize_name(text).split()
+    return [word for word in words if word not in FILTER_WORDS]
+
+
+class MenuFactsTable:
+    """
+    Columnar table of the Restaurant Week menus: one row per (restaurant,
+    menu type, price), joined with each restaurant's cuisine and location.
+
+    `answer` handles the filter/sort questions the table can settle on its
+    own ("dinner menus under $45 in the West Village", "does Bobo have
+    lunch") and returns None for everything else, which goes to the RAG
+    chain. `describe` renders a restaurant's facts as one line of context.
+    """
+
+    def __init__(self, restaurants):
+        # restaurants: {name: {"cuisine", "location", "menus", "menu_types", "courses", "sections"}}
+        self.restaurants = dict(sorted(restaurants.items()))
+        self.names = list(self.restaurants)
+        self.cuisines = [facts.get("cuisine", "") for facts in self.restaurants.values()]
+        self.locations = [facts.get("location", "") for facts in self.restaurants.values()]
+
+        rows = [
+            (i, MENU_TYPES.index(menu_type) if menu_type else -1, price)
+            for i, facts in enumerate(self.restaurants.values())
+            for menu_type, price in facts["menus"]
+        ]
+        self.row_restaurant = np.array([row[0] for row in rows], dtype=np.int32)
+        self.row_menu_type = np.array([row[1] for row in rows], dtype=np.int8)
+        self.row_price = np.array([row[2] for row in rows], dtype=np.int16)
+        self.stats = {"answered": 0, "fallbacks": 0}
+
+    def __len__(self):
+        return len(self.row_price)
+
+    @classmethod
+    def from_documents(cls, texts, metadatas):
+        return cls.from_pages([(texts, metadatas)])
+
+    @classmethod
+    def from_pages(cls, pages):
+        """
+        Build from (texts, metadatas) pages. Each chunk is scanned as it
+        arrives, so only its small scan is kept, never its text.
+        """
+        scans = {}
+        for texts, metadatas in pages:
+            for text, meta in zip(texts, metadatas):
+                if meta and meta.get("restaurant_name"):
+                    entry = scans.setdefault(meta["restaurant_name"], (meta, []))
+                    entry[1].append(scan_menu_chunk(text))
+
+        restaurants = {}
+        for name, (meta, restaurant_scans) in scans.items():
+            restaurants[name] = {
+                "cuisine": meta.get("cuisine", ""),
+                "location": meta.get("location", ""),
+                **merge_menu_facts(restaurant_scans),
+            }
+        return cls(restaurants)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        # Cuisine and location come from the chunk metadata, i.e. the CSV
+        # columns ingest tagged every chunk with.
+        return cls.from_pages(
+            (page["documents"], page["metadatas"])
+            for page in iter_collection(vectorstore, ["documents", "metadatas"])
+        )
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": MENU_FACTS_VERSION, "restaurants": self.restaurants}, file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as file:
+            table = json.load(file)
+        if table.get("version") != MENU_FACTS_VERSION:
+            raise ValueError(f"Unsupported menu facts version {table.get('version')}")
+        return cls(table["restaurants"])
+
+    def describe(self, restaurant_name):
+        facts = self.restaurants.get(restaurant_name)
+        if facts is None or not (facts["menus"] or facts["courses"]):
+            return None
+        parts = [
+            f"{(menu_type or 'prix fixe').capitalize()} {format_price(price)}"
+            for menu_type, price in facts["menus"]
+        ]
+        if facts["courses"]:
+            courses = f"{facts['courses']} courses"
+            if facts["sections"]:
+                courses += f" ({', '.join(facts['sections'])})"
+            parts.append(courses)
+        return f"{restaurant_name} ({facts['cuisine']}, {facts['location']}): {'; '.join(parts)}"
+
+    def find(self, restaurants=(), cuisines=(), locations=(), menu_type=None, bounds=()):
+        """Row ids matching every given filter, cheapest first."""
+        mask = np.ones(len(self), dtype=bool)
+        for column, values in (
+            (self.names, restaurants),
+            (self.cuisines, cuisines),
+            (self.locations, locations),
+        ):
+            if values:
+                values = set(values)
+                wanted = [i for i, value in enumerate(column) if value in values]
+                mask &= np.isin(self.row_restaurant, wanted)
+        if menu_type is not None:
+            mask &= self.row_menu_type == MENU_TYPES.index(menu_type)
+        for op, price in bounds:
+            mask &= getattr(self.row_price, f"__{op}__")(price)
+
+        rows = np.flatnonzero(mask)
+        order = np.lexsort((self.row_restaurant[rows], self.row_price[rows]))
+        return rows[order]
+
+    def format_row(self, row):
+        i = int(self.row_restaurant[row])
+        menu_type = MENU_TYPES[self.row_menu_type[row]] if self.row_menu_type[row] >= 0 else None
+        return (
+            f"**{self.names[i]}** | **{self.locations[i]}** | **{self.cuisines[i]}** — "
+            f"{(menu_type or 'prix fixe').capitalize()} {format_price(int(self.row_price[row]))}"
+        )
+
+    def get_documents(self, restaurant_ids):
+        documents = []
+        for i in dict.fromkeys(restaurant_ids):
+            description = self.describe(self.names[i])
+            if description:
+                documents.append(
+                    Document(
+                        page_content=description,
+                        metadata={
+                            "restaurant_name": self.names[i],
+                            "cuisine": self.cuisines[i],
+                            "location": self.locations[i],
+                            "source": "menu_facts",
+                        },
+                    )
+                )
+        return documents
+
+    def _answer_yes_no(self, restaurants, menu_type):
+        lines = []
+        for name in restaurants:
+            facts = self.restaurants.get(name)
+            # Without any menu type in the text a "no" would be a guess.
+            if facts is None or not facts["menu_types"]:
+                return None
+            rows = self.find(restaurants=[name], menu_type=menu_type)
+            if len(rows):
+                lines.append(f"Yes. {self.format_row(rows[0])}")
+                lines += [self.format_row(row) for row in rows[1:]]
+            elif menu_type in facts["menu_types"]:
+                lines.append(f"Yes, **{name}** has a {menu_type} menu.")
+            else:
+                offered = " and ".join(facts["menu_types"])
+                lines.append(f"No, **{name}** only lists a {offered} menu for Restaurant Week.")
+        return lines
+
+    def answer(self, query_text, restaurant_index):
+        """
+        Answer `query_text` from the table, or return None to use the RAG
+        chain. The result has the chain's shape: question, context, answer.
+        """
+        result = self._answer(query_text, restaurant_index)
+        self.stats["answered" if result is not None else "fallbacks"] += 1
+        return result
+
+    def _answer(self, query_text, restaurant_index):
+        yes_no = next(
+            (match for match in (p.match(query_text) for p in YES_NO_PATTERNS) if match), None
+        )
+        if yes_no is None and NEEDS_MENU_TEXT.search(query_text):
+            return None
+
+        found = restaurant_index.analyze(query_text) if restaurant_index is not None else {}
+        restaurants = found.get("restaurant_name", [])
+        menu_types = [t.lower() for t in MENU_TYPE_PATTERN.findall(query_text)]
+        menu_type = menu_types[0] if len(set(menu_types)) == 1 else None
+        bounds = parse_price_bounds(query_text)
+        cheapest = CHEAPEST_PATTERN.search(query_text)
+        priciest = PRICIEST_PATTERN.search(query_text)
+
+        if yes_no is not None:
+            # "Is there a dinner menu at Bobo on Sunday" names more than a restaurant.
+            if restaurant_index is None:
+                return None
+            restaurants = sorted(restaurant_index.match_name(yes_no.group("restaurant")))
+            if not restaurants:
+                return None
+            lines = self._answer_yes_no(restaurants, yes_no.group("menu_type").lower())
+            restaurant_ids = [self.names.index(n) for n in restaurants if n in self.restaurants]
+        elif restaurants and not WHICH_RESTAURANTS_PATTERN.match(query_text):
+            # Anything else about a named restaurant ("what is on the dinner
+            # menu at Bobo") is about its menu text: the chain answers it.
+            return None
+        else:
+            filtered = restaurants or found.get("cuisine") or found.get("location")
+            # "which restaurants have brunch in Chelsea"
+            is_list = LIST_PATTERN.match(query_text) and menu_type and filtered
+            if not (bounds or cheapest or priciest or is_list):
+                return None
+            # "steakhouse in midtown for $60" must not lose "midtown" because
+            # the index does not know it; the chain still sees these facts
+            # as context for whichever restaurants it retrieves.
+            if unrecognized_words(query_text, restaurant_index):
+                return None
+            rows = self.find(
+                restaurants,
+                found.get("cuisine", []) if not restaurants else (),
+                found.get("location", []) if not restaurants else (),
+                menu_type,
+                bounds,
+            )
+            # No match may just be a menu the extractor could not read.
+            if not len(rows):
+                return None
+            if priciest:
+                rows = rows[::-1]
+            if cheapest or priciest:
+                best = self.row_price[rows[0]]
+                rows = rows[self.row_price[rows] == best]
+            more = len(rows) - MENU_FACTS_MAX_RESULTS
+            lines = [self.format_row(row) for row in rows[:MENU_FACTS_MAX_RESULTS]]
+            if more > 0:
+                lines.append(f"...and {more} more.")
+            restaurant_ids = [int(self.row_restaurant[row]) for row in rows[:MENU_FACTS_MAX_RESULTS]]
+
+        if not lines:
+            return None
+        return {
+            "question": query_text,
+            "context": self.get_documents(restaurant_ids),
+            "answer": "\n".join(lines) + "\n\nthanks for asking!",
+        }
+
+    def metrics(self):
+        return {
+            **self.stats,
+            "restaurants": len(self.restaurants),
+            "menus": len(self),
+        }
+
+
+def get_menu_facts_path(persist_directory):
+    return os.path.join(persist_directory, MENU_FACTS_FILE_NAME)
+
+
+def build_menu_facts(vectorstore, persist_directory):
+    start = time.perf_counter()
+    table = MenuFactsTable.from_vectorstore(vectorstore)
+    table.save(get_menu_facts_path(persist_directory))
+    print(
+        f"Built menu facts for {len(table.restaurants)} restaurants "
+        f"({len(table)} menus) in {time.perf_counter() - start:.2f}s"
+    )
+    return table
+
+
+def load_menu_facts(persist_directory):
+    path = get_menu_facts_path(persist_directory)
+    if not os.path.exists(path):
+        return None
+    return MenuFactsTable.load(path)
@@ -0,0 +1,390 @@
+import os
+import re
+import difflib
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from embedding import get_query_vector
+from executor import run_blocking
+from tracing import span
+
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", 4))
+FUZZY_MATCH_CUTOFF = float(os.getenv("FUZZY_MATCH_CUTOFF", 0.88))
+# Chunks per `vectorstore.get` call when an index is rebuilt from the
+# collection, so a build never holds every chunk and embedding at once.
+COLLECTION_PAGE_SIZE = int(os.getenv("COLLECTION_PAGE_SIZE", 256))
+
+# Words that never identify a restaurant on their own.
+STOPWORDS = {
+    "a", "an", "and", "at", "bar", "by", "cafe", "for", "grill", "in", "kitchen",
+    "menu", "menus", "of", "on", "restaurant", "the", "to", "what", "with",
+}
+
+# One-word restaurant names (or names once "The" is dropped) that are also
+# ordinary words, streets or places: "hearts of palm", "Dutch oven", "Fulton
+# St". They only name the restaurant with a second signal in the question.
+COMMON_NAME_WORDS = {
+    "alice", "dutch", "essex", "fulton", "gallery", "hearth", "independent", "iris",
+    "lafayette", "lido", "lore", "marseille", "maya", "monterey", "oceans", "palm",
+    "prohibition", "ribbon", "safari", "tong", "versa", "vino", "woo",
+}
+# "at Palm", "from the Gallery"
+NAME_CONTEXT_PATTERN = re.compile(r"\b(?:at|from|to|try|visit)\s+(?:the\s+)?$", re.I)
+# Capitalized, but not as a name: "Dutch restaurants", "Fulton St".
+DESCRIPTOR_PATTERN = re.compile(
+    r"\s+(?:restaurants?|food|cuisine|style|places?|spots?|st|street|ave|avenue)\b", re.I
+)
+
+# Extra spellings people use for neighborhoods in the CSV. A tuple maps an
+# umbrella name to every neighborhood it covers.
+LOCATION_ALIASES = {
+    "hells kitchen": "Hells Kitchen",
+    "hell s kitchen": "Hells Kitchen",
+    "times square": "Times Square/Theatre District",
+    "theater district": "Times Square/Theatre District",
+    "theatre district": "Times Square/Theatre District",
+    "seaport": "The Seaport",
+    "uws": "Upper West Side",
+    "ues": "Upper East Side",
+    "lic": "Long Island City",
+    "fidi": "Lower Manhattan",
+    "financial district": "Lower Manhattan",
+    "les": "Lower East Side",
+    "soho": "Soho",
+    "nomad": "Nomad",
+    "midtown": (
+        "Midtown East", "Midtown West", "Times Square/Theatre District", "Hells Kitchen",
+        "Garment District", "Herald Square", "Hudson Yards",
+    ),
+    "downtown": (
+        "Lower Manhattan", "Battery Park City", "The Seaport", "Tribeca", "Soho", "Noho",
+        "Nolita", "Little Italy", "Lower East Side", "East Village", "West Village",
+        "Greenwich Village", "Hudson Square", "Meatpacking District",
+    ),
+    "village": ("Greenwich Village", "West Village", "East Village"),
+    "uptown": (
+        "Upper East Side", "Upper West Side", "Harlem", "East Harlem", "Morningside Heights",
+        "Hamilton Heights", "Washington Heights",
+    ),
+    "brooklyn": (
+        "Bay Ridge", "Boerum Hill", "Bushwick", "Carroll Gardens", "Cobble Hill",
+        "Downtown Brooklyn", "Greenpoint", "Park Slope", "Prospect Heights", "Red Hook",
+        "Williamsburg",
+    ),
+    "queens": (
+        "Astoria", "Bayside", "East Elmhurst", "Elmhurst", "Flushing", "Forest Hills",
+        "Jackson Heights", "Little Neck", "Long Island City",
+    ),
+}
+
+
+def normalize_name(text):
+    # Fold accents (Anār -> anar), drop punctuation and collapse whitespace.
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[’']", "", text.lower())
+    text = re.sub(r"[^a-z0-9$]+", " ", text)
+    return " ".join(text.split())
+
+
+def get_name_aliases(restaurant_name):
+    # "Bocca Di Bacco—Chelsea" is also asked about as "Bocca Di Bacco",
+    # and "The Frying Pan" as "Frying Pan".
+    name = normalize_name(restaurant_name)
+    aliases = {name}
+    base = re.split(r"\s*(?:—|–| - )\s*", restaurant_name)[0]
+    if base != restaurant_name:
+        aliases.add(normalize_name(base))
+    for alias in list(aliases):
+        if alias.startswith("the "):
+            aliases.add(alias[4:])
+    return {alias for alias in aliases if alias and alias not in STOPWORDS}
+
+
+def has_name_signal(query_text, word):
+    """
+    Whether `word` reads as a name in `query_text`: capitalized after the
+    first word, possessive, or after "at"/"from".
+    """
+    for match in re.finditer(rf"\b{re.escape(word)}\b", query_text, re.I):
+        before = query_text[: match.start()]
+        after = query_text[match.end() :]
+        if match.group()[0].isupper() and before.strip() and not DESCRIPTOR_PATTERN.match(after):
+            return True
+        if NAME_CONTEXT_PATTERN.search(before) or re.match(r"['’]s\b", after):
+            return True
+    return False
+
+
+def get_cuisine_keywords(cuisine):
+    # "Japanese / Sushi" -> japanese sushi, "American (New)" -> american (new)
+    keywords = {normalize_name(cuisine)}
+    for part in re.split(r"[/()]", cuisine):
+        part = normalize_name(part)
+        if part and part not in {"new", "traditional"}:
+            keywords.add(part)
+    return keywords
+
+
+def iter_collection(vectorstore, include, page_size=COLLECTION_PAGE_SIZE):
+    """Yield the whole collection as `vectorstore.get` results of `page_size` chunks."""
+    offset = 0
+    while True:
+        page = vectorstore.get(include=include, limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+def count_chunks(vectorstore):
+    collection = getattr(vectorstore, "_collection", None)
+    if collection is not None:
+        return collection.count()
+    return len(vectorstore)
+
+
+def embed_query(vectorstore, query):
+    with span("embed_query"):
+        return get_query_vector(vectorstore.embeddings, query)
+
+
+def search_by_vector(vectorstore, vector, k, where=None, **kwargs):
+    # Embedding the query separately lets a filtered search and its
+    # unfiltered fallback share one embedding call.
+    with span("vector_search"):
+        if where is None:
+            return vectorstore.similarity_search_by_vector(vector, k=k, **kwargs)
+        return vectorstore.similarity_search_by_vector(vector, k=k, filter=where, **kwargs)
+
+
+class RestaurantIndex:
+    """
+    In-memory lookup of restaurant names, cuisines and neighborhoods.
+
+    `analyze` finds the ones mentioned in a question (exactly, or fuzzily for
+    longer names) so retrieval can be restricted with a Chroma `where` filter.
+    """
+
+    def __init__(self, records):
+        self.restaurants = {}
+        # One-word aliases from COMMON_NAME_WORDS, which need `has_name_signal`.
+        self.common_word_restaurants = {}
+        self.cuisines = {}
+        self.locations = {}
+
+        for record in records:
+            restaurant_name = record["restaurant_name"].strip()
+            cuisine = record["cuisine"].strip()
+            location = record["location"].strip()
+
+            for alias in get_name_aliases(restaurant_name):
+                table = (
+                    self.common_word_restaurants
+                    if alias in COMMON_NAME_WORDS
+                    else self.restaurants
+                )
+                table.setdefault(alias, set()).add(restaurant_name)
+            for keyword in get_cuisine_keywords(cuisine):
+                self.cuisines.setdefault(keyword, set()).add(cuisine)
+            self.locations.setdefault(normalize_name(location), set()).add(location)
+
+        known_locations = set().union(*self.locations.values())
+        for alias, locations in LOCATION_ALIASES.items():
+            if isinstance(locations, str):
+                locations = (locations,)
+            for location in locations:
+                if location in known_locations:
+                    self.locations.setdefault(alias, set()).add(location)
+
+        keys = [*self.restaurants, *self.cuisines, *self.locations]
+        self.max_ngram = max((len(key.split()) for key in keys), default=1)
+
+        self._fuzzy_candidates = {}
+        for alias in self.restaurants:
+            if len(alias) >= 5:
+                self._fuzzy_candidates.setdefault(len(alias.split()), []).append(alias)
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        df = pd.read_csv(csv_path)
+        records = [
+            {
+                "restaurant_name": row["headline"],
+                "cuisine": row["cuisine"],
+                "location": row["location"],
+            }
+            for row in df.to_dict(orient="records")
+            if isinstance(row["headline"], str)
+        ]
+        return cls(records)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        # The Lambda image ships ./db but not the CSV; the chunk metadata has
+        # the same three fields.
+        unique = {
+            (meta["restaurant_name"], meta["cuisine"], meta["location"])
+            for page in iter_collection(vectorstore, ["metadatas"])
+            for meta in page["metadatas"]
+            if meta and "restaurant_name" in meta
+        }
+        return cls(
+            {"restaurant_name": name, "cuisine": cuisine, "location": location}
+            for name, cuisine, location in unique
+        )
+
+    def _match(self, table, ngrams, fuzzy):
+        matches = set()
+        for ngram in ngrams:
+            if ngram in table:
+                matches |= table[ngram]
+        if matches or not fuzzy:
+            return matches
+
+        # Fuzzy matching only for longer phrases, so "bar" never fuzzes into
+        # "Barn", and only against names with the same number of words.
+        for ngram in ngrams:
+            if len(ngram) < 5 or ngram in STOPWORDS:
+                continue
+            candidates = self._fuzzy_candidates.get(len(ngram.split()), [])
+            for key in difflib.get_close_matches(
+                ngram, candidates, n=1, cutoff=FUZZY_MATCH_CUTOFF
+            ):
+                matches |= table[key]
+        return matches
+
+    def _find(self, table, words):
+        """
+        Exact matches of `table` keys in `words`, longest first. Words inside
+        a longer match are not matched again, so "west village" is not also
+        the "village" umbrella.
+        """
+        matches = set()
+        covered = set()
+        for n in range(min(self.max_ngram, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                if covered.intersection(range(i, i + n)):
+                    continue
+                ngram = " ".join(words[i : i + n])
+                if ngram in table:
+                    matches |= table[ngram]
+                    covered.update(range(i, i + n))
+        return matches
+
+    def analyze(self, query_text):
+        """Return the restaurants, cuisines and locations mentioned in `query_text`."""
+        words = normalize_name(query_text).split()
+
+        restaurants = self._find(self.restaurants, words)
+        lowered = query_text.lower()
+        for word, names in self.common_word_restaurants.items():
+            # The raw text, since normalizing turns "Palm's" into "palms".
+            if word in lowered and has_name_signal(query_text, word):
+                restaurants |= names
+        if not restaurants:
+            ngrams = [
+                " ".join(words[i : i + n])
+                for n in range(self.max_ngram, 0, -1)
+                for i in range(len(words) - n + 1)
+            ]
+            restaurants = self._match(self.restaurants, ngrams, fuzzy=True)
+        cuisines = self._find(self.cuisines, words)
+        locations = self._find(self.locations, words)
+        return {
+            "restaurant_name": sorted(restaurants),
+            "cuisine": sorted(cuisines),
+            "location": sorted(locations),
+        }
+
+    def remove_mentions(self, text):
+        """The words of `text` left once every known name, cuisine and neighborhood is removed."""
+        words = normalize_name(text).split()
+        tables = (self.restaurants, self.cuisines, self.locations)
+        # Longest first, so "west village" goes as a neighborhood, not "village".
+        for n in range(min(self.max_ngram, len(words)), 0, -1):
+            i = 0
+            while i + n <= len(words):
+                ngram = " ".join(words[i : i + n])
+                if any(ngram in table for table in tables):
+                    del words[i : i + n]
+                else:
+                    i += 1
+        return words
+
+    def match_name(self, text):
+        """The restaurants `text` names in full (exactly, or fuzzily), else an empty set."""
+        name = normalize_name(text)
+        if name.startswith("the "):
+            name = name[4:]
+        # The caller already knows `text` is meant as a name ("does Palm have lunch").
+        if name in self.common_word_restaurants:
+            return set(self.common_word_restaurants[name])
+        return self._match(self.restaurants, [name], fuzzy=True)
+
+    def get_filter(self, query_text):
+        """Translate `analyze` into a Chroma `where` filter, or None if nothing matched."""
+        found = self.analyze(query_text)
+
+        # A named restaurant already implies its cuisine and location.
+        if found["restaurant_name"]:
+            fields = ["restaurant_name"]
+        else:
+            fields = [field for field in ("cuisine", "location") if found[field]]
+
+        clauses = []
+        for field in fields:
+            values = found[field]
+            clauses.append({field: values[0] if len(values) == 1 else {"$in": values}})
+
+        if not clauses:
+            return None
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
+
+
+class MetadataFilteredRetriever(BaseRetriever):
+    """
+    Vector search restricted to the restaurants, cuisines or neighborhoods
+    named in the question. Falls back to the whole collection when the
+    question names none of them or the filtered search comes back empty.
+    """
+
+    vectorstore: Any
+    index: Any
+    k: int = RETRIEVER_K
+    search_kwargs: Dict[str, Any] = {}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        with span("query_analysis"):
+            where: Optional[dict] = self.index.get_filter(query)
+        vector = embed_query(self.vectorstore, query)
+        if where is not None:
+            documents = search_by_vector(
+                self.vectorstore, vector, self.k, where, **self.search_kwargs
+            )
+            if documents:
+                return documents
+        return search_by_vector(self.vectorstore, vector, self.k, **self.search_kwargs)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Chroma is synchronous; keep it on the bounded blocking-I/O pool.
+        return await run_blocking(
+            self._get_relevant_documents, query, run_manager=run_manager.get_sync()
+        )
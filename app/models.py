@@ -1,32 +1,37 @@
-import os
 import time
 import uuid
-import boto3
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
-TABLE_NAME = os.getenv('TABLE_NAME')
+from storage import get_storage_backend
+from tracing import span
 
 # Define request and response models
 class QueryRequest(BaseModel):
     query_text: str
 
 
+class SourceRef(BaseModel):
+    # Points at a chunk in the vectorstore instead of copying its text.
+    chunk_id: str
+    score: Optional[float] = None
+    metadata: Dict[str, str] = Field(default_factory=dict)
+
+
 class QueryResult(BaseModel):
     query_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
     create_time: int = Field(default_factory=lambda: int(time.time()))
     query_text: str
     answer_text: Optional[str] = None
+    # Chunk text; only filled for sources without a chunk_id, or when the
+    # client asks for expanded sources.
     sources: List[str] = Field(default_factory=list)
+    source_refs: List[SourceRef] = Field(default_factory=list)
     is_complete: bool = False
+    # Per-stage timings and counters, returned with ?debug=true; never stored.
+    debug: Optional[Dict[str, Any]] = None
 
     
-    @classmethod
-    def get_table(cls):
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table(TABLE_NAME)
-        return table
-    
     def to_dict(self):
         # This will work with both v1 and v2
         try:
@@ -41,17 +46,42 @@ class QueryResult(BaseModel):
             'query_text': self.query_text,
             'answer_text': self.answer_text,
             'sources': self.sources,
+            'source_refs': [ref.dict(exclude_none=True) for ref in self.source_refs],
             'is_complete': self.is_complete
         }
 
+    def set_sources(self, documents):
+        # Store references to the retrieved chunks; the text is resolved from
+        # the local chunk store only when a client asks for it.
+        self.sources = []
+        self.source_refs = []
+        for doc in documents:
+            if not doc.page_content:
+                continue
+            chunk_id = doc.metadata.get('chunk_id')
+            if chunk_id is None:
+                self.sources.append(doc.page_content)
+                continue
+            self.source_refs.append(
+                SourceRef(
+                    chunk_id=chunk_id,
+                    score=doc.metadata.get('rerank_score', doc.metadata.get('score')),
+                    metadata={
+                        key: str(doc.metadata[key])
+                        for key in ('restaurant_name', 'cuisine', 'location')
+                        if key in doc.metadata
+                    },
+                )
+            )
+
 
 
     def put_item_into_table(self):
-        table = self.get_table()
         item = self.get_items()
 
         try:
-            table.put_item(Item=item)
+            with span('persist'):
+                get_storage_backend().put(item)
             print('Successfully put item into table.')
         except Exception as e:
             print(f"Failed to put item into table: {e}")
@@ -60,23 +90,45 @@ class QueryResult(BaseModel):
         return True
     
 
+    @classmethod
+    def batch_put(cls, results):
+        items = [result.get_items() for result in results]
+
+        try:
+            with span('persist'):
+                get_storage_backend().batch_put(items)
+            print(f'Successfully put {len(items)} items into table.')
+        except Exception as e:
+            print(f"Failed to put items into table: {e}")
+            return False
+
+        return True
+
     @classmethod
     def get_item_from_table(cls, query_id):
-        table = cls.get_table()
-        
         try:
-            response = table.get_item(Key={'query_id': query_id})
+            with span('load'):
+                item = get_storage_backend().get(query_id)
 
         except Exception as e:
             print(f"Failed to get item from table: {e}")
             return None
         
-        if 'Item' not in response:
+        if item is None:
             return None
         
 
         else:
-            item = response['Item']
             return cls(**item)
 
-                                           
\ No newline at end of file
+    @classmethod
+    def batch_get(cls, query_ids):
+        # Returns {query_id: QueryResult} for the ids that exist.
+        try:
+            with span('load'):
+                items = get_storage_backend().batch_get(query_ids)
+        except Exception as e:
+            print(f"Failed to get items from table: {e}")
+            return {}
+
+        return {query_id: cls(**item) for query_id, item in items.items()}
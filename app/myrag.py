@@ -1,84 +1,24 @@
 import os
-import pandas as pd
-import requests
-import re
 import sys
 import shutil
-import pickle
-from langchain import hub
-from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_community.document_loaders import UnstructuredPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+import contextlib
+import threading
 from models import QueryResult
+from executor import run_blocking
+from tracing import incr, span, TRACING_ENABLED
 
 # Set the OCR_AGENT environment variable
 os.environ["OCR_AGENT"] = "pytesseract"
 
 IS_USING_IMAGE_RUNTIME = bool(os.getenv("IS_USING_IMAGE_RUNTIME", False))
-
-
-def sanitize_string(input_string):
-    # Remove special characters
-    sanitized = re.sub(r"[^a-zA-Z0-9\s]", "", input_string.strip())
-    # Convert to lowercase
-    sanitized = sanitized.lower()
-    # Replace spaces with hyphens
-    sanitized = sanitized.replace(" ", "-")
-    return sanitized
-
-
-def download_pdfs_from_csv(csv_path, download_folder):
-    # Read the CSV file
-    df = pd.read_csv(csv_path)
-
-    # Iterate over each row in the DataFrame
-    name_2_path = {}
-    for index, row in df.iterrows():
-        restaurant_name = row["headline"]
-        menu_url = row["menu_url"]
-
-        # Generate a sanitized file name
-        file_name = f"{sanitize_string(restaurant_name)}.pdf"
-        file_path = os.path.join(download_folder, file_name)
-
-        # Download the PDF
-        try:
-            response = requests.get(menu_url)
-            response.raise_for_status()  # Check if the request was successful
-
-            # Save the PDF to the specified folder
-            with open(file_path, "wb") as file:
-                file.write(response.content)
-            print(f"Downloaded {file_name} successfully.")
-            name_2_path[restaurant_name] = file_path
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to download {file_name}: {e}")
-
-    df["file_path"] = df["headline"].map(name_2_path)
-    df.to_csv("restaurant_menu_pdf.csv", index=False)
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo-0125")
+# Upper bound on chain runs (and so OpenAI requests) in flight for one batch.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
 
 
 # Example usage
 csv_path = "app/restaurant_menu_urls.csv"  # Path to your CSV file
 download_folder = "menu_urls"  # Folder to save the downloaded PDFs
-
-
-if not os.path.exists(download_folder) and not IS_USING_IMAGE_RUNTIME:
-    os.makedirs(download_folder)
-    print(f"Created folder: {download_folder}")
-
-    # Download the PDFs
-    download_pdfs_from_csv(csv_path, download_folder)
-
-else:
-    print(f"Folder already exists: {download_folder}")
-
-
-embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
 persist_directory = "./db"
 
 
@@ -105,8 +45,10 @@ def copy_chroma_to_tmp(CHROMA_PATH=persist_directory):
     return dst_chroma_path
 
 
-if os.path.exists(persist_directory) and os.listdir(persist_directory):
+def open_persisted_chroma(embedding_function):
+    from langchain_community.vectorstores import Chroma
 
+    chroma_path = persist_directory
     # Hack needed for AWS Lambda's base Python image (to work with an updated version of SQLite).
     # In Lambda runtime, we need to copy ChromaDB to /tmp so it can have write permissions.
     if IS_USING_IMAGE_RUNTIME:
@@ -114,90 +56,14 @@ if os.path.exists(persist_directory) and os.listdir(persist_directory):
         sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
 
         # move the file to /tmp and return the new path
-        persist_directory = copy_chroma_to_tmp()
-
-    print("Loading existing vectorstore...")
-    vectorstore = Chroma(
-        persist_directory=persist_directory, embedding_function=embeddings
-    )
-else:
-    print("Creating new vectorstore...")
-    # Load PDFs using langchain_community.document_loaders
-    print("Loading data...")
-
-    all_documents = []
-
-    df = pd.read_csv("restaurant_menu_pdf.csv")
-
-    for data in df.to_dict(orient="records"):
-        fn = data["file_path"]
-        if not fn or pd.isna(fn):
-            continue
-
-        cuisine = data["cuisine"]
-        restaurant_name = data["headline"]
-        location = data["location"]
-        if restaurant_name.strip() == "Bar Goyana":
-            print("skipping goyana")
-        loader = PyMuPDFLoader(fn)
-        print("Loading raw document..." + loader.file_path)
-        raw_documents = loader.load()
-
-        print("Splitting text...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            separators=[
-                "\n\n",
-                "\n",
-                " ",
-                ".",
-                ",",
-                "\u200b",  # Zero-width space
-                "\uff0c",  # Fullwidth comma
-                "\u3001",  # Ideographic comma
-                "\uff0e",  # Fullwidth full stop
-                "\u3002",  # Ideographic full stop
-                "",
-            ],
-            chunk_size=800,
-            chunk_overlap=100,
-            length_function=len,
-        )
-        documents = text_splitter.split_documents(raw_documents)
-
-        #  add metadata
-        for doc in documents:
-
-            meta_dict = {
-                "cuisine": cuisine.strip(),
-                "restaurant_name": restaurant_name.strip(),
-                "location": location.strip(),
-            }
-            doc.metadata = meta_dict
-
-            doc.page_content += str(meta_dict) + "\n"
-
-        all_documents.extend(documents)
-
-    vectorstore = Chroma.from_documents(
-        all_documents, embeddings, persist_directory=persist_directory
-    )
-    if not os.path.exists(persist_directory) or not os.listdir(persist_directory):
-        vectorstore.persist()
-
-
-retriever = vectorstore.as_retriever()
-from langchain_openai import ChatOpenAI
-
-llm = ChatOpenAI(model="gpt-3.5-turbo-0125")
-prompt = hub.pull("rlm/rag-prompt")
+        chroma_path = copy_chroma_to_tmp()
+    return Chroma(persist_directory=chroma_path, embedding_function=embedding_function)
 
 
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
 
 
-from langchain_core.prompts import PromptTemplate
-
 template = """Use the following pieces of context to answer the question at the end.
 If you don't know the answer, just say that you don't know, don't try to make up an answer.
 when you answer the question,
@@ -235,33 +101,429 @@ Always say "thanks for asking!" at the end of the answer.
 Question: {question}
 
 Helpful Answer:"""
-custom_rag_prompt = PromptTemplate.from_template(template)
 
-rag_chain_from_docs = (
-    RunnablePassthrough.assign(context=(lambda x: format_docs(x["context"])))
-    | custom_rag_prompt
-    | llm
-    | StrOutputParser()
-)
 
-rag_chain_with_source = RunnableParallel(
-    {"context": retriever, "question": RunnablePassthrough()}
-).assign(answer=rag_chain_from_docs)
+class RagService:
+    """
+    The retrieval + LLM stack behind `query_rag`.
+
+    Building it downloads missing menus, opens (or builds) the vector store and
+    creates the model clients, so it is only constructed on first use through
+    `get_rag_service()`, or ahead of traffic through `warm_up()`. Passing a
+    `retriever` and/or `llm` skips building them (used by benchmarks and tests).
+    """
+
+    def __init__(self, retriever=None, llm=None):
+        # Heavy imports live here so importing this module stays cheap.
+        from langchain_core.output_parsers import StrOutputParser
+        from langchain_core.prompts import PromptTemplate
+        from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+        from answer_cache import (
+            AnswerCache,
+            ANSWER_CACHE_ENABLED,
+            ANSWER_CACHE_SEMANTIC,
+        )
+        from coalesce import SingleFlight, COALESCING_ENABLED
+        from context import ContextAssembler
+        from callbacks import TracingCallbackHandler
+
+        self.embeddings = None
+        self.vectorstore = None
+        self.lexical_index = None
+        self.restaurant_index = None
+        self.menu_facts = None
+        self._chunk_positions = None
+        self.retriever = retriever if retriever is not None else self.build_retriever()
+
+        if llm is None:
+            from langchain_openai import ChatOpenAI
+
+            llm = ChatOpenAI(model=LLM_MODEL)
+        self.llm = llm
+        custom_rag_prompt = PromptTemplate.from_template(template)
+
+        # Drops overlap and repeated metadata, then packs to a token budget.
+        self.context_assembler = ContextAssembler()
+
+        self.rag_chain_from_docs = (
+            RunnablePassthrough.assign(context=(lambda x: self.format_context(x["context"])))
+            | custom_rag_prompt
+            | self.llm
+            | StrOutputParser()
+        )
 
+        self.rag_chain_with_source = RunnableParallel(
+            {"context": self.retriever, "question": RunnablePassthrough()}
+        ).assign(answer=self.rag_chain_from_docs)
+
+        self.answer_cache = None
+        if ANSWER_CACHE_ENABLED:
+            semantic = ANSWER_CACHE_SEMANTIC and self.embeddings is not None
+            self.answer_cache = AnswerCache(
+                embeddings=self.embeddings if semantic else None,
+                restaurant_index=self.restaurant_index,
+            )
+
+        # Times the retriever and LLM calls of every chain run into the request's trace.
+        self.chain_config = (
+            {"callbacks": [TracingCallbackHandler()]} if TRACING_ENABLED else {}
+        )
 
-# Function to ask questions
-def ask_question(question):
-    print("Answer:\n\n", end=" ", flush=True)
-    ans = rag_chain_with_source.invoke(question)
+        # Identical questions in flight at the same time share one chain run.
+        self.single_flight = SingleFlight() if COALESCING_ENABLED else None
+
+    def build_retriever(self):
+        from langchain_community.embeddings import OpenAIEmbeddings
+        from downloader import download_pdfs_from_csv
+        from ingest import sync_vectorstore, MENU_CSV_PATH
+        from embedding import CachedEmbeddings
+        from metadata_index import RestaurantIndex, MetadataFilteredRetriever
+        from lexical import (
+            HybridRetriever,
+            HYBRID_RETRIEVAL,
+            build_lexical_index,
+            load_lexical_index,
+        )
+        from rerank import RerankingRetriever, RERANK_ENABLED, RERANK_FETCH_K, get_scorer
+        from vector_index import load_vector_index, VECTOR_STORE
+        from menu_facts import MENU_FACTS_ENABLED, build_menu_facts, load_menu_facts
+
+        if not os.path.exists(download_folder) and not IS_USING_IMAGE_RUNTIME:
+            os.makedirs(download_folder)
+            print(f"Created folder: {download_folder}")
+
+            # Download the PDFs
+            download_pdfs_from_csv(csv_path, download_folder)
+
+        else:
+            print(f"Folder already exists: {download_folder}")
+
+        self.embeddings = OpenAIEmbeddings(api_key=os.getenv("OPENAI_API_KEY"))
+        self.persist_directory = persist_directory
+
+        # The read-only NumPy index is a memory map of ./db: no pysqlite3 swap,
+        # no copy to /tmp and no Chroma client on a cold start. An index saved
+        # without float32 vectors opens Chroma on its first rescore.
+        if VECTOR_STORE != "chroma":
+            self.vectorstore = load_vector_index(
+                persist_directory,
+                self.embeddings,
+                open_vectorstore=lambda: open_persisted_chroma(self.embeddings),
+            )
+            if self.vectorstore is not None:
+                print(f"Loaded NumPy vector index ({len(self.vectorstore)} chunks)")
+            elif VECTOR_STORE == "numpy":
+                raise FileNotFoundError(
+                    f"No NumPy vector index in {persist_directory}; run ingest first."
+                )
+
+        if self.vectorstore is None:
+            from langchain_community.vectorstores import Chroma
+
+            if os.path.exists(persist_directory) and os.listdir(persist_directory):
+                print("Loading existing vectorstore...")
+                self.vectorstore = open_persisted_chroma(self.embeddings)
+                self.persist_directory = get_runtime_chroma_path()
+            else:
+                print("Creating new vectorstore...")
+                self.vectorstore = Chroma(
+                    persist_directory=self.persist_directory,
+                    embedding_function=CachedEmbeddings(self.embeddings),
+                )
+                # Only menus missing from the collection are parsed and embedded.
+                sync_vectorstore(self.vectorstore, self.persist_directory)
+
+        # Questions naming a restaurant, cuisine or neighborhood only search those chunks.
+        if os.path.exists(MENU_CSV_PATH):
+            self.restaurant_index = RestaurantIndex.from_csv(MENU_CSV_PATH)
+        else:
+            self.restaurant_index = RestaurantIndex.from_vectorstore(self.vectorstore)
+
+        # Prices and lunch/dinner menus extracted at ingest: price and menu-type
+        # questions are answered from them, and they lead the LLM's context.
+        if MENU_FACTS_ENABLED:
+            self.menu_facts = load_menu_facts(self.persist_directory)
+            if self.menu_facts is None:
+                self.menu_facts = build_menu_facts(self.vectorstore, self.persist_directory)
+
+        # With reranking, over-fetch candidates and let the reranker keep the best few.
+        k_kwargs = {"k": RERANK_FETCH_K} if RERANK_ENABLED else {}
+
+        if HYBRID_RETRIEVAL:
+            # Dense search misses exact tokens like dish names and "$45"; fuse in BM25.
+            self.lexical_index = load_lexical_index(self.persist_directory)
+            if self.lexical_index is None:
+                self.lexical_index = build_lexical_index(
+                    self.vectorstore, self.persist_directory
+                )
+            retriever = HybridRetriever(
+                vectorstore=self.vectorstore,
+                lexical_index=self.lexical_index,
+                index=self.restaurant_index,
+                **k_kwargs,
+            )
+        else:
+            retriever = MetadataFilteredRetriever(
+                vectorstore=self.vectorstore, index=self.restaurant_index, **k_kwargs
+            )
+
+        if RERANK_ENABLED:
+            return RerankingRetriever(base_retriever=retriever, scorer=get_scorer())
+        return retriever
+
+    def get_chunk_texts(self, chunk_ids):
+        """Map chunk ids to their text, from the BM25 index when loaded, else Chroma."""
+        if self.lexical_index is not None:
+            if self._chunk_positions is None:
+                self._chunk_positions = {
+                    chunk_id: i for i, chunk_id in enumerate(self.lexical_index.ids)
+                }
+            return {
+                chunk_id: self.lexical_index.texts[self._chunk_positions[chunk_id]]
+                for chunk_id in chunk_ids
+                if chunk_id in self._chunk_positions
+            }
+        if self.vectorstore is not None and chunk_ids:
+            result = self.vectorstore.get(ids=list(chunk_ids), include=["documents"])
+            return dict(zip(result["ids"], result["documents"]))
+        return {}
+
+    def format_context(self, documents):
+        context = self.context_assembler.format(documents)
+        if self.menu_facts is None:
+            return context
+        facts = [
+            self.menu_facts.describe(name)
+            for name in dict.fromkeys(doc.metadata.get("restaurant_name") for doc in documents)
+        ]
+        facts = [line for line in facts if line]
+        if not facts:
+            return context
+        # Pre-structured prices and menu types, so Rules 2 and 3 need no digging.
+        return "Menu facts:\n" + "\n".join(facts) + "\n\n" + context
+
+    def answer_from_facts(self, query_text):
+        """The menu facts table's answer to `query_text`, or None to run the chain."""
+        if self.menu_facts is None:
+            return None
+        with span("menu_facts"):
+            answer = self.menu_facts.answer(query_text, self.restaurant_index)
+        if answer is not None:
+            incr("menu_facts_answers")
+        return answer
+
+    def cache_get(self, query_text):
+        if self.answer_cache is None:
+            return None
+        with span("answer_cache"):
+            cached = self.answer_cache.get(query_text)
+        incr("answer_cache_hits" if cached is not None else "answer_cache_misses")
+        return cached
+
+    def cache_put(self, query_text, answer):
+        if self.answer_cache is not None:
+            with span("answer_cache"):
+                self.answer_cache.put(query_text, answer)
+
+    def cached_query_vector(self, query_text):
+        """
+        Serve the retrievers the query embedding a semantic cache miss already
+        computed, so an uncached question is embedded once rather than twice.
+        """
+        from embedding import use_query_vectors
+
+        vector = None
+        if self.answer_cache is not None:
+            vector = self.answer_cache.pending_vector(query_text)
+        if vector is None:
+            return contextlib.nullcontext()
+        return use_query_vectors({query_text: vector.tolist()})
+
+    # Function to ask questions
+    def ask_question(self, question):
+        print("Answer:\n\n", end=" ", flush=True)
+        ans = self.rag_chain_with_source.invoke(question, config=self.chain_config)
+
+        return ans
+
+    def query_rag(self, query_text):
+        answer = self.answer_from_facts(query_text)
+        if answer is not None:
+            return answer
+
+        cached = self.cache_get(query_text)
+        if cached is not None:
+            return cached
+
+        # Get the answer and fill in the QueryResult object
+        with self.cached_query_vector(query_text):
+            answer = self.ask_question(query_text)
+
+        self.cache_put(query_text, answer)
+        return answer
+
+    async def aquery_rag(self, query_text):
+        if self.single_flight is not None:
+            return await self.single_flight.do(query_text, self._aquery_rag, query_text)
+        return await self._aquery_rag(query_text)
+
+    async def _aquery_rag(self, query_text):
+        answer = self.answer_from_facts(query_text)
+        if answer is not None:
+            return answer
+
+        # A semantic lookup may embed the query; keep it off the event loop.
+        cached = await run_blocking(self.cache_get, query_text)
+        if cached is not None:
+            return cached
+
+        with self.cached_query_vector(query_text):
+            answer = await self.rag_chain_with_source.ainvoke(
+                query_text, config=self.chain_config
+            )
+
+        await run_blocking(self.cache_put, query_text, answer)
+        return answer
+
+    async def abatch_query_rag(self, query_texts, max_concurrency=LLM_MAX_CONCURRENCY):
+        """
+        Answer many queries at once through `abatch`. Returns one result per
+        query, in order; a failed query yields its exception instead of a dict.
+
+        Every question is embedded in a single embeddings request first, and
+        the cache lookups and retrievers reuse those vectors.
+        """
+        from embedding import use_query_vectors
+
+        vectors = {}
+        unique_texts = list(dict.fromkeys(query_texts))
+        if self.embeddings is not None and unique_texts:
+            with span("embed_queries"):
+                vectors = dict(zip(
+                    unique_texts,
+                    await run_blocking(self.embeddings.embed_documents, unique_texts),
+                ))
+
+        with use_query_vectors(vectors):
+            return await self._abatch_query_rag(query_texts, max_concurrency)
+
+    async def _abatch_query_rag(self, query_texts, max_concurrency):
+        answers = [None] * len(query_texts)
+        pending = []
+        for i, query_text in enumerate(query_texts):
+            answers[i] = self.answer_from_facts(query_text)
+            if answers[i] is None:
+                answers[i] = await run_blocking(self.cache_get, query_text)
+            if answers[i] is None:
+                pending.append(i)
+
+        if pending:
+            results = await self.rag_chain_with_source.abatch(
+                [query_texts[i] for i in pending],
+                config={**self.chain_config, "max_concurrency": max_concurrency},
+                return_exceptions=True,
+            )
+            for i, result in zip(pending, results):
+                answers[i] = result
+                if not isinstance(result, Exception):
+                    await run_blocking(self.cache_put, query_texts[i], result)
+        return answers
+
+    def stream_rag(self, query_text):
+        """
+        Yield ("sources", documents) once retrieval is done, then ("token", text)
+        for each piece of the answer as the LLM produces it.
+        """
+        cached = self.answer_from_facts(query_text) or self.cache_get(query_text)
+        if cached is not None:
+            yield "sources", cached["context"]
+            yield "token", cached["answer"]
+            return
+
+        with self.cached_query_vector(query_text):
+            context = self.retriever.invoke(query_text, config=self.chain_config)
+        yield "sources", context
+
+        answer = ""
+        for chunk in self.rag_chain_from_docs.stream(
+            {"context": context, "question": query_text}, config=self.chain_config
+        ):
+            answer += chunk
+            yield "token", chunk
+
+        self.cache_put(
+            query_text,
+            {"question": query_text, "context": context, "answer": answer},
+        )
+
+
+_rag_service = None
+_rag_service_lock = threading.Lock()
+
+
+def get_rag_service():
+    global _rag_service
+    if _rag_service is None:
+        with _rag_service_lock:
+            if _rag_service is None:
+                _rag_service = RagService()
+    return _rag_service
+
+
+def warm_up():
+    # Build the RAG stack ahead of the first query (e.g. from a scheduled ping).
+    get_rag_service()
 
-    return ans
+
+def get_metrics():
+    # Reported only once the service exists; asking must not build it.
+    service = _rag_service
+    if service is None:
+        return {}
+    metrics = {}
+    if service.single_flight is not None:
+        metrics["coalescing"] = service.single_flight.metrics()
+    if service.answer_cache is not None:
+        metrics["answer_cache"] = service.answer_cache.metrics()
+    metrics["context"] = service.context_assembler.metrics()
+    if service.menu_facts is not None:
+        metrics["menu_facts"] = service.menu_facts.metrics()
+    return metrics
+
+
+def expand_sources(query_result):
+    """Fill `query_result.sources` with the text of its `source_refs`."""
+    texts = get_rag_service().get_chunk_texts(
+        [ref.chunk_id for ref in query_result.source_refs]
+    )
+    query_result.sources = query_result.sources + [
+        texts[ref.chunk_id] for ref in query_result.source_refs if ref.chunk_id in texts
+    ]
+    return query_result
+
+
+def ask_question(question):
+    return get_rag_service().ask_question(question)
 
 
 def query_rag(query_text):
-    # Get the answer and fill in the QueryResult object
-    answer = ask_question(query_text)
+    return get_rag_service().query_rag(query_text)
+
+
+def stream_rag(query_text):
+    return get_rag_service().stream_rag(query_text)
+
+
+async def aquery_rag(query_text):
+    # The first call builds the service, which blocks; do it off the event loop.
+    service = await run_blocking(get_rag_service)
+    return await service.aquery_rag(query_text)
+
+
+async def abatch_query_rag(query_texts, max_concurrency=LLM_MAX_CONCURRENCY):
+    service = await run_blocking(get_rag_service)
+    return await service.abatch_query_rag(query_texts, max_concurrency)
 
-    return answer
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import contextlib
+
+# "memory" notifies waiters in this process (local worker, tests); "redis"
+# reaches API processes other than the worker's (the worker Lambda).
+NOTIFY_BACKEND = os.getenv("NOTIFY_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+NOTIFY_CHANNEL_PREFIX = "query-complete:"
+
+_lock = threading.Lock()
+
+
+class MemorySubscription:
+    def __init__(self, future):
+        self.future = future
+
+    async def get(self, timeout):
+        """The completed item once published, or None after `timeout` seconds."""
+        try:
+            # shield: a timeout must not cancel the future a later get() awaits.
+            return await asyncio.wait_for(asyncio.shield(self.future), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _set_result(future, item):
+    if not future.done():
+        future.set_result(item)
+
+
+class MemoryNotifier:
+    """
+    In-process completion notifications.
+
+    A waiter subscribes with a future on its own event loop; `publish` (from
+    any thread, e.g. the local worker's) resolves it with the stored item.
+    """
+
+    # Only a publisher in this process (the local worker) reaches the waiters.
+    cross_process = False
+
+    def __init__(self):
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0}
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, query_id):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            self._waiters.setdefault(query_id, []).append(waiter)
+        try:
+            yield MemorySubscription(waiter[1])
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(query_id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(query_id, None)
+
+    def publish(self, query_id, item):
+        with self._lock:
+            waiters = list(self._waiters.get(query_id, ()))
+            self.stats["published"] += 1
+            self.stats["delivered"] += len(waiters)
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_result, future, item)
+            except RuntimeError:
+                # The waiter's loop has closed; nobody is listening anymore.
+                pass
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, "waiting": sum(len(w) for w in self._waiters.values())}
+
+
+class RedisSubscription:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    async def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            message = await self.pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None and message["type"] == "message":
+                return json.loads(message["data"])
+
+
+class RedisNotifier:
+    """Completion notifications over Redis pub/sub, one channel per query_id."""
+
+    cross_process = True
+
+    def __init__(self, url=REDIS_URL, client=None, async_client=None):
+        # redis.asyncio needs redis-py 4.2 or later.
+        import redis
+        import redis.asyncio
+
+        self._client = client if client is not None else redis.Redis.from_url(url)
+        self._async_client = (
+            async_client if async_client is not None else redis.asyncio.Redis.from_url(url)
+        )
+        self.stats = {"published": 0}
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, query_id):
+        pubsub = self._async_client.pubsub()
+        await pubsub.subscribe(NOTIFY_CHANNEL_PREFIX + query_id)
+        try:
+            yield RedisSubscription(pubsub)
+        finally:
+            # aclose() replaces reset() from redis-py 5.0.1.
+            close = getattr(pubsub, "aclose", None) or pubsub.reset
+            await close()
+
+    def publish(self, query_id, item):
+        self._client.publish(NOTIFY_CHANNEL_PREFIX + query_id, json.dumps(item, default=str))
+        self.stats["published"] += 1
+
+    def metrics(self):
+        return dict(self.stats)
+
+
+NOTIFY_BACKENDS = {
+    "memory": MemoryNotifier,
+    "redis": RedisNotifier,
+}
+
+_notifier = None
+
+
+def get_notifier():
+    global _notifier
+    if _notifier is None:
+        with _lock:
+            if _notifier is None:
+                if NOTIFY_BACKEND not in NOTIFY_BACKENDS:
+                    raise ValueError(
+                        f"Unknown NOTIFY_BACKEND {NOTIFY_BACKEND!r}; "
+                        f"expected one of {sorted(NOTIFY_BACKENDS)}"
+                    )
+                try:
+                    _notifier = NOTIFY_BACKENDS[NOTIFY_BACKEND]()
+                except Exception as e:
+                    # redis is missing or older than 4.2: waiters fall back to polling the table.
+                    print(f"Notify backend {NOTIFY_BACKEND!r} unavailable ({e}); using memory.")
+                    _notifier = MemoryNotifier()
+    return _notifier
+
+
+def set_notifier(notifier):
+    """Swap the process-wide notifier (tests, benchmarks)."""
+    global _notifier
+    _notifier = notifier
+
+
+def publish_completed(results):
+    """Tell waiters on these QueryResults that they are complete; never raises."""
+    try:
+        notifier = get_notifier()
+        for result in results:
+            notifier.publish(result.query_id, result.get_items())
+    except Exception as e:
+        print(f"Failed to publish query completion: {e}")
@@ -0,0 +1,149 @@
+import os
+import math
+from typing import Any, List
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from context import strip_metadata
+from executor import run_blocking
+from tracing import span
+from metadata_index import get_name_aliases, normalize_name, RETRIEVER_K, STOPWORDS
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+# "lexical" (CPU-only, no extra dependencies) or "cross-encoder".
+RERANK_SCORER = os.getenv("RERANK_SCORER", "lexical")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", 20))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", RETRIEVER_K))
+CROSS_ENCODER_MODEL = os.getenv(
+    "CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+
+
+class LexicalScorer:
+    """
+    Score (query, chunk) pairs from cheap lexical features.
+
+    - coverage: share of the query's terms found in the chunk, weighted by
+      their IDF over the candidate set, so rare words ("cacio", "$45") count
+      more than words every candidate has.
+    - name: the chunk's restaurant is named in the query.
+    - facet: its cuisine or neighborhood is named in the query.
+    - prior: 1 / (1 + rank) from the first-stage retriever.
+    """
+
+    def __init__(self, coverage_weight=1.0, name_weight=1.0, facet_weight=0.3, prior_weight=0.5):
+        self.coverage_weight = coverage_weight
+        self.name_weight = name_weight
+        self.facet_weight = facet_weight
+        self.prior_weight = prior_weight
+
+    def score(self, query, documents):
+        query_text = f" {normalize_name(query)} "
+        query_terms = {
+            term for term in query_text.split() if term not in STOPWORDS
+        }
+        doc_terms = [
+            set(normalize_name(strip_metadata(doc.page_content)).split())
+            for doc in documents
+        ]
+
+        n_docs = len(documents)
+        idf = {
+            term: math.log(1 + n_docs / (1 + sum(term in terms for terms in doc_terms)))
+            for term in query_terms
+        }
+        total_idf = sum(idf.values()) or 1.0
+
+        scores = []
+        for rank, (doc, terms) in enumerate(zip(documents, doc_terms)):
+            coverage = sum(idf[term] for term in query_terms if term in terms) / total_idf
+            name = any(
+                f" {alias} " in query_text
+                for alias in get_name_aliases(doc.metadata.get("restaurant_name", ""))
+            )
+            facet = any(
+                f" {normalize_name(doc.metadata.get(field, ''))} " in query_text
+                for field in ("cuisine", "location")
+                if doc.metadata.get(field)
+            )
+            scores.append(
+                self.coverage_weight * coverage
+                + self.name_weight * name
+                + self.facet_weight * facet
+                + self.prior_weight / (1 + rank)
+            )
+        return scores
+
+
+class CrossEncoderScorer:
+    """A sentence-transformers cross-encoder run locally on CPU."""
+
+    def __init__(self, model_name=CROSS_ENCODER_MODEL):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+
+    def score(self, query, documents):
+        pairs = [(query, strip_metadata(doc.page_content)) for doc in documents]
+        return [float(score) for score in self.model.predict(pairs)]
+
+
+def get_scorer(name=RERANK_SCORER):
+    if name == "cross-encoder":
+        try:
+            return CrossEncoderScorer()
+        except Exception as e:
+            # sentence-transformers or the model is not available (e.g. Lambda).
+            print(f"Cross-encoder unavailable ({e}); reranking lexically.")
+    elif name != "lexical":
+        raise ValueError(f"Unknown RERANK_SCORER {name!r}")
+    return LexicalScorer()
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Re-order the candidates of `base_retriever` with `scorer` and keep the
+    best `top_n`. Build the base retriever with a larger k (RERANK_FETCH_K)
+    so there is something to choose from.
+    """
+
+    base_retriever: Any
+    scorer: Any
+    top_n: int = RERANK_TOP_N
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def rerank(self, query, documents):
+        if len(documents) <= 1:
+            return documents[: self.top_n]
+        with span("rerank"):
+            scores = self.scorer.score(query, documents)
+        ranked = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)
+        results = []
+        for i in ranked[: self.top_n]:
+            documents[i].metadata["rerank_score"] = round(float(scores[i]), 6)
+            results.append(documents[i])
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = self.base_retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        return self.rerank(query, documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        documents = await self.base_retriever.ainvoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
+        # Scoring is CPU-bound (and a model call for the cross-encoder).
+        return await run_blocking(self.rerank, query, documents)
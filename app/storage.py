@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import sqlite3
+from decimal import Decimal
+import threading
+
+import boto3
+from botocore.config import Config
+
+TABLE_NAME = os.getenv("TABLE_NAME")
+# "dynamodb" in AWS; "memory" or "sqlite" for local runs and tests.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "dynamodb")
+SQLITE_STORAGE_PATH = os.getenv("SQLITE_STORAGE_PATH", "./.cache/queries.sqlite")
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", 32))
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AWS_CONNECT_TIMEOUT_SECONDS", 2))
+AWS_READ_TIMEOUT_SECONDS = float(os.getenv("AWS_READ_TIMEOUT_SECONDS", 10))
+# DynamoDB limits: 25 items per BatchWriteItem, 100 keys per BatchGetItem.
+DYNAMODB_BATCH_GET_SIZE = 100
+BATCH_GET_MAX_RETRIES = 5
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.RLock()
+
+
+def get_boto_config():
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=AWS_READ_TIMEOUT_SECONDS,
+        retries={"max_attempts": 5, "mode": "adaptive"},
+        tcp_keepalive=True,
+    )
+
+
+def get_session():
+    # One session per process: credentials are resolved once, and every
+    # client shares its connection pools across requests and threads.
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.session.Session()
+    return _session
+
+
+def get_client(service_name):
+    if service_name not in _clients:
+        session = get_session()
+        with _lock:
+            if service_name not in _clients:
+                _clients[service_name] = session.client(
+                    service_name, config=get_boto_config()
+                )
+    return _clients[service_name]
+
+
+def get_resource(service_name):
+    if service_name not in _resources:
+        session = get_session()
+        with _lock:
+            if service_name not in _resources:
+                _resources[service_name] = session.resource(
+                    service_name, config=get_boto_config()
+                )
+    return _resources[service_name]
+
+
+def to_dynamodb(value):
+    # DynamoDB rejects Python floats; numbers must be Decimals.
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: to_dynamodb(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_dynamodb(item) for item in value]
+    return value
+
+
+class DynamoDBBackend:
+    """Query results in the DynamoDB table `table_name`, keyed by query_id."""
+
+    def __init__(self, table_name=TABLE_NAME):
+        self.table_name = table_name
+        self.table = get_resource("dynamodb").Table(table_name)
+
+    def put(self, item):
+        self.table.put_item(Item=to_dynamodb(item))
+
+    def get(self, query_id):
+        return self.table.get_item(Key={"query_id": query_id}).get("Item")
+
+    def batch_put(self, items):
+        # batch_writer sends BatchWriteItem calls of up to 25 items and
+        # resends any unprocessed ones.
+        with self.table.batch_writer(overwrite_by_pkeys=["query_id"]) as batch:
+            for item in items:
+                batch.put_item(Item=to_dynamodb(item))
+
+    def batch_get(self, query_ids):
+        resource = get_resource("dynamodb")
+        query_ids = list(dict.fromkeys(query_ids))
+        found = {}
+        for start in range(0, len(query_ids), DYNAMODB_BATCH_GET_SIZE):
+            request = {
+                self.table_name: {
+                    "Keys": [
+                        {"query_id": query_id}
+                        for query_id in query_ids[start : start + DYNAMODB_BATCH_GET_SIZE]
+                    ]
+                }
+            }
+            for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+                response = resource.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    found[item["query_id"]] = item
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                time.sleep(0.05 * 2**attempt)
+            else:
+                raise RuntimeError(
+                    f"DynamoDB left {len(request[self.table_name]['Keys'])} keys unprocessed"
+                )
+        return found
+
+
+class MemoryBackend:
+    """Process-local dict of items; for tests and single-process local runs."""
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        with self._lock:
+            self.items[item["query_id"]] = dict(item)
+
+    def get(self, query_id):
+        with self._lock:
+            item = self.items.get(query_id)
+            return dict(item) if item is not None else None
+
+    def batch_put(self, items):
+        with self._lock:
+            for item in items:
+                self.items[item["query_id"]] = dict(item)
+
+    def batch_get(self, query_ids):
+        with self._lock:
+            return {
+                query_id: dict(self.items[query_id])
+                for query_id in query_ids
+                if query_id in self.items
+            }
+
+
+class SQLiteBackend:
+    """Items as JSON in a local SQLite file, shared by processes on one machine."""
+
+    def __init__(self, path=SQLITE_STORAGE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_results (
+                query_id TEXT PRIMARY KEY,
+                item TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def put(self, item):
+        self.batch_put([item])
+
+    def get(self, query_id):
+        return self.batch_get([query_id]).get(query_id)
+
+    def batch_put(self, items):
+        rows = [(item["query_id"], json.dumps(item)) for item in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO query_results (query_id, item) VALUES (?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def batch_get(self, query_ids):
+        found = {}
+        query_ids = list(query_ids)
+        # Stay under SQLite's default bound-parameter limit.
+        for start in range(0, len(query_ids), 500):
+            batch = query_ids[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT query_id, item FROM query_results "
+                    f"WHERE query_id IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            for query_id, item in rows:
+                found[query_id] = json.loads(item)
+        return found
+
+    def close(self):
+        self._conn.close()
+
+
+STORAGE_BACKENDS = {
+    "dynamodb": DynamoDBBackend,
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+_backend = None
+
+
+def get_storage_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if STORAGE_BACKEND not in STORAGE_BACKENDS:
+                    raise ValueError(
+                        f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; "
+                        f"expected one of {sorted(STORAGE_BACKENDS)}"
+                    )
+                _backend = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _backend
+
+
+def set_storage_backend(backend):
+    """Swap the process-wide backend (tests, benchmarks)."""
+    global _backend
+    _backend = backend
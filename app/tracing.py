@@ -0,0 +1,196 @@
+import os
+import time
+import threading
+import contextlib
+from contextvars import ContextVar
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Histogram buckets (seconds) for stage latencies.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_trace = ContextVar("rag_trace", default=None)
+_null_span = contextlib.nullcontext()
+
+
+class Trace:
+    """Stage timings and counters for one request, summed per stage name."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+                "stages_ms": {
+                    name: round(seconds * 1000, 2) for name, seconds in self.spans.items()
+                },
+                "counters": dict(self.counters),
+            }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add_span(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def span(name):
+    """Time a block into the current trace; a shared no-op when none is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        return _null_span
+    return _Span(trace, name)
+
+
+def incr(name, value=1):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.incr(name, value)
+
+
+def get_current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def start_trace(kind="query"):
+    """Collect spans for the duration of the block and record them in `registry`."""
+    if not TRACING_ENABLED:
+        yield None
+        return
+    trace = Trace(kind)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.add_span("total", time.perf_counter() - trace.start)
+        registry.observe(trace)
+
+
+def trace_iterator(iterator, kind):
+    """
+    Trace a generator whose steps may each run in a different context (a
+    StreamingResponse iterates sync generators in a thread pool), so the
+    trace is set and reset around every step instead of once.
+    """
+    if not TRACING_ENABLED:
+        yield from iterator
+        return
+    trace = Trace(kind)
+    try:
+        while True:
+            token = _current_trace.set(trace)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_trace.reset(token)
+            yield item
+    finally:
+        trace.add_span("total", time.perf_counter() - trace.start)
+        registry.observe(trace)
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms and counters, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {}
+        self.counters = {}
+
+    def observe(self, trace):
+        with self._lock:
+            self.requests[trace.kind] = self.requests.get(trace.kind, 0) + 1
+            for name, seconds in trace.spans.items():
+                histogram = self.histograms.setdefault(
+                    (trace.kind, name),
+                    {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0},
+                )
+                for i, bound in enumerate(self.buckets):
+                    if seconds <= bound:
+                        histogram["buckets"][i] += 1
+                histogram["sum"] += seconds
+                histogram["count"] += 1
+            for name, value in trace.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def render(self, gauges=None):
+        """Prometheus exposition text; `gauges` adds {name: value} point-in-time values."""
+        lines = [
+            "# HELP rag_requests_total Traced requests by kind.",
+            "# TYPE rag_requests_total counter",
+        ]
+        with self._lock:
+            for kind, count in sorted(self.requests.items()):
+                lines.append(f'rag_requests_total{{kind="{kind}"}} {count}')
+
+            lines += [
+                "# HELP rag_stage_seconds Time spent per pipeline stage.",
+                "# TYPE rag_stage_seconds histogram",
+            ]
+            for (kind, stage), histogram in sorted(self.histograms.items()):
+                labels = f'kind="{kind}",stage="{stage}"'
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'rag_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(
+                    f'rag_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram["count"]}'
+                )
+                lines.append(f"rag_stage_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+                lines.append(f"rag_stage_seconds_count{{{labels}}} {histogram['count']}")
+
+            lines += [
+                "# HELP rag_events_total Cache hits, LLM calls and token counts.",
+                "# TYPE rag_events_total counter",
+            ]
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'rag_events_total{{event="{name}"}} {value}')
+
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def flatten_metrics(metrics, prefix="rag"):
+    """{"answer_cache": {"misses": 3}} -> {"rag_answer_cache_misses": 3}; numbers only."""
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+        elif isinstance(value, bool):
+            flat[name] = int(value)
+    return flat
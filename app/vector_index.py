@@ -0,0 +1,496 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from lexical import build_field_codes, get_filter_mask
+from metadata_index import RETRIEVER_K, count_chunks, iter_collection
+from tracing import span
+
+VECTOR_INDEX_DIR_NAME = "vector_index"
+VECTOR_INDEX_VERSION = 1
+# "auto" uses the NumPy index when ./db has one and falls back to Chroma;
+# "chroma" and "numpy" force one or the other.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "auto")
+# "none" scans the float32 vectors; "int8" (4x smaller) or "binary" (32x
+# smaller) scans quantized codes and rescores the best candidates exactly.
+# Ingest only writes the codes of this setting, and rebuilds when it changes.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+# Candidates rescored at full precision, as a multiple of k; 0 keeps the
+# quantized ranking and never touches the float32 vectors.
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", 4))
+# Save only the VECTOR_QUANTIZATION codes, without vectors.npy. ./db (and the
+# image's `COPY db`) then keeps one float32 copy, Chroma's, and rescoring
+# fetches its candidates' rows from Chroma by id.
+VECTOR_INDEX_CODES_ONLY = os.getenv("VECTOR_INDEX_CODES_ONLY", "false").lower() == "true"
+# Codes are widened to float32, and vectors fitted and encoded, this many
+# rows at a time, so neither a scan nor a build copies the whole matrix.
+SCORE_BLOCK_ROWS = 4096
+
+
+
+def get_vector_index_path(persist_directory):
+    return os.path.join(persist_directory, VECTOR_INDEX_DIR_NAME)
+
+
+def top_k(scores, k):
+    """Positions of the `k` highest scores, best first."""
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def iter_blocks(rows):
+    for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+        yield rows[start:start + SCORE_BLOCK_ROWS]
+
+
+def score_blocks(codes, score):
+    return np.concatenate([
+        score(block) for block in iter_blocks(codes)
+    ]) if len(codes) else np.zeros(0, dtype=np.float32)
+
+
+def encode_blocks(quantizer, vectors):
+    if not len(vectors):
+        return quantizer.encode(vectors)
+    return np.concatenate([quantizer.encode(block) for block in iter_blocks(vectors)])
+
+
+def normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def save_array(path, name, array):
+    # Through a file handle: np.save would append ".npy" to the temp name.
+    tmp_path = os.path.join(path, f"{name}.tmp")
+    with open(tmp_path, "wb") as file:
+        np.save(file, array, allow_pickle=False)
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+class Int8Quantizer:
+    """Per-dimension min/max scalar quantization to int8."""
+
+    name = "int8"
+
+    def __init__(self, offset, scale):
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, vectors):
+        if not len(vectors):
+            return cls(np.zeros(vectors.shape[1]), np.ones(vectors.shape[1]))
+        # Block by block: `vectors` may be a memory map larger than RAM.
+        low = np.min([block.min(axis=0) for block in iter_blocks(vectors)], axis=0)
+        high = np.max([block.max(axis=0) for block in iter_blocks(vectors)], axis=0)
+        scale = np.where(high > low, (high - low) / 255, 1.0)
+        return cls(low + 128 * scale, scale)
+
+    def encode(self, vectors):
+        codes = np.rint((vectors - self.offset) / self.scale)
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def score(self, codes, query):
+        # v ~= offset + scale * code, so v.q = code.(scale * q) + offset.q
+        weights = self.scale * query
+        bias = float(self.offset @ query)
+        return score_blocks(codes, lambda block: block.astype(np.float32) @ weights + bias)
+
+    def get_params(self):
+        return np.stack([self.offset, self.scale])
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(params[0], params[1])
+
+
+class BinaryQuantizer:
+    """
+    One bit per dimension: whether it is above that dimension's mean.
+
+    Scoring is asymmetric: the float query is dotted with the +/-1 codes,
+    which ranks far better than Hamming distance at the same 32x saving.
+    """
+
+    name = "binary"
+
+    def __init__(self, center):
+        self.center = np.asarray(center, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, vectors):
+        if not len(vectors):
+            return cls(np.zeros(vectors.shape[1]))
+        total = np.sum([block.sum(axis=0, dtype=np.float64) for block in iter_blocks(vectors)], axis=0)
+        return cls(total / len(vectors))
+
+    def encode(self, vectors):
+        return np.packbits(vectors > self.center, axis=1)
+
+    def score(self, codes, query):
+        # code = +1/-1 per dimension: sum(q * code) = 2 * (bits . q) - sum(q)
+        dim, total = len(query), float(query.sum())
+        return score_blocks(
+            codes,
+            lambda block: 2 * (np.unpackbits(block, axis=1, count=dim).astype(np.float32) @ query)
+            - total,
+        )
+
+    def get_params(self):
+        return self.center
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(params)
+
+
+QUANTIZERS = {quantizer.name: quantizer for quantizer in (Int8Quantizer, BinaryQuantizer)}
+
+
+def open_chroma(persist_directory, embedding_function=None):
+    from langchain_community.vectorstores import Chroma
+
+    return Chroma(persist_directory=persist_directory, embedding_function=embedding_function)
+
+
+class ChromaRows:
+    """
+    Stands in for the float32 matrix of an index saved without vectors.npy:
+    `rows[positions]` fetches those rows from the Chroma collection by id,
+    normalized as the matrix would be. The collection is only opened by the
+    first rescore, so a `rescore_factor` of 0 never opens it.
+    """
+
+    def __init__(self, ids, open_vectorstore):
+        self.ids = ids
+        self._open_vectorstore = open_vectorstore
+        self._vectorstore = None
+        self._lock = threading.Lock()
+
+    def __getitem__(self, positions):
+        if self._vectorstore is None:
+            with self._lock:
+                if self._vectorstore is None:
+                    self._vectorstore = self._open_vectorstore()
+        ids = [self.ids[i] for i in positions]
+        result = self._vectorstore.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(result["ids"], result["embeddings"]))
+        return normalize_rows(
+            np.asarray([by_id[chunk_id] for chunk_id in ids], dtype=np.float32)
+        )
+
+
+class NumpyVectorIndex(VectorStore):
+    """
+    Read-only exact vector search over a memory-mapped float32 matrix.
+
+    Rows are L2-normalized at build time, so a query is one matrix-vector
+    product (cosine similarity), an optional metadata mask and an
+    argpartition. It implements the parts of the Chroma interface the
+    retrievers use (`similarity_search_by_vector` with a `filter`, `get`,
+    `embeddings`), so it drops in wherever the Chroma vectorstore does.
+
+    With a `quantizer` the scan runs over its compact `codes` instead, and
+    only the top `k * rescore_factor` candidates are rescored against the
+    float32 rows. Those rows are memory-mapped, so only the candidates' pages
+    are ever read; an index saved with `codes_only` reads them from Chroma
+    instead (`ChromaRows`).
+    """
+
+    def __init__(
+        self,
+        vectors,
+        ids,
+        texts,
+        metadatas,
+        embedding_function=None,
+        quantizer=None,
+        codes=None,
+        rescore_factor=VECTOR_RESCORE_FACTOR,
+    ):
+        self.vectors = vectors
+        self.quantizer = quantizer
+        self.codes = codes
+        self.rescore_factor = rescore_factor
+        self.ids = list(ids)
+        self.texts = list(texts)
+        self.metadatas = [dict(meta) for meta in metadatas]
+        self._embedding_function = embedding_function
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self.field_codes, self.field_vocab = build_field_codes(self.metadatas)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _get_document(self, index):
+        metadata = dict(self.metadatas[index])
+        metadata.setdefault("chunk_id", self.ids[index])
+        return Document(page_content=self.texts[index], metadata=metadata)
+
+    def search(self, vector, k=RETRIEVER_K, where=None):
+        """Return [(row, cosine similarity)] for the top `k` rows, best first."""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        mask = get_filter_mask(self.field_codes, self.field_vocab, self.metadatas, where)
+        rows = np.flatnonzero(mask) if mask is not None else None
+
+        if self.quantizer is None:
+            with span("vector_scan"):
+                scores = self.vectors @ query
+            if rows is not None:
+                scores = scores[rows]
+            else:
+                rows = np.arange(len(scores))
+            top = top_k(scores, k)
+            return [(int(rows[i]), float(scores[i])) for i in top]
+
+        with span("quantized_scan"):
+            scores = self.quantizer.score(self.codes, query)
+        if rows is not None:
+            scores = scores[rows]
+        else:
+            rows = np.arange(len(scores))
+        if not self.rescore_factor:
+            return [(int(rows[i]), float(scores[i])) for i in top_k(scores, k)]
+
+        candidates = rows[top_k(scores, k * self.rescore_factor)]
+        with span("rescore"):
+            # Sorted rows read the memory map front to back.
+            candidates = np.sort(candidates)
+            exact = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        top = top_k(exact, k)
+        return [(int(candidates[i]), float(exact[i])) for i in top]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = RETRIEVER_K, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [self._get_document(index) for index, _ in self.search(embedding, k, filter)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = RETRIEVER_K, filter: Optional[dict] = None, **kwargs: Any
+    ):
+        vector = self._embedding_function.embed_query(query)
+        return [
+            (self._get_document(index), score)
+            for index, score in self.search(vector, k, filter)
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = RETRIEVER_K, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        vector = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector(vector, k, filter)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score
+
+    def get(self, ids=None, include=None, limit=None, offset=None, **kwargs):
+        """The subset of `Chroma.get` used by the chunk store and the index builds."""
+        rows = range(len(self.ids)) if ids is None else [
+            self._positions[chunk_id] for chunk_id in ids if chunk_id in self._positions
+        ]
+        start = offset or 0
+        rows = rows[start:] if limit is None else rows[start:start + limit]
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "documents": [self.texts[i] for i in rows],
+            "metadatas": [self.metadatas[i] for i in rows],
+        }
+
+    def add_texts(self, texts: Iterable[str], metadatas=None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("NumpyVectorIndex is read-only; rebuild it from Chroma.")
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError("Build with build_vector_index(vectorstore, persist_directory).")
+
+    def save(self, path, quantization=VECTOR_QUANTIZATION, codes_only=VECTOR_INDEX_CODES_ONLY):
+        """
+        Write vectors.npy and the `quantization` codes, or with `codes_only`
+        just the codes. Only what the index will search is kept on disk.
+        """
+        if quantization != "none" and quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown VECTOR_QUANTIZATION {quantization!r}")
+        if codes_only and quantization == "none":
+            raise ValueError("VECTOR_INDEX_CODES_ONLY needs a VECTOR_QUANTIZATION")
+
+        os.makedirs(path, exist_ok=True)
+        vectors = np.asarray(self.vectors, dtype=np.float32)
+        if codes_only:
+            remove_file(os.path.join(path, "vectors.npy"))
+        else:
+            save_array(path, "vectors.npy", vectors)
+        for name, quantizer_class in QUANTIZERS.items():
+            if name != quantization:
+                # A previous build's codes would no longer match the rows.
+                remove_file(os.path.join(path, f"{name}.npy"))
+                remove_file(os.path.join(path, f"{name}_params.npy"))
+                continue
+            quantizer = quantizer_class.fit(vectors)
+            save_array(path, f"{name}.npy", encode_blocks(quantizer, vectors))
+            save_array(path, f"{name}_params.npy", quantizer.get_params())
+
+        columns = {}
+        for field, vocab in self.field_vocab.items():
+            columns[field] = {
+                "values": list(vocab),
+                "codes": self.field_codes[field].tolist(),
+            }
+        table = {
+            "version": VECTOR_INDEX_VERSION,
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+            "quantization": quantization,
+            "vectors": not codes_only,
+            "ids": self.ids,
+            "texts": self.texts,
+            "columns": columns,
+        }
+        tmp_path = os.path.join(path, "chunks.json.tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(table, file)
+        os.replace(tmp_path, os.path.join(path, "chunks.json"))
+
+    @classmethod
+    def load(
+        cls,
+        path,
+        embedding_function=None,
+        quantization=VECTOR_QUANTIZATION,
+        rescore_factor=VECTOR_RESCORE_FACTOR,
+        open_vectorstore=None,
+    ):
+        """
+        `open_vectorstore` opens the Chroma collection that rescoring reads
+        from when the index has no vectors.npy (default: `open_chroma` on the
+        index's parent directory).
+        """
+        with open(os.path.join(path, "chunks.json")) as file:
+            table = json.load(file)
+        if table.get("version") != VECTOR_INDEX_VERSION:
+            raise ValueError(f"Unsupported vector index version {table.get('version')}")
+
+        if quantization != "none" and quantization not in QUANTIZERS:
+            raise ValueError(f"Unknown VECTOR_QUANTIZATION {quantization!r}")
+        if not table.get("vectors", True) and quantization != table["quantization"]:
+            # Without float32 vectors, the saved codes are all there is to scan.
+            print(f"{path} only has {table['quantization']} codes; searching those.")
+            quantization = table["quantization"]
+
+        # mmap: nothing is copied or read up front; pages load as searches touch them.
+        if table.get("vectors", True):
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        else:
+            if open_vectorstore is None:
+                persist_directory = os.path.dirname(os.path.abspath(path))
+                open_vectorstore = lambda: open_chroma(persist_directory, embedding_function)  # noqa: E731
+            vectors = ChromaRows(table["ids"], open_vectorstore)
+
+        quantizer = codes = None
+        if quantization != "none":
+            codes_path = os.path.join(path, f"{quantization}.npy")
+            if os.path.exists(codes_path):
+                codes = np.load(codes_path, mmap_mode="r")
+                params = np.load(os.path.join(path, f"{quantization}_params.npy"))
+                quantizer = QUANTIZERS[quantization].from_params(params)
+            else:
+                print(f"No {quantization} codes in {path}; searching full precision.")
+
+        metadatas = [{} for _ in table["ids"]]
+        for field, column in table["columns"].items():
+            values = column["values"]
+            for meta, code in zip(metadatas, column["codes"]):
+                if values[code] is not None:
+                    meta[field] = values[code]
+        return cls(
+            vectors,
+            table["ids"],
+            table["texts"],
+            metadatas,
+            embedding_function,
+            quantizer=quantizer,
+            codes=codes,
+            rescore_factor=rescore_factor,
+        )
+
+
+def build_vector_index(vectorstore, persist_directory):
+    """
+    Export every chunk and its embedding from the Chroma collection.
+
+    The collection is read a page at a time into a preallocated float32
+    memory map, so the build never holds the embeddings as Python lists.
+    """
+    start = time.perf_counter()
+    path = get_vector_index_path(persist_directory)
+    os.makedirs(path, exist_ok=True)
+    build_path = os.path.join(path, "vectors.build.npy")
+
+    count = count_chunks(vectorstore)
+    vectors = None
+    ids, texts, metadatas = [], [], []
+    for page in iter_collection(vectorstore, ["embeddings", "documents", "metadatas"]):
+        page_vectors = normalize_rows(np.asarray(page["embeddings"], dtype=np.float32))
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(
+                build_path, mode="w+", dtype=np.float32, shape=(count, page_vectors.shape[1])
+            )
+        vectors[len(ids):len(ids) + len(page_vectors)] = page_vectors
+        ids.extend(page["ids"])
+        texts.extend(page["documents"])
+        metadatas.extend(meta or {} for meta in page["metadatas"])
+
+    if vectors is None:
+        vectors = np.zeros((0, 0), dtype=np.float32)
+    try:
+        NumpyVectorIndex(vectors[:len(ids)], ids, texts, metadatas).save(path)
+    finally:
+        # The scratch matrix is unmapped before its file is removed.
+        del vectors
+        remove_file(build_path)
+    print(
+        f"Built vector index over {len(ids)} chunks "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return NumpyVectorIndex.load(path, vectorstore.embeddings, open_vectorstore=lambda: vectorstore)
+
+
+def vector_index_is_current(persist_directory):
+    """Whether ./db has an index saved with this process's quantization settings."""
+    try:
+        with open(os.path.join(get_vector_index_path(persist_directory), "chunks.json")) as file:
+            table = json.load(file)
+    except (OSError, ValueError):
+        return False
+    return (
+        table.get("quantization") == VECTOR_QUANTIZATION
+        and table.get("vectors") == (not VECTOR_INDEX_CODES_ONLY)
+    )
+
+
+def load_vector_index(persist_directory, embedding_function=None, open_vectorstore=None):
+    path = get_vector_index_path(persist_directory)
+    if not os.path.exists(os.path.join(path, "chunks.json")):
+        return None
+    return NumpyVectorIndex.load(path, embedding_function, open_vectorstore=open_vectorstore)
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import asyncio
+import threading
+
+from models import QueryResult
+from myrag import abatch_query_rag, LLM_MAX_CONCURRENCY
+from answer_cache import normalize_query
+from executor import run_blocking
+from notify import publish_completed
+from tracing import start_trace
+
+# The local queue flushes after this many queries or this many seconds,
+# whichever comes first.
+WORKER_MAX_BATCH_SIZE = int(os.getenv("WORKER_MAX_BATCH_SIZE", 25))
+WORKER_MAX_WAIT_SECONDS = float(os.getenv("WORKER_MAX_WAIT_SECONDS", 0.05))
+
+
+def parse_event(event):
+    """
+    Turn a worker event into a list of QueryResults, one per query_id.
+
+    Accepts a single QueryResult dict (what `invoke_worker_lambda_func`
+    sends), a list of them, {"queries": [...]}, or an SQS batch
+    ({"Records": [{"body": "<json>"}]}).
+    """
+    if isinstance(event, dict) and "Records" in event:
+        payloads = []
+        for record in event["Records"]:
+            body = json.loads(record["body"])
+            payloads.extend(body if isinstance(body, list) else [body])
+    elif isinstance(event, dict) and "queries" in event:
+        payloads = event["queries"]
+    elif isinstance(event, list):
+        payloads = event
+    else:
+        payloads = [event]
+
+    results = {}
+    for payload in payloads:
+        result = payload if isinstance(payload, QueryResult) else QueryResult(**payload)
+        # A redelivered message repeats its query_id; keep the first one.
+        results.setdefault(result.query_id, result)
+    return list(results.values())
+
+
+async def get_pending(results, check_stored=True):
+    # Idempotency: a query already answered (a retried or duplicated
+    # invocation) is not sent to the LLM again.
+    results = [result for result in results if not result.is_complete]
+    if not results or not check_stored:
+        return results
+    stored = await run_blocking(
+        QueryResult.batch_get, [result.query_id for result in results]
+    )
+    return [
+        result
+        for result in results
+        if result.query_id not in stored or not stored[result.query_id].is_complete
+    ]
+
+
+async def process_batch(results, max_concurrency=LLM_MAX_CONCURRENCY, check_stored=True):
+    """
+    Answer a batch of queries and write them back in one batched write.
+
+    Identical questions (after normalization) share one RAG run. With
+    `check_stored=False` (query_ids just created, so never stored) the
+    idempotency read is skipped. Returns counts of what happened to the batch.
+    """
+    with start_trace("worker_batch"):
+        return await _process_batch(results, max_concurrency, check_stored)
+
+
+async def _process_batch(results, max_concurrency, check_stored=True):
+    pending = await get_pending(results, check_stored)
+
+    groups = {}
+    for result in pending:
+        groups.setdefault(normalize_query(result.query_text), []).append(result)
+
+    query_texts = [group[0].query_text for group in groups.values()]
+    answers = await abatch_query_rag(query_texts, max_concurrency)
+
+    completed = []
+    failed = 0
+    for group, answer in zip(groups.values(), answers):
+        if isinstance(answer, Exception):
+            print(f"Failed to answer query {group[0].query_id}: {answer}")
+            failed += len(group)
+            continue
+        for result in group:
+            result.answer_text = answer.get("answer")
+            result.set_sources(answer.get("context"))
+            result.is_complete = True
+            completed.append(result)
+
+    # Long-polling GET /get_query requests return as soon as this is stored.
+    if completed and await run_blocking(QueryResult.batch_put, completed):
+        await run_blocking(publish_completed, completed)
+
+    return {
+        "received": len(results),
+        "skipped": len(results) - len(pending),
+        "unique": len(query_texts),
+        "completed": len(completed),
+        "failed": failed,
+    }
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """
+    The event loop every invocation of this process runs on.
+
+    The memoized RagService's async OpenAI clients stay bound to the loop
+    that first used them, so a fresh `asyncio.run` loop per invocation
+    would fail their requests with connection errors.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        with _loop_lock:
+            if _loop is None or _loop.is_closed():
+                _loop = asyncio.new_event_loop()
+    return _loop
+
+
+def handler(event, context):
+    results = parse_event(event)
+    summary = get_event_loop().run_until_complete(process_batch(results))
+    print(f"✅ Worker processed batch: {summary}")
+    return summary
+
+
+class LocalWorkerQueue:
+    """
+    In-process stand-in for the worker Lambda invoke, for running and load
+    testing the worker path without AWS.
+
+    `submit` only buffers the payload; a background thread drains the buffer
+    in batches through the same `process_batch` the Lambda handler uses.
+    """
+
+    def __init__(self, max_batch_size=WORKER_MAX_BATCH_SIZE, max_wait=WORKER_MAX_WAIT_SECONDS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = []
+        self._buffer = []
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="local-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload):
+        with self._condition:
+            self._buffer.append(payload)
+            self._condition.notify_all()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._buffer:
+                self._condition.wait()
+            # Give a burst a moment to fill the batch before flushing it.
+            deadline = time.monotonic() + self.max_wait
+            while len(self._buffer) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._buffer[: self.max_batch_size]
+            del self._buffer[: self.max_batch_size]
+            self._in_flight += len(batch)
+            return batch
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        while True:
+            batch = self._next_batch()
+            try:
+                summary = loop.run_until_complete(process_batch(parse_event(batch)))
+                self.batches.append(summary)
+            except Exception as e:
+                print(f"Local worker failed a batch of {len(batch)}: {e}")
+            finally:
+                with self._condition:
+                    self._in_flight -= len(batch)
+                    self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """Block until every submitted payload has been processed."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._buffer and not self._in_flight, timeout
+            )
+
+
+_local_queue = None
+_local_queue_lock = threading.Lock()
+
+
+def get_local_queue():
+    global _local_queue
+    if _local_queue is None:
+        with _local_queue_lock:
+            if _local_queue is None:
+                _local_queue = LocalWorkerQueue()
+    return _local_queue
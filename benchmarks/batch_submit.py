@@ -0,0 +1,101 @@
+"""
+Compare a serial POST /submit_query loop with one POST /submit_queries.
+
+Both run in-process against the fake LLM and a retriever that embeds each
+query with LocalHashEmbeddings, each embeddings request costing
+`--embed-latency` seconds, like a remote call. Reports the wall time and
+how many embeddings requests and LLM calls each approach made.
+
+    python benchmarks/batch_submit.py --queries 50 --llm-latency 0.5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import myrag  # noqa: E402
+from embedding import LocalHashEmbeddings  # noqa: E402
+from fakes import (  # noqa: E402
+    SlowFakeChatModel,
+    StaticRetriever,
+    make_documents,
+    patch_persistence,
+)
+
+
+class CountingEmbeddings(LocalHashEmbeddings):
+    requests = 0
+
+    def embed_documents(self, texts):
+        self.requests += 1
+        return super().embed_documents(texts)
+
+
+async def submit_serial(questions):
+    async with httpx.AsyncClient(app=api.app, base_url="http://bench", timeout=None) as client:
+        for question in questions:
+            response = await client.post("/submit_query", json={"query_text": question})
+            response.raise_for_status()
+
+
+async def submit_batch(questions):
+    async with httpx.AsyncClient(app=api.app, base_url="http://bench", timeout=None) as client:
+        response = await client.post(
+            "/submit_queries", json=[{"query_text": question} for question in questions]
+        )
+        response.raise_for_status()
+        return response.json()
+
+
+def run(label, submit, questions, args):
+    embeddings = CountingEmbeddings(latency_seconds=args.embed_latency)
+    llm = SlowFakeChatModel(latency=args.llm_latency)
+    retriever = StaticRetriever(
+        documents=make_documents(), latency=args.retrieval_latency, embeddings=embeddings
+    )
+    service = myrag.RagService(retriever=retriever, llm=llm)
+    service.embeddings = embeddings
+    # Every question is distinct; measure batching, not caching.
+    service.answer_cache = None
+    service.single_flight = None
+    myrag._rag_service = service
+
+    start = time.perf_counter()
+    asyncio.run(submit(questions))
+    seconds = time.perf_counter() - start
+    print(
+        f"{label:<20} {len(questions)} queries in {seconds:.2f}s "
+        f"({len(questions) / seconds:.1f} q/s), "
+        f"{embeddings.requests} embeddings requests, {llm.calls} LLM calls"
+    )
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.1)
+    parser.add_argument("--retrieval-latency", type=float, default=0.02)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    patch_persistence(args.db_latency)
+    api.IS_WORKER_LAMBDA_AVAILABLE = None
+    questions = [f"which restaurants serve dish number {i}" for i in range(args.queries)]
+
+    serial = run("serial submit_query", submit_serial, questions, args)
+    batch = run("submit_queries", submit_batch, questions, args)
+    print(f"speedup: {serial / batch:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measure API cold start: importing the Lambda handler module in a fresh
+interpreter, then serving the first `GET /`.
+
+    python benchmarks/cold_start.py --runs 5
+
+Run it from the repository root (next to ./db and restaurant_menu_pdf.csv).
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+PROBE = """
+import time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(api.app)
+before_get = time.perf_counter()
+assert client.get("/").status_code == 200
+done = time.perf_counter()
+print(imported - start, done - before_get)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(APP_DIR))
+    env.setdefault("OPENAI_API_KEY", "sk-cold-start-probe")
+
+    imports, first_gets = [], []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip().splitlines()[-1]
+        import_seconds, get_seconds = map(float, output.split())
+        imports.append(import_seconds)
+        first_gets.append(get_seconds)
+
+    print(
+        f"import api: median {statistics.median(imports):.3f}s, "
+        f"first GET /: median {statistics.median(first_gets) * 1000:.1f}ms "
+        f"over {args.runs} runs"
+    )
+
+
+if __name__ == "__main__":
+    main()
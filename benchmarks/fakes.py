@@ -0,0 +1,130 @@
+"""Offline stand-ins for the OpenAI chat model and the retriever, with simulated latency."""
+import time
+import asyncio
+from typing import Any, List
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+
+class SlowFakeChatModel(BaseChatModel):
+    """Answers every prompt with `response` after `latency` seconds."""
+
+    response: str = "**Bobo** | West Village | French\nDinner $60.00\nthanks for asking!"
+    latency: float = 1.0
+    tokens: int = 20
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake-chat-model"
+
+    def _result(self):
+        message = AIMessage(content=self.response)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self._result()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._result()
+
+    def _pieces(self):
+        size = max(1, len(self.response) // self.tokens)
+        return [self.response[i : i + size] for i in range(0, len(self.response), size)]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces = self._pieces()
+        for piece in pieces:
+            time.sleep(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        pieces = self._pieces()
+        for piece in pieces:
+            await asyncio.sleep(self.latency / len(pieces))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+
+
+class StaticRetriever(BaseRetriever):
+    """
+    Returns the same documents for every query after a blocking `latency`.
+    With `embeddings`, the query is embedded first, as the real retrievers do.
+    """
+
+    documents: List[Document] = []
+    latency: float = 0.05
+    embeddings: Any = None
+    calls: int = 0
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        from embedding import get_query_vector
+
+        self.calls += 1
+        if self.embeddings is not None:
+            get_query_vector(self.embeddings, query)
+        time.sleep(self.latency)
+        return list(self.documents)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        from executor import run_blocking
+
+        return await run_blocking(
+            self._get_relevant_documents, query, run_manager=run_manager.get_sync()
+        )
+
+
+def make_documents(n=4):
+    return [
+        Document(
+            page_content=f"Dinner prix fixe $60 course {i}",
+            metadata={
+                "chunk_id": f"bobo-{i}",
+                "restaurant_name": "Bobo",
+                "cuisine": "French",
+                "location": "West Village",
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def patch_persistence(latency=0.01):
+    """Store query results in memory, with a simulated round trip, instead of DynamoDB."""
+    from storage import MemoryBackend, set_storage_backend
+
+    class SlowMemoryBackend(MemoryBackend):
+        def put(self, item):
+            time.sleep(latency)
+            super().put(item)
+
+        def get(self, query_id):
+            time.sleep(latency)
+            return super().get(query_id)
+
+        def batch_put(self, items):
+            time.sleep(latency)
+            super().batch_put(items)
+
+        def batch_get(self, query_ids):
+            time.sleep(latency)
+            return super().batch_get(query_ids)
+
+    backend = SlowMemoryBackend()
+    set_storage_backend(backend)
+    return backend.items
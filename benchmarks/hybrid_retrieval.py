@@ -0,0 +1,144 @@
+"""
+Compare the dense-only retriever with BM25 and the hybrid (RRF) retriever.
+
+Builds a throwaway Chroma collection from the shipped menus with the offline
+LocalHashEmbeddings, then asks two kinds of generated questions:
+  - dish:      "which restaurant serves <a line taken from a menu chunk>"
+  - menu:      "what is on the prix fixe menu at <restaurant>"
+and reports recall@k (the right restaurant is among the top-k chunks),
+precision@k (share of the top-k chunks from the right restaurant) and
+per-query latency for each retriever.
+
+    python benchmarks/hybrid_retrieval.py --k 4 --max-menus 250
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from embedding import LocalHashEmbeddings  # noqa: E402
+from ingest import MENU_CSV_PATH, load_menu_records, sync_vectorstore  # noqa: E402
+from lexical import BM25Index, HybridRetriever  # noqa: E402
+from metadata_index import RestaurantIndex  # noqa: E402
+
+
+def make_questions(lexical_index, n_dish, seed=0):
+    rng = random.Random(seed)
+    questions = []
+
+    by_restaurant = {}
+    for text, meta in zip(lexical_index.texts, lexical_index.metadatas):
+        by_restaurant.setdefault(meta["restaurant_name"], []).append(text)
+
+    for restaurant_name in sorted(by_restaurant):
+        questions.append(
+            (
+                "menu",
+                f"what is on the prix fixe menu at {restaurant_name}",
+                restaurant_name,
+            )
+        )
+
+    dish_lines = []
+    for text, meta in zip(lexical_index.texts, lexical_index.metadatas):
+        for line in text.split("\n"):
+            line = line.strip()
+            words = re.findall(r"[A-Za-z]+", line)
+            if 3 <= len(words) <= 8 and "{" not in line:
+                dish_lines.append((line, meta["restaurant_name"]))
+    for line, restaurant_name in rng.sample(dish_lines, min(n_dish, len(dish_lines))):
+        questions.append(("dish", f"which restaurant serves {line}", restaurant_name))
+
+    return questions
+
+
+def evaluate(name, retrieve, questions):
+    hits = {}
+    precisions = []
+    latencies = []
+    for kind, question, restaurant_name in questions:
+        start = time.perf_counter()
+        documents = retrieve(question)
+        latencies.append(time.perf_counter() - start)
+        relevant = [
+            doc.metadata.get("restaurant_name") == restaurant_name for doc in documents
+        ]
+        hits.setdefault(kind, []).append(any(relevant))
+        precisions.append(np.mean(relevant) if relevant else 0.0)
+
+    latencies_ms = np.array(latencies) * 1000
+    recalls = "  ".join(
+        f"recall[{kind}]={np.mean(values):.3f}" for kind, values in sorted(hits.items())
+    )
+    print(
+        f"{name:<16} {recalls}  precision={np.mean(precisions):.3f}  "
+        f"p50={np.percentile(latencies_ms, 50):.2f}ms  "
+        f"p95={np.percentile(latencies_ms, 95):.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--max-menus", type=int, default=None)
+    parser.add_argument("--dish-questions", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        csv_path = args.csv_path
+        if args.max_menus:
+            import pandas as pd
+
+            records = load_menu_records(csv_path)[: args.max_menus]
+            names = {record["restaurant_name"] for record in records}
+            df = pd.read_csv(csv_path)
+            csv_path = os.path.join(persist_directory, "menus.csv")
+            df[df["headline"].str.strip().isin(names)].to_csv(csv_path, index=False)
+
+        vectorstore = Chroma(
+            persist_directory=os.path.join(persist_directory, "db"),
+            embedding_function=LocalHashEmbeddings(),
+        )
+        sync_vectorstore(
+            vectorstore, os.path.join(persist_directory, "db"), csv_path=csv_path
+        )
+
+        lexical_index = BM25Index.from_vectorstore(vectorstore)
+        questions = make_questions(lexical_index, args.dish_questions)
+        print(f"{len(lexical_index)} chunks, {len(questions)} questions, k={args.k}")
+
+        dense = vectorstore.as_retriever(search_kwargs={"k": args.k})
+        hybrid = HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=lexical_index,
+            k=args.k,
+            fetch_k=args.fetch_k,
+        )
+        filtered_hybrid = HybridRetriever(
+            vectorstore=vectorstore,
+            lexical_index=lexical_index,
+            index=RestaurantIndex.from_vectorstore(vectorstore),
+            k=args.k,
+            fetch_k=args.fetch_k,
+        )
+
+        evaluate("dense", dense.invoke, questions)
+        evaluate("bm25", lambda q: lexical_index.get_documents(q, k=args.k), questions)
+        evaluate("hybrid (rrf)", hybrid.invoke, questions)
+        evaluate("hybrid+filter", filtered_hybrid.invoke, questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Peak memory of rebuilding the BM25 index, the NumPy vector index and the
+menu facts from a Chroma collection, as the collection grows.
+
+Each size gets a throwaway collection of synthetic menu chunks embedded with
+LocalHashEmbeddings (`--dim` defaults to OpenAI's 1536). The builds then run
+in a fresh interpreter, which reports its peak RSS once the collection is
+open (Chroma holds its HNSW index in memory) and after the builds; the
+difference is what the builds cost.
+
+    python benchmarks/index_build_memory.py --chunks 1000 4000 16000
+
+`--app-dir` points the builds at another checkout's app/ to compare.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+
+PROBE = """
+import sys
+import json
+import resource
+from langchain_community.vectorstores import Chroma
+from embedding import LocalHashEmbeddings
+from lexical import build_lexical_index
+from vector_index import build_vector_index
+from menu_facts import build_menu_facts
+
+persist_directory, dim = sys.argv[1], int(sys.argv[2])
+vectorstore = Chroma(persist_directory=persist_directory, embedding_function=LocalHashEmbeddings(size=dim))
+vectorstore.get(limit=1)
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+build_lexical_index(vectorstore, persist_directory)
+build_vector_index(vectorstore, persist_directory)
+build_menu_facts(vectorstore, persist_directory)
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"before_mb": before / 1024, "after_mb": after / 1024}))
+"""
+
+WORDS = (
+    "braised short rib burrata crudo tartare risotto agnolotti branzino duck "
+    "panna cotta tiramisu gelato oysters salmon scallops truffle polenta"
+).split()
+
+
+def make_chunk(i, rng):
+    menu_type = rng.choice(["Lunch", "Dinner"])
+    price = rng.choice([30, 45, 60])
+    dishes = "\n".join(" ".join(rng.sample(WORDS, 4)) for _ in range(12))
+    return f"{menu_type} Prix Fixe ${price}\nAppetizers\n{dishes}\nDesserts\n{i}"
+
+
+def fill_collection(persist_directory, chunks, dim):
+    from langchain_community.vectorstores import Chroma
+    from embedding import LocalHashEmbeddings
+
+    rng = random.Random(0)
+    vectorstore = Chroma(
+        persist_directory=persist_directory, embedding_function=LocalHashEmbeddings(size=dim)
+    )
+    for start in range(0, chunks, 1000):
+        rows = range(start, min(start + 1000, chunks))
+        vectorstore.add_texts(
+            [make_chunk(i, rng) for i in rows],
+            metadatas=[
+                {
+                    "restaurant_name": f"Restaurant {i % 500}",
+                    "cuisine": "Italian",
+                    "location": "West Village",
+                }
+                for i in rows
+            ],
+            ids=[f"chunk-{i}" for i in rows],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 4000, 16000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--app-dir", default=APP_DIR)
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(args.app_dir), ANONYMIZED_TELEMETRY="False")
+    print(f"{'chunks':>7} {'opened MB':>10} {'peak MB':>8} {'builds MB':>10}")
+    for chunks in args.chunks:
+        with tempfile.TemporaryDirectory() as persist_directory:
+            fill_collection(persist_directory, chunks, args.dim)
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE, persist_directory, str(args.dim)],
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        print(
+            f"{chunks:>7} {result['before_mb']:>10.0f} {result['after_mb']:>8.0f} "
+            f"{result['after_mb'] - result['before_mb']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Load-test POST /submit_query in-process with a fake LLM, retriever and table.
+
+Fires `--requests` queries with up to `--concurrency` in flight against one
+ASGI app instance (one uvicorn worker) and reports throughput and latency.
+`--mode sync` reproduces the old handler, which called the blocking chain
+inside `async def` and so served one query at a time.
+
+    python benchmarks/load_test.py --concurrency 1 4 16 --llm-latency 1.0
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import myrag  # noqa: E402
+from fakes import (  # noqa: E402
+    SlowFakeChatModel,
+    StaticRetriever,
+    make_documents,
+    patch_persistence,
+)
+
+
+async def run_load(n_requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(app=api.app, base_url="http://bench") as client:
+
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/submit_query", json={"query_text": f"bobo dinner menu {i}"}
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - start
+
+    return elapsed, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--retrieval-latency", type=float, default=0.02)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    args = parser.parse_args()
+
+    patch_persistence(args.db_latency)
+    service = myrag.RagService(
+        retriever=StaticRetriever(
+            documents=make_documents(), latency=args.retrieval_latency
+        ),
+        llm=SlowFakeChatModel(latency=args.llm_latency),
+    )
+    # Every request must reach the chain.
+    service.answer_cache = None
+    myrag._rag_service = service
+
+    if args.mode == "sync":
+
+        async def blocking_query_rag(query_text):
+            return service.query_rag(query_text)
+
+        api.aquery_rag = blocking_query_rag
+
+    for concurrency in args.concurrency:
+        elapsed, latencies = asyncio.run(run_load(args.requests, concurrency))
+        print(
+            f"mode={args.mode} concurrency={concurrency:<3} "
+            f"throughput={args.requests / elapsed:6.2f} req/s  "
+            f"p50={np.percentile(latencies, 50):.2f}s  "
+            f"p95={np.percentile(latencies, 95):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Table reads and completion latency: polling GET /get_query vs ?wait=.
+
+Runs the API in local worker mode (IS_WORKER_LAMBDA_AVAILABLE=local),
+submits `--queries` distinct questions, and has each client wait for its
+answer either by polling every `--poll-interval` seconds or with one
+long-poll request. Reports the storage reads and how long after the
+worker finished a query its client saw the answer.
+
+    python benchmarks/long_poll.py --queries 50 --poll-interval 0.25
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import myrag  # noqa: E402
+import worker  # noqa: E402
+from fakes import (  # noqa: E402
+    SlowFakeChatModel,
+    StaticRetriever,
+    make_documents,
+    patch_persistence,
+)
+from storage import get_storage_backend  # noqa: E402
+
+
+async def wait_for_answer(client, query_id, mode, args):
+    while True:
+        params = {"wait": args.wait} if mode == "long-poll" else {}
+        response = await client.get(f"/get_query/{query_id}", params=params)
+        response.raise_for_status()
+        if response.json()["is_complete"]:
+            return time.perf_counter()
+        if mode == "poll":
+            await asyncio.sleep(args.poll_interval)
+
+
+async def run(mode, args):
+    async with httpx.AsyncClient(app=api.app, base_url="http://bench", timeout=None) as client:
+        async def one(i):
+            response = await client.post(
+                "/submit_query", json={"query_text": f"which restaurant serves dish {i} ({mode})"}
+            )
+            return await wait_for_answer(client, response.json()["query_id"], mode, args)
+
+        return await asyncio.gather(*(one(i) for i in range(args.queries)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--wait", type=float, default=20)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--db-latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    patch_persistence(args.db_latency)
+    backend = get_storage_backend()
+    reads = {"count": 0}
+    get = backend.get
+
+    def counting_get(query_id):
+        reads["count"] += 1
+        return get(query_id)
+
+    backend.get = counting_get
+
+    service = myrag.RagService(
+        retriever=StaticRetriever(documents=make_documents(), latency=0.01),
+        llm=SlowFakeChatModel(latency=args.llm_latency),
+    )
+    service.answer_cache = None
+    myrag._rag_service = service
+    api.IS_WORKER_LAMBDA_AVAILABLE = api.LOCAL_WORKER
+
+    for mode in ("poll", "long-poll"):
+        reads["count"] = 0
+        start = time.perf_counter()
+        seen = asyncio.run(run(mode, args))
+        worker.get_local_queue().join()
+        seconds = time.perf_counter() - start
+        latency_ms = (np.array(seen) - start) * 1000
+        print(
+            f"{mode:<10} {args.queries} queries in {seconds:.2f}s, "
+            f"{reads['count']} table reads ({reads['count'] / args.queries:.1f}/query), "
+            f"answer seen at p50={np.percentile(latency_ms, 50):.0f}ms "
+            f"p95={np.percentile(latency_ms, 95):.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Coverage and latency of the menu facts fast path.
+
+Parses the shipped menus (no vector store or embeddings needed), builds the
+menu facts table and reports how many restaurants got a price and a menu
+type. Then it runs three generated question sets and prints the share each
+answers without the LLM, and the latency:
+
+  - filter:  "{menu type} menus under ${price} in {location}"
+  - yes/no:  "does {restaurant} have lunch"
+  - dishes:  "what dishes does {restaurant} serve" (should all fall back)
+  - menu:    "what is on the dinner menu at {restaurant}" and the like
+             (should all fall back)
+
+    python benchmarks/menu_facts_fast_path.py
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from ingest import MENU_CSV_PATH, get_metadata, iter_menu_documents, load_menu_records  # noqa: E402
+from menu_facts import MENU_TYPES, MenuFactsTable  # noqa: E402
+from metadata_index import RestaurantIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records = load_menu_records(args.csv_path)
+    texts, metadatas = [], []
+    for record, documents, _ in iter_menu_documents(records):
+        texts += [doc.page_content for doc in documents]
+        metadatas += [get_metadata(record)] * len(documents)
+
+    start = time.perf_counter()
+    table = MenuFactsTable.from_documents(texts, metadatas)
+    build_ms = (time.perf_counter() - start) * 1000
+    index = RestaurantIndex(metadatas)
+
+    facts = table.restaurants.values()
+    print(
+        f"{len(table.restaurants)} restaurants, {len(table)} menus, built in {build_ms:.0f}ms; "
+        f"with a price: {sum(bool(f['menus']) for f in facts)}, "
+        f"with a menu type: {sum(bool(f['menu_types']) for f in facts)}, "
+        f"with a course count: {sum(bool(f['courses']) for f in facts)}"
+    )
+
+    rng = random.Random(args.seed)
+    names = sorted(table.restaurants)
+    locations = sorted(set(table.locations))
+    question_sets = {
+        "filter": [
+            f"{rng.choice(MENU_TYPES)} menus under ${rng.choice((35, 50, 65))} "
+            f"in {rng.choice(locations)}"
+            for _ in range(args.questions)
+        ],
+        "yes/no": [f"does {rng.choice(names)} have lunch" for _ in range(args.questions)],
+        "dishes": [f"what dishes does {rng.choice(names)} serve" for _ in range(args.questions)],
+        "menu": [
+            rng.choice((
+                "what is on the {menu_type} menu at {name}",
+                "show me the {name} {menu_type} menu",
+                "is {name} open for {menu_type} on sunday",
+                "any {menu_type} at {name} with oysters",
+            )).format(menu_type=rng.choice(MENU_TYPES), name=rng.choice(names))
+            for _ in range(args.questions)
+        ],
+    }
+
+    for kind, questions in question_sets.items():
+        answered, latencies = 0, []
+        for question in questions:
+            start = time.perf_counter()
+            answered += table.answer(question, index) is not None
+            latencies.append(time.perf_counter() - start)
+        latencies_ms = np.array(latencies) * 1000
+        print(
+            f"{kind:<8} answered without the LLM: {answered / len(questions):.0%}  "
+            f"p50={np.percentile(latencies_ms, 50):.2f}ms p99={np.percentile(latencies_ms, 99):.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Memory and disk saved versus recall lost for the quantized NumPy vector index.
+
+Builds a throwaway collection from the shipped menus with LocalHashEmbeddings
+(`--dim` defaults to the 1536 dimensions of OpenAI's embeddings), then saves
+the index once per mode and runs the retrieval_eval.py questions through it:
+
+  - scan MB: the matrix each query scans (float32 vectors or codes)
+  - index MB: the vector index on disk
+  - db MB: all of ./db, Chroma included, which the image's `COPY db` ships
+  - overlap@k: share of the exact float32 top k the mode also returns
+  - recall@k: questions with a correct restaurant in the top k
+  - p50 latency of the vector search alone
+
+"chroma" modes save only the codes (VECTOR_INDEX_CODES_ONLY) and rescore
+with rows fetched from the Chroma collection by id.
+
+    python benchmarks/quantization.py --k 4 --rescore-factor 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from embedding import LocalHashEmbeddings  # noqa: E402
+from ingest import MENU_CSV_PATH, sync_vectorstore  # noqa: E402
+from retrieval_eval import make_questions  # noqa: E402
+from vector_index import NumpyVectorIndex, get_vector_index_path  # noqa: E402
+
+
+def get_size_mb(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    ) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--dish-questions", type=int, default=300)
+    args = parser.parse_args()
+
+    embeddings = LocalHashEmbeddings(size=args.dim)
+    with tempfile.TemporaryDirectory() as persist_directory:
+        vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+        sync_vectorstore(vectorstore, persist_directory, csv_path=args.csv_path)
+        path = get_vector_index_path(persist_directory)
+
+        exact = NumpyVectorIndex.load(path, embeddings, quantization="none")
+        questions = make_questions(exact, args.dish_questions)
+        vectors = [np.asarray(embeddings.embed_query(q), dtype=np.float32) for _, q, _ in questions]
+        truth = [{row for row, _ in exact.search(v, args.k)} for v in vectors]
+        # In memory, since every mode below overwrites the saved index.
+        source = NumpyVectorIndex(np.array(exact.vectors), exact.ids, exact.texts, exact.metadatas)
+
+        factor = args.rescore_factor
+        modes = [("float32", "none", 0, False)]
+        for quantization in ("int8", "binary"):
+            modes.append((f"{quantization} no rescore", quantization, 0, True))
+            modes.append((f"{quantization} rescore x{factor}", quantization, factor, False))
+            modes.append((f"{quantization} x{factor} chroma", quantization, factor, True))
+
+        print(f"{len(exact)} chunks x {args.dim} dims, {len(questions)} questions, k={args.k}")
+        print(
+            f"{'mode':<20} {'scan MB':>8} {'index MB':>9} {'db MB':>7} "
+            f"{'overlap@k':>10} {'recall@k':>9} {'p50 ms':>7}"
+        )
+        for label, quantization, rescore_factor, codes_only in modes:
+            source.save(path, quantization=quantization, codes_only=codes_only)
+            index = NumpyVectorIndex.load(
+                path,
+                embeddings,
+                quantization=quantization,
+                rescore_factor=rescore_factor,
+                open_vectorstore=lambda: vectorstore,
+            )
+            scanned = index.codes if index.quantizer is not None else index.vectors
+
+            overlap, recall, latencies = [], [], []
+            for vector, expected, (_, _, names) in zip(vectors, truth, questions):
+                start = time.perf_counter()
+                results = index.search(vector, args.k)
+                latencies.append(time.perf_counter() - start)
+                rows = {row for row, _ in results}
+                overlap.append(len(rows & expected) / len(expected))
+                recall.append(any(index.metadatas[row]["restaurant_name"] in names for row in rows))
+
+            print(
+                f"{label:<20} {scanned.nbytes / 1e6:>8.2f} {get_size_mb(path):>9.2f} "
+                f"{get_size_mb(persist_directory):>7.2f} {np.mean(overlap):>10.3f} "
+                f"{np.mean(recall):>9.3f} {np.percentile(latencies, 50) * 1000:>7.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
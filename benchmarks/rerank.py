@@ -0,0 +1,70 @@
+"""
+Compare the hybrid retriever with and without the rerank stage.
+
+Uses the same throwaway collection and generated questions as
+hybrid_retrieval.py. The reranked pipeline over-fetches `--fetch-k`
+candidates and keeps the top `--k` by the chosen scorer.
+
+    python benchmarks/rerank.py --k 4 --fetch-k 20 --scorer lexical
+"""
+import os
+import sys
+import argparse
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from embedding import LocalHashEmbeddings  # noqa: E402
+from hybrid_retrieval import evaluate, make_questions  # noqa: E402
+from ingest import MENU_CSV_PATH, sync_vectorstore  # noqa: E402
+from lexical import BM25Index, HybridRetriever  # noqa: E402
+from metadata_index import RestaurantIndex  # noqa: E402
+from rerank import RerankingRetriever, get_scorer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--scorer", default="lexical")
+    parser.add_argument("--dish-questions", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        vectorstore = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=LocalHashEmbeddings(),
+        )
+        sync_vectorstore(vectorstore, persist_directory, csv_path=args.csv_path)
+
+        lexical_index = BM25Index.from_vectorstore(vectorstore)
+        index = RestaurantIndex.from_vectorstore(vectorstore)
+        questions = make_questions(lexical_index, args.dish_questions)
+        print(f"{len(lexical_index)} chunks, {len(questions)} questions, k={args.k}")
+
+        def hybrid(k):
+            return HybridRetriever(
+                vectorstore=vectorstore,
+                lexical_index=lexical_index,
+                index=index,
+                k=k,
+                fetch_k=max(k, args.fetch_k),
+            )
+
+        reranked = RerankingRetriever(
+            base_retriever=hybrid(args.fetch_k),
+            scorer=get_scorer(args.scorer),
+            top_n=args.k,
+        )
+
+        evaluate("hybrid+filter", hybrid(args.k).invoke, questions)
+        evaluate(f"+rerank ({args.scorer})", reranked.invoke, questions)
+
+
+if __name__ == "__main__":
+    main()
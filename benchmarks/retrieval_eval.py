@@ -0,0 +1,269 @@
+"""
+Offline retrieval benchmark over the shipped menu corpus.
+
+Builds a fresh index from menu_urls/*.pdf and restaurant_menu_pdf.csv with
+the deterministic LocalHashEmbeddings (no OpenAI access), runs a generated
+question set through each retriever and writes a JSON report with:
+  - ingest: menus, chunks, seconds, chunks/s, index size on disk and the
+    NumPy vector index load time
+  - per retriever: recall@k and precision@k per question kind, and
+    p50/p95/p99 latency
+  - memory: peak RSS of the process
+
+Question kinds, each with the set of restaurants that count as correct:
+  - menu:     "dinner menu at {restaurant}"
+  - facet:    "{cuisine} in {location}" (any restaurant with both)
+  - dish:     "which restaurant serves {a line from a menu chunk}"
+
+    python benchmarks/retrieval_eval.py --output bench.json
+    python benchmarks/retrieval_eval.py --compare bench.json
+
+Run it from the repository root. `--compare` prints the change against an
+earlier report so regressions show up between commits.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+
+from langchain_community.vectorstores import Chroma  # noqa: E402
+
+from embedding import LocalHashEmbeddings  # noqa: E402
+from ingest import MENU_CSV_PATH, load_menu_records, sync_vectorstore  # noqa: E402
+from lexical import BM25Index, HybridRetriever  # noqa: E402
+from metadata_index import MetadataFilteredRetriever, RestaurantIndex  # noqa: E402
+from rerank import LexicalScorer, RerankingRetriever  # noqa: E402
+from vector_index import load_vector_index  # noqa: E402
+
+REPORT_VERSION = 1
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def get_directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def make_questions(lexical_index, n_dish, seed=0):
+    """Return [(kind, question, {correct restaurant names})]."""
+    rng = random.Random(seed)
+    restaurants = {}
+    for meta in lexical_index.metadatas:
+        restaurants[meta["restaurant_name"]] = (meta["cuisine"], meta["location"])
+
+    questions = [
+        ("menu", f"dinner menu at {name}", {name}) for name in sorted(restaurants)
+    ]
+
+    facets = {}
+    for name, facet in restaurants.items():
+        facets.setdefault(facet, set()).add(name)
+    for (cuisine, location), names in sorted(facets.items()):
+        questions.append(("facet", f"{cuisine} in {location}", names))
+
+    dish_lines = []
+    for text, meta in zip(lexical_index.texts, lexical_index.metadatas):
+        for line in text.split("\n"):
+            line = line.strip()
+            if 3 <= len(re.findall(r"[A-Za-z]+", line)) <= 8 and "{" not in line:
+                dish_lines.append((line, meta["restaurant_name"]))
+    # Chunks arrive in parse-pool completion order; sort so the sample is stable.
+    dish_lines.sort()
+    for line, name in rng.sample(dish_lines, min(n_dish, len(dish_lines))):
+        questions.append(("dish", f"which restaurant serves {line}", {name}))
+
+    return questions
+
+
+def evaluate(retrieve, questions):
+    by_kind = {}
+    latencies = []
+    for kind, question, names in questions:
+        start = time.perf_counter()
+        documents = retrieve(question)
+        latencies.append(time.perf_counter() - start)
+        relevant = [doc.metadata.get("restaurant_name") in names for doc in documents]
+        stats = by_kind.setdefault(kind, {"recall": [], "precision": []})
+        stats["recall"].append(any(relevant))
+        stats["precision"].append(float(np.mean(relevant)) if relevant else 0.0)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "quality": {
+            kind: {
+                "questions": len(stats["recall"]),
+                "recall": round(float(np.mean(stats["recall"])), 4),
+                "precision": round(float(np.mean(stats["precision"])), 4),
+            }
+            for kind, stats in sorted(by_kind.items())
+        },
+        "latency_ms": {
+            f"p{p}": round(float(np.percentile(latencies_ms, p)), 3) for p in (50, 95, 99)
+        },
+    }
+
+
+def build_retrievers(vectorstore, lexical_index, index, k, fetch_k, vector_index=None):
+    def hybrid(hybrid_k, restaurant_index, store=vectorstore):
+        return HybridRetriever(
+            vectorstore=store,
+            lexical_index=lexical_index,
+            index=restaurant_index,
+            k=hybrid_k,
+            fetch_k=max(hybrid_k, fetch_k),
+        )
+
+    retrievers = {
+        "dense": vectorstore.as_retriever(search_kwargs={"k": k}),
+        "dense+filter": MetadataFilteredRetriever(vectorstore=vectorstore, index=index, k=k),
+        "hybrid": hybrid(k, None),
+        "hybrid+filter": hybrid(k, index),
+        "hybrid+filter+rerank": RerankingRetriever(
+            base_retriever=hybrid(fetch_k, index), scorer=LexicalScorer(), top_n=k
+        ),
+    }
+    if vector_index is not None:
+        retrievers["numpy+filter"] = MetadataFilteredRetriever(
+            vectorstore=vector_index, index=index, k=k
+        )
+        retrievers["numpy hybrid+filter"] = hybrid(k, index, vector_index)
+    return retrievers
+
+
+def run(args):
+    report = {
+        "version": REPORT_VERSION,
+        "commit": get_git_commit(),
+        "created": int(time.time()),
+        "python": platform.python_version(),
+        "config": {"k": args.k, "fetch_k": args.fetch_k, "seed": args.seed},
+    }
+
+    with tempfile.TemporaryDirectory() as persist_directory:
+        records = load_menu_records(args.csv_path)
+        vectorstore = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=LocalHashEmbeddings(),
+        )
+        start = time.perf_counter()
+        sync_vectorstore(vectorstore, persist_directory, csv_path=args.csv_path)
+        ingest_seconds = time.perf_counter() - start
+
+        lexical_index = BM25Index.from_vectorstore(vectorstore)
+        index = RestaurantIndex.from_vectorstore(vectorstore)
+        start = time.perf_counter()
+        vector_index = load_vector_index(persist_directory, vectorstore.embeddings)
+        vector_index_load_seconds = time.perf_counter() - start
+        report["ingest"] = {
+            "menus": len(records),
+            "chunks": len(lexical_index),
+            "seconds": round(ingest_seconds, 3),
+            "chunks_per_second": round(len(lexical_index) / ingest_seconds, 1),
+            "index_bytes": get_directory_size(persist_directory),
+            "vector_index_load_ms": round(vector_index_load_seconds * 1000, 2),
+        }
+
+        questions = make_questions(lexical_index, args.dish_questions, seed=args.seed)
+        report["questions"] = len(questions)
+        report["retrievers"] = {}
+        retrievers = build_retrievers(
+            vectorstore, lexical_index, index, args.k, args.fetch_k, vector_index
+        )
+        for name, retriever in retrievers.items():
+            if args.retrievers and name not in args.retrievers:
+                continue
+            # One untimed query so lazy setup is not counted as latency.
+            retriever.invoke(questions[0][1])
+            report["retrievers"][name] = evaluate(retriever.invoke, questions)
+
+    report["memory"] = {"peak_rss_mb": round(get_peak_rss_mb(), 1)}
+    return report
+
+
+def print_report(report, baseline=None):
+    def delta(value, old):
+        if old is None:
+            return ""
+        return f" ({value - old:+.3f})"
+
+    ingest = report["ingest"]
+    print(
+        f"ingest: {ingest['menus']} menus, {ingest['chunks']} chunks in "
+        f"{ingest['seconds']}s ({ingest['chunks_per_second']} chunks/s), "
+        f"index {ingest['index_bytes'] / 1e6:.1f}MB, "
+        f"vector index load {ingest['vector_index_load_ms']}ms, "
+        f"peak RSS {report['memory']['peak_rss_mb']}MB"
+    )
+    for name, result in report["retrievers"].items():
+        old = (baseline or {}).get("retrievers", {}).get(name, {})
+        quality = "  ".join(
+            f"{kind}: R={stats['recall']:.3f}"
+            f"{delta(stats['recall'], old.get('quality', {}).get(kind, {}).get('recall'))}"
+            f" P={stats['precision']:.3f}"
+            for kind, stats in result["quality"].items()
+        )
+        latency = " ".join(
+            f"{p}={ms:.2f}ms{delta(ms, old.get('latency_ms', {}).get(p))}"
+            for p, ms in result["latency_ms"].items()
+        )
+        print(f"{name:<22} {quality}  {latency}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--csv-path", default=MENU_CSV_PATH)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--dish-questions", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--retrievers", nargs="*", default=None)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="an earlier JSON report to diff against")
+    args = parser.parse_args()
+
+    report = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
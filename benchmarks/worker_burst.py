@@ -0,0 +1,89 @@
+"""
+Burst-test the worker path (POST /submit_query -> worker) without AWS.
+
+Runs the API with IS_WORKER_LAMBDA_AVAILABLE=local, so submitted queries go
+to the in-process LocalWorkerQueue, fires `--requests` queries drawn from
+`--distinct` different questions, and reports how long the worker takes to
+drain the burst and how many LLM calls it made. `--batch-size 1` behaves
+like the old one-invoke-per-query worker.
+
+    python benchmarks/worker_burst.py --requests 200 --distinct 20
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "app"))
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+
+import api  # noqa: E402
+import myrag  # noqa: E402
+import worker  # noqa: E402
+from fakes import (  # noqa: E402
+    SlowFakeChatModel,
+    StaticRetriever,
+    make_documents,
+    patch_persistence,
+)
+
+
+async def submit_burst(n_requests, n_distinct):
+    async with httpx.AsyncClient(app=api.app, base_url="http://bench") as client:
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    "/submit_query",
+                    json={"query_text": f"bobo dinner menu {i % n_distinct}"},
+                )
+                for i in range(n_requests)
+            )
+        )
+    for response in responses:
+        response.raise_for_status()
+    return [response.json()["query_id"] for response in responses]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--distinct", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=worker.WORKER_MAX_BATCH_SIZE)
+    parser.add_argument("--max-concurrency", type=int, default=myrag.LLM_MAX_CONCURRENCY)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--db-latency", type=float, default=0.01)
+    args = parser.parse_args()
+
+    store = patch_persistence(args.db_latency)
+    llm = SlowFakeChatModel(latency=args.llm_latency)
+    service = myrag.RagService(
+        retriever=StaticRetriever(documents=make_documents(), latency=0.02), llm=llm
+    )
+    # Measure batching and de-duplication alone, not the answer cache.
+    service.answer_cache = None
+    myrag._rag_service = service
+
+    api.IS_WORKER_LAMBDA_AVAILABLE = api.LOCAL_WORKER
+    worker._local_queue = worker.LocalWorkerQueue(max_batch_size=args.batch_size)
+
+    start = time.perf_counter()
+    query_ids = asyncio.run(submit_burst(args.requests, args.distinct))
+    submitted = time.perf_counter() - start
+    worker._local_queue.join()
+    drained = time.perf_counter() - start
+
+    complete = sum(store[query_id]["is_complete"] for query_id in query_ids)
+    print(
+        f"batch_size={args.batch_size} requests={args.requests} "
+        f"distinct={args.distinct}: submitted in {submitted:.2f}s, "
+        f"drained in {drained:.2f}s, {complete} complete, "
+        f"{len(worker._local_queue.batches)} batches, {llm.calls} LLM calls"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app modules import each other flat, as they do inside the Lambda image.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
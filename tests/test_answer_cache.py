@@ -0,0 +1,45 @@
+from langchain_core.embeddings import Embeddings
+
+from answer_cache import AnswerCache
+from metadata_index import RestaurantIndex
+
+
+class OneTopicEmbeddings(Embeddings):
+    """Every question embeds the same: the worst case for the semantic tier."""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+def make_cache():
+    index = RestaurantIndex(
+        [
+            {"restaurant_name": "Bobo", "cuisine": "French", "location": "West Village"},
+            {"restaurant_name": "Atoboy", "cuisine": "Korean", "location": "Nomad"},
+        ]
+    )
+    cache = AnswerCache(embeddings=OneTopicEmbeddings(), restaurant_index=index)
+    cache.put("What is the Bobo lunch price?", {"answer": "Lunch $30.00", "context": []})
+    return cache
+
+
+def test_semantic_hit_needs_the_same_menu_type():
+    cache = make_cache()
+    assert cache.get("What is the Bobo dinner price?") is None
+    assert cache.get("How much is lunch at Bobo?")["answer"] == "Lunch $30.00"
+    assert cache.metrics()["semantic_hits"] == 1
+
+
+def test_semantic_hit_needs_the_same_restaurant():
+    cache = make_cache()
+    assert cache.get("What is the Atoboy lunch price?") is None
+    assert cache.get("What is the lunch price?") is None
+
+
+def test_exact_hits_ignore_the_scope():
+    cache = make_cache()
+    assert cache.get("what is the bobo lunch price")["answer"] == "Lunch $30.00"
+    assert cache.metrics()["exact_hits"] == 1
@@ -0,0 +1,168 @@
+import re
+import json
+from typing import List
+
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+import api
+import myrag
+from coalesce import SubmissionLinker
+from models import QueryResult
+from storage import MemoryBackend, get_storage_backend, set_storage_backend
+
+
+class FakeLambdaClient:
+    """Records worker invocations; raises for the first `failures` of them."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.payloads = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Could not connect to the endpoint URL")
+        self.payloads.append(Payload)
+        return {"StatusCode": 202}
+
+
+class EchoChatModel(BaseChatModel):
+    """Answers with the question it was asked, so answers can be matched to questions."""
+
+    @property
+    def _llm_type(self):
+        return "echo"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        question = re.search(r"Question: (.*)", messages[-1].content).group(1)
+        message = AIMessage(content=f"Re: {question}")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class OneDocumentRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        return [Document(page_content="Dinner $45", metadata={"restaurant_name": "Bobo"})]
+
+
+@pytest.fixture
+def local_service(monkeypatch):
+    set_storage_backend(MemoryBackend())
+    monkeypatch.setattr(api, "IS_WORKER_LAMBDA_AVAILABLE", None)
+    service = myrag.RagService(retriever=OneDocumentRetriever(), llm=EchoChatModel())
+    service.answer_cache = None
+    monkeypatch.setattr(myrag, "_rag_service", service)
+    yield service
+    set_storage_backend(None)
+
+
+@pytest.fixture
+def lambda_client(monkeypatch):
+    client = FakeLambdaClient()
+    set_storage_backend(MemoryBackend())
+    monkeypatch.setattr(api, "IS_WORKER_LAMBDA_AVAILABLE", "rag-worker")
+    monkeypatch.setattr(api, "_submission_linker", None)
+    monkeypatch.setattr(api, "get_client", lambda name: client)
+    yield client
+    set_storage_backend(None)
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app, raise_server_exceptions=False)
+
+
+def submit(client, question, **params):
+    response = client.post("/submit_query", json={"query_text": question}, params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_linked_submissions_get_their_own_debug_trace(client, lambda_client):
+    leader = submit(client, "Dinner price at Bobo?", debug="true")
+    plain = submit(client, "dinner price at bobo")
+    traced = submit(client, "Dinner price at Bobo", debug="true")
+
+    assert leader["query_id"] == plain["query_id"] == traced["query_id"]
+    assert len(lambda_client.payloads) == 1
+    assert "invoke_worker" in leader["debug"]["stages_ms"]
+    assert plain["debug"] is None
+    # The follower's trace, not the leader's: it never invoked the worker.
+    assert traced["debug"] is not None
+    assert "invoke_worker" not in traced["debug"]["stages_ms"]
+
+
+def test_failed_worker_invoke_does_not_link_repeats(client, lambda_client):
+    lambda_client.failures = 1
+    response = client.post("/submit_query", json={"query_text": "Dinner price at Bobo?"})
+    assert response.status_code == 500
+
+    retry = submit(client, "Dinner price at Bobo?")
+    assert len(lambda_client.payloads) == 1
+    assert submit(client, "Dinner price at Bobo?")["query_id"] == retry["query_id"]
+
+
+def test_linker_hands_out_copies():
+    linker = SubmissionLinker()
+    leader = QueryResult(query_text="Dinner price at Bobo?")
+    assert linker.link(leader) is leader
+    leader.debug = {"stages_ms": {}}
+    leader.sources = ["Dinner $45"]
+
+    follower = linker.link(QueryResult(query_text="dinner price at bobo"))
+    assert follower.query_id == leader.query_id
+    assert follower.debug is None and follower.sources == []
+    follower.sources.append("Lunch $30")
+    assert linker.link(QueryResult(query_text="Dinner price at Bobo")).sources == []
+
+
+def submit_batch(client, questions):
+    return client.post("/submit_queries", json=[{"query_text": q} for q in questions])
+
+
+def test_submit_queries_rejects_oversized_batches(client, lambda_client, monkeypatch):
+    monkeypatch.setattr(api, "SUBMIT_QUERIES_MAX_BATCH", 3)
+    response = submit_batch(client, [f"Dinner at Bobo, take {i}?" for i in range(4)])
+    assert response.status_code == 413
+    assert lambda_client.payloads == []
+    assert get_storage_backend().items == {}
+    assert submit_batch(client, ["Dinner at Bobo?"] * 3).status_code == 200
+
+
+def test_submit_queries_answers_in_input_order(client, local_service):
+    questions = [f"Dinner at restaurant {i}?" for i in range(8)] + ["dinner at restaurant 3"]
+    response = submit_batch(client, questions)
+    assert response.status_code == 200
+    results = response.json()
+
+    assert [result["query_text"] for result in results] == questions
+    answers = [result["answer_text"] for result in results[:8]]
+    assert answers == [f"Re: {question}" for question in questions[:8]]
+    # The repeat shares the first one's answer but keeps its own query_id.
+    assert results[8]["answer_text"] == results[3]["answer_text"]
+    assert len({result["query_id"] for result in results}) == len(questions)
+    for result in results:
+        stored = QueryResult.get_item_from_table(result["query_id"])
+        assert stored.is_complete and stored.answer_text == result["answer_text"]
+
+
+def test_submit_queries_links_repeats_in_worker_mode(client, lambda_client):
+    questions = ["Dinner at Bobo?", "Lunch at Atoboy?", "dinner at bobo", "Brunch at Kingsley?"]
+    results = submit_batch(client, questions).json()
+
+    ids = [result["query_id"] for result in results]
+    assert ids[0] == ids[2]
+    assert len(set(ids)) == 3
+    # One worker invocation for the three distinct questions, in input order.
+    assert len(lambda_client.payloads) == 1
+    queued = json.loads(lambda_client.payloads[0])["queries"]
+    assert [query["query_id"] for query in queued] == [ids[0], ids[1], ids[3]]
+
+    # A later single submission links to the batch's query too.
+    assert submit(client, "DINNER AT BOBO")["query_id"] == ids[0]
+    assert len(lambda_client.payloads) == 1
@@ -0,0 +1,122 @@
+import os
+from email.utils import formatdate
+
+import pandas as pd
+import pytest
+import requests
+
+import downloader
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=b"%PDF-1.4 menu", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class FakeSession:
+    """Serves queued responses per URL; the last one repeats."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        self.requests.append(url)
+        queue = self.responses[url]
+        return queue.pop(0) if len(queue) > 1 else queue[0]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(downloader.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"Retry-After": "7"}, 7.0),
+        ({"Retry-After": "600"}, 60.0),
+        ({}, None),
+        ({"Retry-After": "soon"}, None),
+    ],
+)
+def test_get_retry_after(headers, expected):
+    response = FakeResponse(429, headers=headers)
+    assert downloader.get_retry_after(response, max_seconds=60) == expected
+
+
+def test_get_retry_after_reads_http_dates():
+    date = formatdate(downloader.time.time() + 30, usegmt=True)
+    assert 25 <= downloader.get_retry_after(FakeResponse(503, headers={"Retry-After": date})) <= 30
+
+
+def test_retries_wait_for_retry_after(tmp_path, sleeps):
+    url = "https://menus.example/bobo.pdf"
+    session = FakeSession(
+        {
+            url: [
+                FakeResponse(429, headers={"Retry-After": "5"}),
+                FakeResponse(503),
+                FakeResponse(200),
+            ]
+        }
+    )
+    path = str(tmp_path / "bobo.pdf")
+    entry, downloaded = downloader.download_pdf(session, url, path, backoff_seconds=1.0)
+
+    assert downloaded and entry["size"] == len(b"%PDF-1.4 menu")
+    # Retry-After when the server sends one, exponential backoff otherwise.
+    assert sleeps == [5.0, 2.0]
+    assert not os.path.exists(path + ".part")
+
+
+def test_a_failed_write_fails_only_that_menu(tmp_path, sleeps, monkeypatch):
+    folder = tmp_path / "menus"
+    urls = {
+        name: f"https://menus.example/{name.lower()}.pdf" for name in ("Bobo", "Atoboy", "Kingsley")
+    }
+    csv_path = tmp_path / "urls.csv"
+    pd.DataFrame({"headline": list(urls), "menu_url": list(urls.values())}).to_csv(
+        csv_path, index=False
+    )
+    session = FakeSession({url: [FakeResponse(200)] for url in urls.values()})
+    monkeypatch.setattr(downloader, "build_session", lambda pool_size: session)
+
+    real_open = open
+
+    def failing_open(path, mode="r", *args, **kwargs):
+        if "atoboy" in str(path) and "w" in mode:
+            raise OSError(28, "No space left on device")
+        return real_open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", failing_open)
+    output_csv = str(tmp_path / "menus.csv")
+    df = downloader.download_pdfs_from_csv(str(csv_path), str(folder), output_csv=output_csv)
+
+    paths = dict(zip(df["headline"], df["file_path"]))
+    assert pd.isna(paths["Atoboy"])
+    assert os.path.exists(paths["Bobo"]) and os.path.exists(paths["Kingsley"])
+    assert os.path.exists(output_csv)
+    assert not os.path.exists(folder / "atoboy.pdf.part")
+    # A disk error is not retried.
+    assert session.requests.count(urls["Atoboy"]) == 1
@@ -0,0 +1,135 @@
+import csv
+
+import pytest
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+import ingest
+from embedding import LocalHashEmbeddings
+
+MENUS = 5
+DISHES_PER_MENU = 60
+
+
+class TextFileLoader:
+    """Stands in for PyMuPDFLoader: the whole file is one page."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def load(self):
+        with open(self.file_path) as file:
+            return [Document(page_content=file.read())]
+
+
+class FlakyEmbeddings(LocalHashEmbeddings):
+    """Records every text it embeds; the `fail_on`-th call raises."""
+
+    def __init__(self, fail_on=None):
+        super().__init__(size=32)
+        self.fail_on = fail_on
+        self.calls = 0
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise RuntimeError("embedding service unavailable")
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def menus(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "PyMuPDFLoader", TextFileLoader)
+    rows = []
+    for i in range(MENUS):
+        path = tmp_path / f"menu-{i}.txt"
+        path.write_text(
+            "Dinner Prix Fixe $45\n"
+            + "\n".join(f"Restaurant {i} dish {j} with seasonal garnish" for j in range(DISHES_PER_MENU))
+        )
+        rows.append(
+            {
+                "cuisine": "French",
+                "location": "West Village",
+                "headline": f"Restaurant {i}",
+                "menu_url": "",
+                "file_path": str(path),
+            }
+        )
+    csv_path = tmp_path / "menus.csv"
+    with open(csv_path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    expected = {}
+    for record in ingest.load_menu_records(str(csv_path)):
+        for doc in ingest.load_menu_documents(record):
+            expected[doc.metadata["chunk_id"]] = doc.page_content
+    return str(csv_path), expected
+
+
+def sync(persist_directory, csv_path, embeddings):
+    vectorstore = Chroma(persist_directory=persist_directory, embedding_function=embeddings)
+    stats = ingest.sync_vectorstore(
+        vectorstore, persist_directory, csv_path=csv_path, max_workers=1, batch_size=4
+    )
+    return vectorstore, stats
+
+
+def test_interrupted_ingest_resumes_with_only_the_missing_chunks(tmp_path, menus):
+    csv_path, expected = menus
+    persist_directory = str(tmp_path / "db")
+    assert len(expected) > 3 * 4  # more chunks than the batches committed before the failure
+
+    with pytest.raises(RuntimeError):
+        sync(persist_directory, csv_path, FlakyEmbeddings(fail_on=4))
+    vectorstore = Chroma(persist_directory=persist_directory, embedding_function=LocalHashEmbeddings(size=32))
+    committed = set(vectorstore.get(include=[])["ids"])
+    assert len(committed) == 3 * 4
+    checkpointed = ingest.load_manifest(persist_directory)["menus"]
+    assert len(checkpointed) < MENUS
+
+    embeddings = FlakyEmbeddings()
+    vectorstore, stats = sync(persist_directory, csv_path, embeddings)
+    assert set(vectorstore.get(include=[])["ids"]) == set(expected)
+    # Only chunks the failed run never committed are embedded again.
+    missing = {expected[chunk_id] for chunk_id in set(expected) - committed}
+    assert sorted(embeddings.texts) == sorted(missing)
+    assert stats["added"] == len(missing)
+    assert stats["changed"] == MENUS - len(checkpointed)
+
+    embeddings = FlakyEmbeddings()
+    vectorstore, stats = sync(persist_directory, csv_path, embeddings)
+    assert stats["added"] == stats["deleted"] == stats["changed"] == 0
+    assert embeddings.texts == []
+    assert set(vectorstore.get(include=[])["ids"]) == set(expected)
+
+
+def test_index_builds_page_through_the_collection(tmp_path, menus, monkeypatch):
+    import metadata_index
+    from lexical import load_lexical_index
+    from menu_facts import load_menu_facts
+    from vector_index import load_vector_index
+
+    csv_path, expected = menus
+    persist_directory = str(tmp_path / "db")
+    monkeypatch.setattr(metadata_index.iter_collection, "__defaults__", (5,))
+    limits = []
+    get = Chroma.get
+
+    def paged_get(self, *args, include=None, limit=None, **kwargs):
+        if include and "documents" in include:
+            limits.append(limit)
+        return get(self, *args, include=include, limit=limit, **kwargs)
+
+    monkeypatch.setattr(Chroma, "get", paged_get)
+    sync(persist_directory, csv_path, FlakyEmbeddings())
+
+    # BM25, vector index and menu facts each read the collection 5 chunks at a time.
+    assert limits and set(limits) == {5}
+    assert set(load_lexical_index(persist_directory).ids) == set(expected)
+    assert set(load_vector_index(persist_directory).ids) == set(expected)
+    assert len(load_menu_facts(persist_directory).restaurants) == MENUS
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from lexical import (
+    BM25Index,
+    build_field_codes,
+    build_lexical_index,
+    get_filter_mask,
+    load_lexical_index,
+    matches_filter,
+    reciprocal_rank_fusion,
+)
+
+TEXTS = [
+    "Dinner: oysters, oysters on the half shell, steak frites",
+    "Lunch: oysters and a green salad",
+    "Dinner: steak frites and chocolate tart",
+]
+METADATAS = [
+    {"restaurant_name": "Bobo", "cuisine": "French", "location": "West Village"},
+    {"restaurant_name": "Atoboy", "cuisine": "Korean", "location": "Nomad"},
+    {"restaurant_name": "Kingsley", "cuisine": "French", "location": "East Village"},
+]
+IDS = ["bobo-0", "atoboy-0", "kingsley-0"]
+
+
+@pytest.fixture
+def index():
+    return BM25Index(TEXTS, METADATAS, IDS)
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity(index):
+    ranked = [doc for doc, _ in index.search("oysters")]
+    assert ranked == [0, 1]
+    # "chocolate" is in one chunk only, so it outweighs the common "dinner".
+    assert [doc for doc, _ in index.search("dinner chocolate")] == [2, 0]
+    assert index.search("ramen") == []
+
+
+def test_bm25_search_respects_the_filter(index):
+    assert [doc for doc, _ in index.search("oysters", where={"cuisine": "Korean"})] == [1]
+    documents = index.get_documents("steak", where={"location": {"$in": ["East Village"]}})
+    assert [doc.metadata["chunk_id"] for doc in documents] == ["kingsley-0"]
+
+
+@pytest.mark.parametrize(
+    "where",
+    [
+        {"cuisine": "French"},
+        {"restaurant_name": {"$in": ["Bobo", "Atoboy"]}},
+        {"location": {"$in": ["Nomad", "Nowhere"]}},
+        {"cuisine": {"$in": ["Thai"]}},
+        {"$and": [{"cuisine": "French"}, {"location": {"$in": ["East Village", "Nomad"]}}]},
+        {"$and": [{"cuisine": {"$in": ["French", "Korean"]}}, {"restaurant_name": "Atoboy"}]},
+        {"$or": [{"cuisine": "Korean"}, {"restaurant_name": "Kingsley"}]},
+        {"cuisine": {"$eq": "French"}},
+    ],
+)
+def test_filter_masks_agree_with_matches_filter(where):
+    field_codes, field_vocab = build_field_codes(METADATAS)
+    mask = get_filter_mask(field_codes, field_vocab, METADATAS, where)
+    expected = [matches_filter(meta, where) for meta in METADATAS]
+    assert mask.dtype == bool
+    assert mask.tolist() == expected
+
+
+def test_no_filter_has_no_mask():
+    field_codes, field_vocab = build_field_codes(METADATAS)
+    assert get_filter_mask(field_codes, field_vocab, METADATAS, None) is None
+
+
+def document(chunk_id):
+    return Document(page_content=f"text of {chunk_id}", metadata={"chunk_id": chunk_id})
+
+
+def test_rrf_merges_duplicate_chunk_ids():
+    dense = [document("a"), document("b"), document("c")]
+    lexical = [document("b"), document("d"), document("a")]
+    fused = reciprocal_rank_fusion([dense, lexical], k=10, rrf_k=60)
+
+    assert [doc.metadata["chunk_id"] for doc in fused] == ["b", "a", "d", "c"]
+    assert fused[0].metadata["score"] == round(1 / 62 + 1 / 61, 6)
+    assert reciprocal_rank_fusion([dense, lexical], k=2, rrf_k=60)[-1].metadata["chunk_id"] == "a"
+
+
+def test_save_and_load_round_trip(tmp_path, index):
+    path = str(tmp_path / "bm25_index.pkl")
+    index.save(path)
+    loaded = BM25Index.load(path)
+
+    assert loaded.ids == index.ids
+    assert loaded.metadatas == index.metadatas
+    assert set(loaded.postings) == set(index.postings)
+    for term, (doc_ids, weights) in index.postings.items():
+        assert np.array_equal(loaded.postings[term][0], doc_ids)
+        assert np.array_equal(loaded.postings[term][1], weights)
+    assert loaded.search("steak frites", where={"cuisine": "French"}) == index.search(
+        "steak frites", where={"cuisine": "French"}
+    )
+
+
+def test_load_lexical_index_without_a_build(tmp_path):
+    assert load_lexical_index(str(tmp_path)) is None
+
+
+def test_build_lexical_index_pages_through_the_collection(tmp_path, index):
+    class Collection:
+        def get(self, include, limit, offset):
+            ids = IDS[offset : offset + limit]
+            return {
+                "ids": ids,
+                "documents": TEXTS[offset : offset + limit],
+                "metadatas": METADATAS[offset : offset + limit],
+            }
+
+    build_lexical_index(Collection(), str(tmp_path))
+    loaded = load_lexical_index(str(tmp_path))
+    assert loaded.ids == IDS
+    assert loaded.search("oysters") == index.search("oysters")
@@ -0,0 +1,125 @@
+import pytest
+
+from menu_facts import MenuFactsTable, extract_menu_facts
+from metadata_index import RestaurantIndex
+
+RESTAURANTS = [
+    {"restaurant_name": "Bobo", "cuisine": "French", "location": "West Village"},
+    {"restaurant_name": "Atoboy", "cuisine": "Korean", "location": "NoMad"},
+    {"restaurant_name": "Kingsley", "cuisine": "French", "location": "East Village"},
+    {"restaurant_name": "BLT Prime", "cuisine": "Steakhouse", "location": "Upper East Side"},
+]
+
+MENUS = {
+    "Bobo": ["DINNER PRIX FIXE $45\nAppetizers\nOysters\nEntrees\nSteak frites\nDesserts\nTart"],
+    "Atoboy": ["Lunch 30 per person\nBanchan\n", "Dinner $60\nThree-course dinner\n"],
+    "Kingsley": ["Brunch $45\nEggs\n"],
+    "BLT Prime": ["Dinner $60\nRibeye\n"],
+}
+
+
+@pytest.fixture
+def table():
+    texts, metadatas = [], []
+    for record in RESTAURANTS:
+        for text in MENUS[record["restaurant_name"]]:
+            texts.append(text)
+            metadatas.append(record)
+    return MenuFactsTable.from_documents(texts, metadatas)
+
+
+@pytest.fixture
+def index():
+    return RestaurantIndex(RESTAURANTS)
+
+
+def test_extract_menu_facts_reads_prices_types_and_courses():
+    facts = extract_menu_facts([
+        "Three-Course Dinner $60\nAppetizers\nBurrata\nEntrées\nBranzino\n",
+        "Lunch Prix Fixe\n30\nDesserts\nTiramisu\n",
+    ])
+    assert facts == {
+        "menus": [["lunch", 30], ["dinner", 60]],
+        "menu_types": ["lunch", "dinner"],
+        "courses": 3,
+        "sections": ["appetizer", "entree", "dessert"],
+    }
+
+
+def test_extract_menu_facts_skips_supplements_and_other_prices():
+    facts = extract_menu_facts([
+        "Dinner $45\nWagyu supplement $30\nWine pairing $60\nSteak $38\n"
+        "{'cuisine': 'French', 'restaurant_name': 'Bobo', 'location': 'West Village'}"
+    ])
+    assert facts["menus"] == [["dinner", 45]]
+
+
+def test_extract_menu_facts_gives_an_untyped_price_the_only_menu_type():
+    facts = extract_menu_facts(["Brunch\nEggs\nToast\nJuice\nCoffee\nPrix fixe $30\n"])
+    assert facts["menus"] == [["brunch", 30]]
+
+
+def test_extract_menu_facts_keeps_untyped_prices_when_types_are_ambiguous():
+    facts = extract_menu_facts(["Lunch and dinner\nSalad\nSoup\nFish\nBread\nPrix fixe $45\n"])
+    assert facts["menus"] == [[None, 45]]
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "What is on the dinner menu at Bobo?",
+        "What's on the dinner menu at Bobo?",
+        "Show me the Atoboy lunch menu",
+        "Any dinner at Bobo with oysters?",
+        "Is Bobo open for dinner on Sunday?",
+        "Is there a dinner menu at Bobo on Sunday?",
+        "Does Bobo serve oysters at dinner?",
+        "Does Bobo have dinner reservations?",
+        "What is good at Bobo?",
+        "How much is dinner at Bobo?",
+        "Which dinner at Bobo is best?",
+        "Does anyone have lunch?",
+        # Constraints the table cannot check.
+        "any steakhouse in midtown for $60",
+        "Which restaurants have a kids menu for $30?",
+        "which restaurants are open on Sunday for lunch under $45",
+        "French restaurants over $30 that are romantic",
+        "find me a quiet spot for dinner under $50",
+        "which places near Bobo have dinner under $60",
+    ],
+)
+def test_menu_questions_go_to_the_chain(table, index, question):
+    assert table.answer(question, index) is None
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Does Bobo have a dinner menu?", "Yes. **Bobo** | **West Village** | **French** — Dinner $45.00"),
+        ("Does Bobo serve dinner during Restaurant Week?", "Yes. **Bobo**"),
+        ("Is there a lunch menu at Atoboy?", "Yes. **Atoboy** | **NoMad** | **Korean** — Lunch $30.00"),
+        ("Does Bobo offer lunch?", "No, **Bobo** only lists a dinner menu for Restaurant Week."),
+    ],
+)
+def test_yes_no_menu_questions(table, index, question, expected):
+    assert table.answer(question, index)["answer"].startswith(expected)
+
+
+@pytest.mark.parametrize(
+    "question, restaurants",
+    [
+        ("Which French restaurants have dinner?", ["Bobo"]),
+        ("dinner menus under $50 in the West Village", ["Bobo"]),
+        ("What is the cheapest dinner?", ["Bobo"]),
+        ("What is the most expensive dinner?", ["BLT Prime", "Atoboy"]),
+        ("Which of Bobo and Atoboy have dinner?", ["Bobo", "Atoboy"]),
+        ("Which restaurants have brunch for $45?", ["Kingsley"]),
+        ("any steakhouse in the Upper East Side for $60", ["BLT Prime"]),
+        ("French restaurants over $30", ["Bobo", "Kingsley"]),
+    ],
+)
+def test_filter_questions_are_answered_from_the_table(table, index, question, restaurants):
+    result = table.answer(question, index)
+    assert result is not None
+    assert [doc.metadata["restaurant_name"] for doc in result["context"]] == restaurants
+    assert result["answer"].endswith("thanks for asking!")
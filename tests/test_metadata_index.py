@@ -0,0 +1,83 @@
+import pytest
+
+from metadata_index import RestaurantIndex
+
+RESTAURANTS = [
+    {"restaurant_name": "Bobo", "cuisine": "French", "location": "West Village"},
+    {"restaurant_name": "Kingsley", "cuisine": "French", "location": "East Village"},
+    {"restaurant_name": "BLT Prime", "cuisine": "Steakhouse", "location": "Upper East Side"},
+    {"restaurant_name": "The Palm - Midtown", "cuisine": "Steakhouse", "location": "Midtown East"},
+    {"restaurant_name": "Gallaghers", "cuisine": "Steakhouse", "location": "Midtown West"},
+    {"restaurant_name": "The Dutch", "cuisine": "American", "location": "Soho"},
+    {"restaurant_name": "Essex", "cuisine": "American", "location": "Lower East Side"},
+    {"restaurant_name": "Colonie", "cuisine": "American", "location": "Downtown Brooklyn"},
+    {"restaurant_name": "Faun", "cuisine": "Italian", "location": "Prospect Heights"},
+]
+
+
+@pytest.fixture
+def index():
+    return RestaurantIndex(RESTAURANTS)
+
+
+def sort_in(where):
+    """`where` with its $in lists sorted, so filters compare regardless of order."""
+    if isinstance(where, dict):
+        return {key: sort_in(value) for key, value in where.items()}
+    if isinstance(where, list) and all(isinstance(value, str) for value in where):
+        return sorted(where)
+    if isinstance(where, list):
+        return [sort_in(value) for value in where]
+    return where
+
+
+MIDTOWN = {"location": {"$in": ["Midtown East", "Midtown West"]}}
+DOWNTOWN = {"location": {"$in": ["East Village", "Lower East Side", "Soho", "West Village"]}}
+
+
+@pytest.mark.parametrize(
+    "question, where",
+    [
+        ("any steakhouse in midtown for $60", {"$and": [{"cuisine": "Steakhouse"}, MIDTOWN]}),
+        ("brunch in the village", {"location": {"$in": ["East Village", "West Village"]}}),
+        ("brunch in the West Village", {"location": "West Village"}),
+        ("dinner in downtown brooklyn", {"location": "Downtown Brooklyn"}),
+        ("dinner in brooklyn", {"location": {"$in": ["Downtown Brooklyn", "Prospect Heights"]}}),
+        ("american food downtown", {"$and": [{"cuisine": "American"}, DOWNTOWN]}),
+    ],
+)
+def test_umbrella_neighborhoods(index, question, where):
+    assert sort_in(index.get_filter(question)) == sort_in(where)
+
+
+@pytest.mark.parametrize(
+    "question, where",
+    [
+        ("salads with hearts of palm in midtown", MIDTOWN),
+        ("dutch baby for brunch in soho", {"location": "Soho"}),
+        ("Which Dutch restaurants have dinner in Soho?", {"location": "Soho"}),
+        ("american dinner near essex street", {"cuisine": "American"}),
+    ],
+)
+def test_common_words_in_names_do_not_pick_a_restaurant(index, question, where):
+    assert sort_in(index.get_filter(question)) == sort_in(where)
+
+
+@pytest.mark.parametrize(
+    "question, restaurant",
+    [
+        ("dinner at palm", "The Palm - Midtown"),
+        ("What is Palm's lunch price?", "The Palm - Midtown"),
+        ("lunch at the Dutch", "The Dutch"),
+        ("is the dutch open for brunch", "The Dutch"),
+        ("Is Essex open for brunch?", "Essex"),
+        ("bobo dinner menu", "Bobo"),
+    ],
+)
+def test_common_word_names_with_a_second_signal(index, question, restaurant):
+    assert index.get_filter(question) == {"restaurant_name": restaurant}
+
+
+def test_match_name_accepts_common_word_names(index):
+    assert index.match_name("Palm") == {"The Palm - Midtown"}
+    assert index.match_name("the Dutch") == {"The Dutch"}
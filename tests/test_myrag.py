@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, List
+
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+
+from answer_cache import AnswerCache
+from embedding import LocalHashEmbeddings, get_query_vector
+from myrag import RagService
+
+
+class CountingEmbeddings(LocalHashEmbeddings):
+    def __init__(self):
+        super().__init__(size=64)
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+class EmbeddingRetriever(BaseRetriever):
+    """Embeds the query like the real retrievers, then returns one document."""
+
+    embeddings: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        get_query_vector(self.embeddings, query)
+        return [Document(page_content="Dinner $45", metadata={"restaurant_name": "Bobo"})]
+
+
+def make_service():
+    embeddings = CountingEmbeddings()
+    service = RagService(
+        retriever=EmbeddingRetriever(embeddings=embeddings),
+        llm=FakeListChatModel(responses=["**Bobo** Dinner $45.00"]),
+    )
+    service.embeddings = embeddings
+    service.answer_cache = AnswerCache(embeddings=embeddings)
+    return service, embeddings
+
+
+def test_cache_miss_embeds_the_query_once():
+    service, embeddings = make_service()
+    service.query_rag("Dinner at Bobo?")
+    assert embeddings.texts == ["Dinner at Bobo?"]
+
+
+def test_async_cache_miss_embeds_the_query_once():
+    service, embeddings = make_service()
+    asyncio.run(service.aquery_rag("Dinner at Bobo?"))
+    assert embeddings.texts == ["Dinner at Bobo?"]
+
+
+def test_stream_cache_miss_embeds_the_query_once():
+    service, embeddings = make_service()
+    list(service.stream_rag("Dinner at Bobo?"))
+    assert embeddings.texts == ["Dinner at Bobo?"]
+
+
+def test_batch_embeds_each_distinct_query_once():
+    service, embeddings = make_service()
+    asyncio.run(service.abatch_query_rag(["Dinner at Bobo?"]))
+    assert embeddings.texts == ["Dinner at Bobo?"]
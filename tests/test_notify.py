@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+import notify
+from notify import MemoryNotifier, RedisNotifier
+
+fakeredis = pytest.importorskip("fakeredis")
+import fakeredis.aioredis  # noqa: E402
+
+
+@pytest.fixture
+def redis_notifier():
+    server = fakeredis.FakeServer()
+    return RedisNotifier(
+        client=fakeredis.FakeRedis(server=server),
+        async_client=fakeredis.aioredis.FakeRedis(server=server),
+    )
+
+
+async def wait_for_publish(notifier, query_id, item, timeout=2):
+    async with notifier.subscribe(query_id) as subscription:
+        # Publish from another thread, the way the worker does.
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(None, notifier.publish, query_id, item)
+        return await subscription.get(timeout)
+
+
+def test_memory_notifier_delivers_to_a_waiter():
+    notifier = MemoryNotifier()
+    item = {"query_id": "q1", "is_complete": True}
+    assert asyncio.run(wait_for_publish(notifier, "q1", item)) == item
+    assert notifier.metrics() == {"published": 1, "delivered": 1, "waiting": 0}
+
+
+def test_redis_notifier_delivers_across_clients(redis_notifier):
+    item = {"query_id": "q1", "is_complete": True, "answer_text": "Yes."}
+    assert asyncio.run(wait_for_publish(redis_notifier, "q1", item)) == item
+    assert redis_notifier.metrics() == {"published": 1}
+
+
+def test_redis_notifier_ignores_other_queries_and_times_out(redis_notifier):
+    async def wait():
+        async with redis_notifier.subscribe("q1") as subscription:
+            redis_notifier.publish("q2", {"query_id": "q2"})
+            return await subscription.get(0.2)
+
+    assert asyncio.run(wait()) is None
+
+
+def test_get_notifier_builds_the_redis_backend(monkeypatch):
+    # With redis-py older than 4.2 (no redis.asyncio) this fell back to memory.
+    monkeypatch.setattr(notify, "NOTIFY_BACKEND", "redis")
+    monkeypatch.setattr(notify, "_notifier", None)
+    assert isinstance(notify.get_notifier(), RedisNotifier)
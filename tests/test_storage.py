@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+import boto3
+import pytest
+
+import storage
+from models import QueryResult, SourceRef
+from storage import DynamoDBBackend, MemoryBackend, SQLiteBackend, to_dynamodb
+
+TABLE_NAME = "query-results"
+
+
+def make_item(i):
+    return QueryResult(
+        query_text=f"Dinner price at Bobo, take {i}?",
+        answer_text="Dinner $45.00",
+        source_refs=[
+            SourceRef(chunk_id=f"bobo-{i}", score=0.5, metadata={"restaurant_name": "Bobo"})
+        ],
+        is_complete=True,
+    ).get_items()
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    # The pooled session and resources must be created inside the mock.
+    monkeypatch.setattr(storage, "_session", None)
+    monkeypatch.setattr(storage, "_resources", {})
+    monkeypatch.setattr(storage, "_clients", {})
+    # Several BatchGetItem calls for the 30 items below.
+    monkeypatch.setattr(storage, "DYNAMODB_BATCH_GET_SIZE", 8)
+    with moto.mock_aws():
+        boto3.client("dynamodb").create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{"AttributeName": "query_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "query_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield DynamoDBBackend(TABLE_NAME)
+
+
+@pytest.fixture(params=["memory", "sqlite", "dynamodb"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "queries.sqlite"))
+        request.addfinalizer(backend.close)
+        return backend
+    return request.getfixturevalue("dynamodb")
+
+
+def as_read_back(item):
+    # DynamoDB hands numbers back as Decimals.
+    return to_dynamodb(item)
+
+
+def test_put_and_get_round_trip(backend):
+    item = make_item(0)
+    backend.put(item)
+    assert as_read_back(backend.get(item["query_id"])) == as_read_back(item)
+    assert QueryResult(**backend.get(item["query_id"])).source_refs[0].score == 0.5
+
+
+def test_get_missing_key(backend):
+    assert backend.get("missing") is None
+    assert backend.batch_get(["missing"]) == {}
+
+
+def test_batch_put_and_batch_get_round_trip(backend):
+    items = [make_item(i) for i in range(30)]
+    backend.batch_put(items)
+    ids = [item["query_id"] for item in items]
+    found = backend.batch_get(ids + ["missing", ids[0]])
+    assert set(found) == set(ids)
+    for item in items:
+        assert as_read_back(found[item["query_id"]]) == as_read_back(item)
+
+
+def test_put_replaces_an_item(backend):
+    item = make_item(0)
+    backend.put(item)
+    backend.batch_put([dict(item, answer_text="Dinner $60.00")])
+    assert backend.get(item["query_id"])["answer_text"] == "Dinner $60.00"
+
+
+def test_to_dynamodb_converts_floats_to_decimals():
+    converted = to_dynamodb({"score": 0.1, "refs": [{"score": 1.5}], "count": 3, "text": "a"})
+    assert converted == {
+        "score": Decimal("0.1"),
+        "refs": [{"score": Decimal("1.5")}],
+        "count": 3,
+        "text": "a",
+    }
+    assert isinstance(converted["refs"][0]["score"], Decimal)
+
+
+def test_dynamodb_stores_float_scores_as_numbers(dynamodb):
+    item = make_item(0)
+    dynamodb.put(item)
+    stored = dynamodb.get(item["query_id"])
+    assert stored["source_refs"][0]["score"] == Decimal("0.5")
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_index import NumpyVectorIndex, QUANTIZERS
+
+
+class FakeChroma:
+    def __init__(self, ids, vectors):
+        self.rows = dict(zip(ids, vectors.tolist()))
+        self.gets = 0
+
+    def get(self, ids=None, include=None):
+        self.gets += 1
+        return {"ids": list(ids), "embeddings": [self.rows[i] for i in ids]}
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(200, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = [f"chunk-{i}" for i in range(len(vectors))]
+    metadatas = [{"restaurant_name": f"R{i % 7}"} for i in range(len(vectors))]
+    source = NumpyVectorIndex(vectors, ids, [f"text {i}" for i in ids], metadatas)
+    return source, FakeChroma(ids, vectors), rng.normal(size=32).astype(np.float32)
+
+
+@pytest.mark.parametrize("quantization", sorted(QUANTIZERS))
+def test_codes_only_index_rescores_from_chroma(tmp_path, corpus, quantization):
+    source, chroma, query = corpus
+    path = str(tmp_path / "vector_index")
+    source.save(path, quantization="none")
+    source.save(path, quantization=quantization, codes_only=True)
+
+    # Only the chosen codes are left on disk.
+    assert sorted(os.listdir(path)) == sorted(
+        ["chunks.json", f"{quantization}.npy", f"{quantization}_params.npy"]
+    )
+
+    index = NumpyVectorIndex.load(
+        path, quantization="none", rescore_factor=200, open_vectorstore=lambda: chroma
+    )
+    assert index.quantizer.name == quantization
+    # Rescoring every row reproduces the exact ranking.
+    expected = [row for row, _ in source.search(query, 5)]
+    assert [row for row, _ in index.search(query, 5)] == expected
+    assert chroma.gets == 1
+
+
+def test_codes_only_index_without_rescore_never_opens_chroma(tmp_path, corpus):
+    source, _, query = corpus
+    path = str(tmp_path / "vector_index")
+    source.save(path, quantization="int8", codes_only=True)
+
+    def open_vectorstore():
+        raise AssertionError("Chroma opened without rescoring")
+
+    index = NumpyVectorIndex.load(
+        path, quantization="int8", rescore_factor=0, open_vectorstore=open_vectorstore
+    )
+    assert len(index.search(query, 5, where={"restaurant_name": "R3"})) == 5
+
+
+def test_codes_only_needs_a_quantization(tmp_path, corpus):
+    source, _, _ = corpus
+    with pytest.raises(ValueError):
+        source.save(str(tmp_path / "vector_index"), quantization="none", codes_only=True)
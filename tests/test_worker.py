@@ -0,0 +1,65 @@
+import asyncio
+from typing import Any, List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.retrievers import BaseRetriever
+
+import myrag
+import worker
+from models import QueryResult
+from storage import MemoryBackend, set_storage_backend
+
+
+class LoopBoundChatModel(BaseChatModel):
+    """Like ChatOpenAI's pooled async client: only usable on its first event loop."""
+
+    loop: Any = None
+
+    @property
+    def _llm_type(self):
+        return "loop-bound"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        if loop is not self.loop:
+            raise ConnectionError("Connection error.")
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="$45"))])
+
+
+class OneDocumentRetriever(BaseRetriever):
+    def _get_relevant_documents(self, query, *, run_manager) -> List[Document]:
+        return [Document(page_content="Dinner $45", metadata={"restaurant_name": "Bobo"})]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    set_storage_backend(MemoryBackend())
+    service = myrag.RagService(retriever=OneDocumentRetriever(), llm=LoopBoundChatModel())
+    service.answer_cache = None
+    monkeypatch.setattr(myrag, "_rag_service", service)
+    yield service
+    set_storage_backend(None)
+
+
+def test_handler_reuses_one_event_loop_across_invocations(service):
+    for i in range(3):
+        query = QueryResult(query_text=f"Dinner price at Bobo, take {i}?")
+        summary = worker.handler(query.get_items(), None)
+        assert summary["completed"] == 1
+        assert summary["failed"] == 0
+        assert QueryResult.get_item_from_table(query.query_id).is_complete
+
+
+def test_handler_skips_stored_completed_queries(service):
+    query = QueryResult(query_text="Dinner price at Bobo?")
+    assert worker.handler(query.get_items(), None)["completed"] == 1
+    assert worker.handler(query.get_items(), None)["skipped"] == 1